@@ -0,0 +1,287 @@
+"""
+Analysis result cache for PhytoSense application.
+Caches plant analysis results keyed by the decoded image pixels, the crop type,
+the normalized symptoms text and the analysis pipeline version.
+"""
+
+import os
+import json
+import copy
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from model_registry import MODELS_DIR
+
+# Cache locations and limits
+CACHE_DIR = os.path.join("cache", "analysis")
+MEMORY_CACHE_SIZE = 128       # Number of results kept in process memory
+DISK_CACHE_MAX_ENTRIES = 2000  # Number of results kept on disk
+
+# Source files whose contents define the analysis pipeline. Any edit to the
+# detection rules changes the pipeline version and invalidates old entries.
+PIPELINE_MODULES = [
+    "plant_analysis.py",
+    "image_processing.py",
+    "model_handler.py",
+    "symptom_index.py",
+    "symptom_matcher.py",
+    "model.py",
+    "model_registry.py",
+    "crop_data.py",
+    "crop_database.py",
+    "maharashtra.py"
+]
+
+def compute_pipeline_version(base_dir=None):
+    """
+    Compute a version string from the source of the analysis pipeline modules
+
+    Args:
+        base_dir: Directory containing the modules (defaults to this file's directory)
+
+    Returns:
+        string: Short hex digest identifying the current pipeline rules
+    """
+    if base_dir is None:
+        base_dir = os.path.dirname(os.path.abspath(__file__))
+
+    digest = hashlib.sha256()
+    for module_file in PIPELINE_MODULES:
+        digest.update(module_file.encode("utf-8"))
+        try:
+            with open(os.path.join(base_dir, module_file), "rb") as f:
+                digest.update(f.read())
+        except (FileNotFoundError, IOError):
+            digest.update(b"<missing>")
+
+    # Trained classifiers feed detect_diseases too; adding or retraining one
+    # changes the version
+    for root, _, files in sorted(os.walk(MODELS_DIR)):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            digest.update(f"{os.path.relpath(path, MODELS_DIR)}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+
+    return digest.hexdigest()[:16]
+
+PIPELINE_VERSION = compute_pipeline_version()
+
+def image_digest(image):
+    """
+    Hash the decoded pixels of an image
+
+    Args:
+        image: PIL Image or numpy array
+
+    Returns:
+        string: SHA-256 hex digest of the RGB pixel data and its shape
+    """
+    if isinstance(image, Image.Image):
+        pixels = np.asarray(image.convert("RGB"))
+    else:
+        pixels = np.ascontiguousarray(image)
+
+    digest = hashlib.sha256()
+    digest.update(str((pixels.shape, pixels.dtype.str)).encode("utf-8"))
+    digest.update(pixels.tobytes())
+    return digest.hexdigest()
+
+def normalize_symptoms(symptoms):
+    """
+    Normalize free-text symptoms so trivial edits don't change the cache key
+
+    Args:
+        symptoms: Symptoms text or None
+
+    Returns:
+        string: Lowercased text with collapsed whitespace
+    """
+    if not symptoms:
+        return ""
+    return " ".join(str(symptoms).lower().split())
+
+def make_cache_key(image, crop_type=None, symptoms=None, pipeline_version=None):
+    """
+    Build the cache key for an analysis request
+
+    Args:
+        image: PIL Image or numpy array
+        crop_type: Optional crop type override
+        symptoms: Optional user-provided symptoms text
+        pipeline_version: Pipeline version (defaults to PIPELINE_VERSION)
+
+    Returns:
+        string: Hex digest identifying the request
+    """
+    if pipeline_version is None:
+        pipeline_version = PIPELINE_VERSION
+
+    key_parts = {
+        "image": image_digest(image),
+        "crop_type": (crop_type or "").strip().lower(),
+        "symptoms": normalize_symptoms(symptoms),
+        "pipeline_version": pipeline_version
+    }
+    return hashlib.sha256(json.dumps(key_parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+def _json_default(value):
+    """Convert numpy values to plain Python types for JSON storage"""
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class AnalysisCache:
+    """Two-tier (memory LRU + on-disk) cache of analysis results"""
+
+    def __init__(self, cache_dir=CACHE_DIR, memory_size=MEMORY_CACHE_SIZE, max_disk_entries=DISK_CACHE_MAX_ENTRIES):
+        """
+        Initialize the cache
+
+        Args:
+            cache_dir: Directory for the on-disk tier (None disables the disk tier)
+            memory_size: Maximum number of results kept in memory
+            max_disk_entries: Maximum number of result files kept on disk
+        """
+        self.cache_dir = cache_dir
+        self.memory_size = memory_size
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """
+        Look up a cached result
+
+        Args:
+            key: Cache key from make_cache_key
+
+        Returns:
+            dict: A copy of the cached results, or None on a miss
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return copy.deepcopy(self._memory[key])
+
+        if not self.cache_dir:
+            return None
+
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, IOError, json.JSONDecodeError):
+            return None
+
+        if entry.get("pipeline_version") != PIPELINE_VERSION:
+            return None
+
+        # Touch the file so disk eviction keeps recently used entries
+        try:
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+
+        results = entry.get("results")
+        self._remember(key, results)
+        return copy.deepcopy(results)
+
+    def put(self, key, results):
+        """
+        Store results in both tiers
+
+        Args:
+            key: Cache key from make_cache_key
+            results: Analysis results dictionary
+        """
+        # Round-trip through JSON so both tiers hold identical plain data
+        payload = json.dumps({
+            "pipeline_version": PIPELINE_VERSION,
+            "results": results
+        }, default=_json_default)
+        self._remember(key, json.loads(payload)["results"])
+
+        if not self.cache_dir:
+            return
+
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._entry_path(key))
+        except (IOError, OSError) as e:
+            print(f"Error saving analysis cache entry: {e}")
+            return
+
+        self._evict_disk()
+
+    def _remember(self, key, results):
+        """Insert into the memory tier, evicting the least recently used entry"""
+        with self._lock:
+            self._memory[key] = results
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        """Remove the least recently used files once the disk tier is over its limit"""
+        try:
+            entries = [
+                entry for entry in os.scandir(self.cache_dir)
+                if entry.is_file() and entry.name.endswith(".json")
+            ]
+        except OSError:
+            return
+
+        excess = len(entries) - self.max_disk_entries
+        if excess <= 0:
+            return
+
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:excess]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def clear(self):
+        """Remove all cached results from both tiers"""
+        with self._lock:
+            self._memory.clear()
+
+        if self.cache_dir and os.path.isdir(self.cache_dir):
+            for entry in os.scandir(self.cache_dir):
+                if entry.is_file() and entry.name.endswith(".json"):
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_analysis_cache():
+    """
+    Get the process-wide analysis cache
+
+    Returns:
+        AnalysisCache: Shared cache instance
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = AnalysisCache()
+        return _default_cache
@@ -6,27 +6,34 @@ from PIL import Image
 import matplotlib.pyplot as plt
 import io
 import base64
+import tempfile
 import json
 from datetime import datetime
 import random
 
 
 # Import custom modules
-from image_processing import preprocess_image, extract_features
+from image_processing import preprocess_image, extract_features, load_image
 from model_handler import identify_plant, detect_water_content, detect_diseases, detect_pests
 from recommendations import get_preventive_measures, get_fertilizer_recommendations
-from utils import load_svg, get_example_images, generate_report_markdown, format_probability, save_uploaded_image
-from db_adapter import create_user, verify_user, update_user_profile, save_analysis, get_user_analyses, get_user_by_id, get_user_profile, save_session, get_active_session, clear_session, verify_forgot_password, reset_password
+from utils import load_svg, get_example_images, generate_report_markdown, format_probability, save_uploaded_image, get_thumbnail_path
+from db_adapter import create_user, verify_user, update_user_profile, save_analysis, get_user_analyses_page, count_user_analyses, get_user_by_id, get_user_profile, save_session, get_active_session, clear_session, verify_forgot_password, reset_password
 from maharashtra import get_local_recommendations
 from profile_utils import get_profile_field, get_select_index
-from soil_analyzer import analyze_soil, get_soil_details
+from soil_analyzer import analyze_soil, get_soil_details, classify_soil_batch
 from model import load_model
+from model_registry import warm_models_from_env
 from plant_analysis import enhanced_analysis
+from stream_analysis import analyze_video
+from analysis_cache import PIPELINE_VERSION
 from weather_service import display_weather_widget, show_weather_page, fetch_weather_data, fetch_forecast_data, get_weather_alerts
 from language_support import initialize_language, show_language_selector, t,translate_api
 from crop_suggestion_helper import *
 from krishimitra import show_chatbot_page
 
+# Load configured disease models once per process (no-op on reruns)
+warm_models_from_env()
+
 # Page configuration
 st.set_page_config(
     page_title="PhytoSense - AI Plant Health Monitoring",
@@ -550,6 +557,8 @@ def init_session_state():
         st.session_state.soil_analysis_saved = False
     if "uploaded_image" not in st.session_state:
         st.session_state.uploaded_image = None
+    if "uploaded_image_file" not in st.session_state:
+        st.session_state.uploaded_image_file = None
     if "uploaded_images" not in st.session_state:
         st.session_state.uploaded_images = []
     if "uploaded_soil_image" not in st.session_state:
@@ -659,6 +668,7 @@ def go_to_crop_test():
     st.session_state.page = "crop_test"
     st.session_state.analysis_complete = False
     st.session_state.uploaded_image = None
+    st.session_state.uploaded_image_file = None
     st.session_state.processed_image = None
 
 def go_to_soil_analysis():
@@ -687,6 +697,7 @@ def logout():
     st.session_state.analysis_complete = False
     st.session_state.soil_analysis_complete = False
     st.session_state.uploaded_image = None
+    st.session_state.uploaded_image_file = None
     st.session_state.uploaded_soil_image = None
     st.session_state.processed_image = None
     st.session_state.plant_info = None
@@ -698,6 +709,7 @@ def logout():
     st.session_state.soil_fertility = None
     st.session_state.crop_suggestions = []
     st.session_state.history = []
+    st.session_state.pop("history_pages", None)
     # Clear weather-related state
     st.session_state.weather_location = None
     st.session_state.weather_data = None
@@ -712,10 +724,10 @@ def save_to_history(analysis_type, data):
     """Save analysis results to user history"""
     # Save to database if user is authenticated
     if st.session_state.current_user:
-        # Convert PIL image to path for storage
+        # Convert PIL image to path for storage (ingest the original upload when we still have it)
         image_path = None
         if analysis_type == "plant" and st.session_state.uploaded_image:
-            image_path = save_uploaded_image(st.session_state.uploaded_image)
+            image_path = save_uploaded_image(st.session_state.get("uploaded_image_file") or st.session_state.uploaded_image)
         elif analysis_type == "soil" and st.session_state.uploaded_soil_image:
             image_path = save_uploaded_image(st.session_state.uploaded_soil_image)
         
@@ -731,9 +743,10 @@ def save_to_history(analysis_type, data):
         )
         
         if success:
-            # Update the session state history
-            user_analyses = get_user_analyses(user_id)
-            st.session_state.history = user_analyses
+            # Update the session state history with the newest page only
+            st.session_state.history, _ = get_user_analyses_page(user_id)
+            # Loaded history pages no longer start at the newest analysis
+            st.session_state.pop("history_pages", None)
 
 # translate list
 def t_list(text_list):
@@ -1416,15 +1429,16 @@ def show_crop_test_page():
     st.markdown(f"<h2 class='slideIn'>{t('Plant Health Analysis')}</h2>", unsafe_allow_html=True)
     
     # Create tabs for different ways to add images
-    tab_upload, tab_live = st.tabs([t("📁 Upload"), t("📷 Live Capture")])
+    tab_upload, tab_live, tab_scan = st.tabs([t("📁 Upload"), t("📷 Live Capture"), t("🎥 Continuous Scan")])
     
     with tab_upload:
         uploaded_file = st.file_uploader(t("Upload an image of your crop for analysis"), type=["jpg", "jpeg", "png"])
         
         if uploaded_file is not None:
-            # Save the uploaded image to session state
-            image = Image.open(uploaded_file)
+            # Save the uploaded image to session state (decoded at reduced scale for analysis)
+            image = load_image(uploaded_file)
             st.session_state.uploaded_image = image
+            st.session_state.uploaded_image_file = uploaded_file
             st.session_state.image_source = "upload"
             
             # Display the uploaded image
@@ -1456,7 +1470,8 @@ def show_crop_test_page():
             col1, col2 = st.columns(2)
             with col1:
                 if captured_image:
-                    st.session_state.uploaded_image = Image.open(captured_image)
+                    st.session_state.uploaded_image = load_image(captured_image)
+                    st.session_state.uploaded_image_file = captured_image
                     st.session_state.image_capture_method = 'live'
                     st.success(t("Image captured! Scroll down for analysis."))
                     st.session_state.show_camera = False
@@ -1467,6 +1482,52 @@ def show_crop_test_page():
                     st.session_state.show_camera = False
                     st.rerun()
     
+    with tab_scan:
+        st.markdown(f"### {t('Scan a Plant from Video')}")
+        st.markdown(t("Record a short video moving slowly around the plant. Similar frames are skipped and the verdict is shown once the readings agree."))
+        
+        video_file = st.file_uploader(t("Upload a video of your crop"), type=["mp4", "mov", "avi"], key="scan_video")
+        
+        if video_file is not None and st.button(t("Start Scan"), key="start_scan"):
+            # OpenCV reads videos from disk, so spool the upload to a temporary file
+            suffix = os.path.splitext(video_file.name)[1]
+            with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+                tmp.write(video_file.getbuffer())
+                video_path = tmp.name
+            
+            status = st.empty()
+            
+            def show_progress(update):
+                if not update["skipped"]:
+                    status.markdown(f"{t('Scanning... frames read')}: {update['frame_index'] + 1}")
+            
+            try:
+                scan = analyze_video(video_path, callback=show_progress)
+            except IOError as e:
+                print(f"Error reading video: {e}")
+                scan = None
+                st.error(t("Could not read this video. Please try another file."))
+            finally:
+                os.remove(video_path)
+            
+            if scan is not None:
+                status.empty()
+                if scan["verdict"]:
+                    verdict = scan["verdict"]
+                    if verdict["status"] == "healthy":
+                        st.success(t("No issues detected"))
+                    else:
+                        st.warning(f"{t('Issues detected')}: " + ", ".join(t(issue.replace("_", " ").capitalize()) for issue in verdict["issues"]))
+                    st.markdown(f"**{t('Confidence')}:** {verdict['confidence']}%")
+                elif scan["frames_analyzed"] == 0:
+                    st.warning(t("No plant was found in the video."))
+                else:
+                    st.info(t("The readings did not settle. Try a longer, steadier video."))
+                
+                st.markdown(f"**{t('Frames analyzed')}:** {scan['frames_analyzed']} / {scan['frames_seen']}")
+                if scan["frames_analyzed"]:
+                    st.markdown(f"**{t('Affected Leaf Area')}:** {scan['metrics']['lesion_fraction']['mean'] * 100:.1f}%")
+    
     # Form for additional plant details
     if st.session_state.uploaded_image:
         st.markdown(f"### {t('Additional Information (Optional)')}")
@@ -1528,6 +1589,17 @@ def show_crop_test_page():
             
             st.session_state.plant_details["previous_treatments"] = previous_treatments if previous_treatments else None
         
+        detailed_scan = st.checkbox(
+            t("Detailed lesion scan (full resolution)"),
+            value=False,
+            help=t("Scans the full photo tile by tile to find small spots. Takes longer on large photos.")
+        )
+        measure_all_leaves = st.checkbox(
+            t("Measure every leaf"),
+            value=False,
+            help=t("Checks the shape of each leaf in the photo instead of only the largest one.")
+        )
+        
         # Analyze button
         if st.button(t("Analyze Plant Health"), key="analyze_plant_btn"):
             if st.session_state.uploaded_image:
@@ -1537,14 +1609,34 @@ def show_crop_test_page():
                     processed_image = preprocess_image(image)
                     st.session_state.processed_image = processed_image
                     
+                    # Decode the original upload without draft scaling for the lesion scan
+                    full_resolution_image = None
+                    if detailed_scan and st.session_state.uploaded_image_file is not None:
+                        try:
+                            st.session_state.uploaded_image_file.seek(0)
+                            full_resolution_image = load_image(st.session_state.uploaded_image_file, target_size=None)
+                        except Exception as e:
+                            print(f"Error decoding full-resolution image: {e}")
+                    
                     # Perform analysis
                     # Perform analysis using enhanced logic for all cases
                     results = enhanced_analysis(
                         image, 
                         crop_type=st.session_state.plant_details.get("crop_type"),
-                        plant_details=st.session_state.plant_details
+                        plant_details=st.session_state.plant_details,
+                        lesion_scan=detailed_scan,
+                        full_resolution_image=full_resolution_image,
+                        multi_leaf=measure_all_leaves
                     )
                     
+                    # Unusable photos are rejected before the full analysis runs
+                    if results.get("quality_rejected"):
+                        st.session_state.analysis_complete = False
+                        st.error(t("This photo cannot be analyzed reliably. Please retake it:"))
+                        for tip in results["quality"]["guidance"]:
+                            st.markdown(f"- {t(tip)}")
+                        return
+                    
                     # Get preventive measures and fertilizer recommendations
                     preventive_measures = get_preventive_measures(
                         results["plant_info"]["name"], 
@@ -1576,7 +1668,8 @@ def show_crop_test_page():
                         "pests": results["pests"],
                         "preventive_measures": preventive_measures,
                         "fertilizer_recommendations": fertilizer_recommendations,
-                        "plant_details": st.session_state.plant_details
+                        "plant_details": st.session_state.plant_details,
+                        "pipeline_version": PIPELINE_VERSION
                     })
                     
 
@@ -1635,6 +1728,31 @@ def show_crop_test_page():
             st.markdown(f"**{t('Status')}:** <span class='{status_class}'>{t(water_content['status'])}</span>", unsafe_allow_html=True)
             st.markdown(f"**{t('Estimated Water Content')}:** {water_content['percentage']}%")
             
+            # Tiled lesion scan
+            if results.get("lesion_scan"):
+                lesion_scan = results["lesion_scan"]
+                st.markdown(f"### {t('Lesion Scan')}")
+                st.markdown(f"**{t('Affected Leaf Area')}:** {lesion_scan['lesion_fraction'] * 100:.1f}%")
+                st.markdown(f"**{t('Spots Found')}:** {lesion_scan['spot_count']}")
+                st.markdown(f"**{t('Affected Regions')}:** {lesion_scan['affected_tiles']} / {len(lesion_scan['tiles'])}")
+                
+                # Coarse lesion map: one cell per tile, brighter means more lesion area
+                score_grid = np.array(lesion_scan["score_grid"], dtype=np.float32)
+                if score_grid.size and score_grid.max() > 0:
+                    heat = (np.clip(score_grid / max(score_grid.max(), 1e-6), 0, 1) * 255).astype(np.uint8)
+                    heat_image = Image.fromarray(heat).resize(
+                        (heat.shape[1] * 32, heat.shape[0] * 32), Image.NEAREST
+                    )
+                    st.image(heat_image, caption=t("Lesion Map"), use_container_width=True)
+            
+            # Per-leaf shape analysis
+            if results.get("leaf_shape", {}).get("leaves"):
+                leaf_shape = results["leaf_shape"]
+                st.markdown(f"### {t('Leaf Shapes')}")
+                st.markdown(f"**{t('Leaves Measured')}:** {leaf_shape['leaf_count']}")
+                st.markdown(f"**{t('Irregular Leaves')}:** {leaf_shape['abnormal_leaf_count']}")
+                st.markdown(f"**{t('Average Solidity')}:** {leaf_shape['summary']['solidity']['mean']:.2f}")
+            
             # Local recommendations
             if "local_recommendations" in results:
                 st.markdown(f"### {t('Maharashtra-Specific Advice')}")
@@ -2010,6 +2128,32 @@ def show_soil_analysis_page():
         # Display the uploaded image
         st.image(image, caption=t("Uploaded Soil Image"), use_container_width=True)
     
+    # Farm survey: classify many soil samples in one pass
+    with st.expander(t("Farm Soil Survey (multiple samples)")):
+        survey_files = st.file_uploader(
+            t("Upload soil photos from different spots of your farm"),
+            type=["jpg", "jpeg", "png"],
+            accept_multiple_files=True,
+            key="soil_survey_files"
+        )
+        
+        if survey_files and st.button(t("Classify All Samples"), key="classify_soil_survey_btn"):
+            with st.spinner(t("Classifying soil samples...")):
+                survey = classify_soil_batch(survey_files, sections=("properties",))
+            
+            aggregate = survey["aggregate"]
+            st.markdown(f"**{t('Majority Soil Type')}:** {t(aggregate['majority_soil_type'])}")
+            st.markdown(f"**{t('Samples Agreeing')}:** {aggregate['agreement'] * 100:.0f}% {t('of')} {aggregate['sample_count']}")
+            for soil_type, count in aggregate["distribution"].items():
+                st.markdown(f"- {t(soil_type)}: {count}")
+            if aggregate["distinct_soil_types"] > 1:
+                st.info(t("Your farm has mixed soil. Consider testing each plot separately before planting."))
+            
+            st.table([
+                {t("Sample"): survey_file.name, t("Soil Type"): t(sample["soil_type"])}
+                for survey_file, sample in zip(survey_files, survey["samples"])
+            ])
+    
     # Form for additional soil details and farmer inputs
     if st.session_state.uploaded_soil_image:
         st.markdown(f"### {t('Soil & Farmer Information')}")
@@ -2547,56 +2691,50 @@ def show_history_page():
     # Get user ID
     user_id = st.session_state.current_user['id'] if isinstance(st.session_state.current_user, dict) else st.session_state.current_user.id
     
-    # Get user's analysis history
-    history = get_user_analyses(user_id, limit=50)  # Get up to 50 analyses
-    
-    if not history:
+    # Cheap existence check; pages are only loaded once filters are known
+    if not count_user_analyses(user_id):
         st.info(t("No analysis history found. Start by analyzing your crops or soil!"))
         return
     
-    # Create filter options
+    # Create filter options (applied by the database, not to a loaded slice)
     st.markdown(f"### {t('Filter Results')}")
     col1, col2, col3 = st.columns(3)
     
     with col1:
         # Use raw strings for options to allow correct filtering, translate via format_func
-        analysis_types = ["All Types"] + list(set(a["analysis_type"] for a in history))
+        analysis_types = ["All Types", "plant", "soil"]
         selected_type = st.selectbox(t("Analysis Type"), options=analysis_types, format_func=t)
     
     with col2:
-        # Extract all dates (YYYY-MM-DD) from timestamps
-        dates = ["All Dates"] + sorted(list(set(a["timestamp"][:10] for a in history)), reverse=True)
-        selected_date = st.selectbox(t("Date"), options=dates, format_func=t)
+        # Empty until picked; a single picked day filters to that day
+        date_range = st.date_input(t("Date"), value=(), format="YYYY-MM-DD")
     
     with col3:
-        # For plant analyses, get list of plants
-        plant_types = ["All Plants"]
-        for a in history:
-            if a["analysis_type"] == "plant" and "results" in a and "plant_info" in a["results"]:
-                plant_name = a["results"]["plant_info"].get("name", "Unknown")
-                if plant_name not in plant_types and plant_name != "Unknown":
-                    plant_types.append(plant_name)
-        
-        # Translate plant names in dropdown
-        selected_plant = st.selectbox(t("Plant Type"), options=plant_types, format_func=t)
+        selected_plant = st.text_input(t("Plant Type"), placeholder=t("All Plants")).strip()
     
-    # Filter history based on selections
-    filtered_history = history
-    
-    if selected_type != "All Types":
-        filtered_history = [a for a in filtered_history if a["analysis_type"] == selected_type]
-    
-    if selected_date != "All Dates":
-        filtered_history = [a for a in filtered_history if a["timestamp"][:10] == selected_date]
+    filters = {
+        "analysis_type": None if selected_type == "All Types" else selected_type,
+        "date_from": date_range[0] if len(date_range) > 0 else None,
+        "date_to": date_range[-1] if len(date_range) > 0 else None,
+        "plant_name": selected_plant or None
+    }
     
-    if selected_plant != "All Plants":
-        filtered_history = [a for a in filtered_history if a["analysis_type"] == "plant" and 
-                          "results" in a and 
-                          "plant_info" in a["results"] and 
-                          a["results"]["plant_info"].get("name") == selected_plant]
+    # Loaded pages are kept across reruns until the filters change
+    pages = st.session_state.get("history_pages")
+    if not pages or pages["user_id"] != user_id or pages["filters"] != filters:
+        analyses, cursor = get_user_analyses_page(user_id, **filters)
+        pages = {
+            "user_id": user_id,
+            "filters": filters,
+            "analyses": analyses,
+            "cursor": cursor,
+            "total": count_user_analyses(user_id, **filters)
+        }
+        st.session_state.history_pages = pages
+    filtered_history = pages["analyses"]
     
     # Display filtered history
-    st.markdown(f"### {t('Results')} ({len(filtered_history)} {t('analyses')})")
+    st.markdown(f"### {t('Results')} ({pages['total']} {t('analyses')})")
     
     if not filtered_history:
         st.info(t("No analyses match your filter criteria."))
@@ -2620,7 +2758,13 @@ def show_history_page():
         st.markdown(f"#### {t('Analysis List')}")
         for i, analysis in enumerate(filtered_history):
             with st.container():
-                col1, col2 = st.columns([4, 1])
+                col_thumb, col1, col2 = st.columns([1, 4, 1])
+                
+                with col_thumb:
+                    # Small thumbnails keep the list from loading full-size uploads
+                    thumbnail_path = get_thumbnail_path(analysis.get("image_path"), "small")
+                    if thumbnail_path:
+                        st.image(thumbnail_path, use_container_width=True)
                 
                 with col1:
                     if analysis["analysis_type"] == "plant":
@@ -2654,6 +2798,14 @@ def show_history_page():
                         st.rerun()
                 
                 st.markdown("---")
+        
+        if pages["cursor"]:
+            st.caption(f"{t('Showing')} {len(filtered_history)} / {pages['total']}")
+            if st.button(t("Load More"), key="history_load_more"):
+                # Keyset page: continues after the last loaded analysis
+                analyses, pages["cursor"] = get_user_analyses_page(user_id, cursor=pages["cursor"], **filters)
+                pages["analyses"] = filtered_history + analyses
+                st.rerun()
 
 def show_analysis_details(analysis):
     """Display detailed view of a single analysis"""
@@ -2674,11 +2826,11 @@ def show_analysis_details(analysis):
         
         # Display image if available
         if "image_path" in analysis and analysis["image_path"]:
-            try:
-                image = Image.open(analysis["image_path"])
-                st.image(image, caption=t("Plant Image"), width=300)
-            except Exception as e:
-                st.error(f"{t('Could not load image')}: {e}")
+            thumbnail_path = get_thumbnail_path(analysis["image_path"], "medium")
+            if thumbnail_path:
+                st.image(thumbnail_path, caption=t("Plant Image"), width=300)
+            else:
+                st.error(t("Could not load image"))
         
         # Create columns for information display
         col1, col2 = st.columns(2)
@@ -0,0 +1,351 @@
+"""
+Benchmark suite for the PhytoSense image pipeline.
+Runs the image processing stages and the full enhanced_analysis over the
+uploads/ corpus and reports per-stage throughput, p50/p95 latency and peak
+memory. Two git revisions can be compared side by side; everything runs
+offline against local files.
+
+Usage:
+    python benchmark_pipeline.py
+    python benchmark_pipeline.py --repeat 5 --limit 40 --json results.json
+    python benchmark_pipeline.py --compare HEAD~3 HEAD
+    python benchmark_pipeline.py --tensor-store
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import inspect
+import argparse
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+from unittest import mock
+
+# Default corpus and stage order
+DEFAULT_IMAGES_DIR = "uploads"
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+STAGES = [
+    "assess_image_quality",
+    "preprocess_image",
+    "extract_features",
+    "segment_plant",
+    "detect_color_anomalies",
+    "analyze_leaf_shape",
+    "enhanced_analysis"
+]
+
+def find_images(images_dir, limit=None):
+    """
+    List the benchmark corpus
+
+    Args:
+        images_dir: Directory containing the images
+        limit: Optional maximum number of images
+
+    Returns:
+        list: Sorted image paths
+    """
+    paths = sorted(
+        path for path in glob.glob(os.path.join(images_dir, "*"))
+        if path.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    return paths[:limit] if limit else paths
+
+def percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[rank]
+
+def _supported_kwargs(func, **kwargs):
+    """Keep only the keyword arguments func accepts (older revisions have fewer)"""
+    parameters = inspect.signature(func).parameters
+    return {name: value for name, value in kwargs.items() if name in parameters}
+
+def load_pipeline(source_dir, crop_type=None):
+    """
+    Import the pipeline modules from a source tree
+
+    Args:
+        source_dir: Directory containing image_processing.py and plant_analysis.py
+        crop_type: Optional crop type passed to enhanced_analysis
+
+    Returns:
+        tuple: (stage name mapped to a callable taking (original, preprocessed)
+            images, the imported image_processing module)
+    """
+    sys.path.insert(0, os.path.abspath(source_dir))
+    import image_processing
+    import plant_analysis
+
+    analysis_kwargs = _supported_kwargs(
+        plant_analysis.enhanced_analysis, simulate_delay=False, use_cache=False, quality_gate=False
+    )
+    analysis_kwargs["crop_type"] = crop_type
+
+    def run_analysis(original):
+        if "simulate_delay" in analysis_kwargs:
+            return plant_analysis.enhanced_analysis(original, **analysis_kwargs)
+        # Older revisions always sleep; skip it for this call only
+        with mock.patch.object(plant_analysis.time, "sleep", lambda seconds: None):
+            return plant_analysis.enhanced_analysis(original, **analysis_kwargs)
+
+    return {
+        "assess_image_quality": lambda original, processed: image_processing.assess_image_quality(original),
+        "preprocess_image": lambda original, processed: image_processing.preprocess_image(original),
+        "extract_features": lambda original, processed: image_processing.extract_features(processed),
+        "segment_plant": lambda original, processed: image_processing.segment_plant(processed),
+        "detect_color_anomalies": lambda original, processed: image_processing.detect_color_anomalies(processed),
+        "analyze_leaf_shape": lambda original, processed: image_processing.analyze_leaf_shape(processed),
+        "enhanced_analysis": lambda original, processed: run_analysis(original)
+    }, image_processing
+
+def decode_corpus(image_paths, image_processing, use_tensor_store=False):
+    """
+    Decode and preprocess every image once, outside the timed sections
+
+    Args:
+        image_paths: Image file paths
+        image_processing: The imported image_processing module
+        use_tensor_store: Whether to take the preprocessed images from the
+            tensor store (filling it on first use) instead of preprocessing
+
+    Returns:
+        list: (original, preprocessed) image pairs
+    """
+    from PIL import Image
+
+    store = None
+    if use_tensor_store:
+        try:
+            from tensor_store import get_tensor_store
+            store = get_tensor_store()
+        except ImportError:
+            print("Tensor store is not available in this revision; preprocessing instead")
+
+    load = getattr(image_processing, "load_image", None)
+    corpus = []
+    for path in image_paths:
+        try:
+            original = load(path) if load else Image.open(path)
+            original.load()
+            if store is not None:
+                if path not in store:
+                    store.add(path, original)
+                processed = store.get(path)
+            else:
+                processed = image_processing.preprocess_image(original)
+            corpus.append((original, processed))
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+    return corpus
+
+def benchmark_stage(stage_func, corpus, repeat):
+    """
+    Time one stage over the corpus
+
+    Args:
+        stage_func: Callable taking (original, preprocessed)
+        corpus: List of (original, preprocessed) pairs
+        repeat: Number of passes over the corpus
+
+    Returns:
+        dict: Call count, latency percentiles (ms), throughput (images/s) and peak memory (MiB),
+            or an 'error' message if the stage fails on this revision
+    """
+    # Warm-up call so one-time imports and allocations are not measured
+    try:
+        stage_func(*corpus[0])
+    except Exception as e:
+        print(f"Stage failed: {type(e).__name__}: {e}")
+        return {"error": f"{type(e).__name__}: {e}"}
+
+    latencies = []
+    total_start = time.perf_counter()
+    for _ in range(repeat):
+        for original, processed in corpus:
+            start = time.perf_counter()
+            stage_func(original, processed)
+            latencies.append(time.perf_counter() - start)
+    total = time.perf_counter() - total_start
+
+    # Separate pass for memory: tracemalloc slows the calls down
+    tracemalloc.start()
+    peak = 0
+    for original, processed in corpus:
+        tracemalloc.reset_peak()
+        stage_func(original, processed)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    return {
+        "calls": len(latencies_ms),
+        "mean_ms": round(sum(latencies_ms) / len(latencies_ms), 3),
+        "p50_ms": round(percentile(latencies_ms, 50), 3),
+        "p95_ms": round(percentile(latencies_ms, 95), 3),
+        "throughput": round(len(latencies_ms) / total, 2) if total > 0 else 0.0,
+        "peak_mib": round(peak / (1024 * 1024), 2)
+    }
+
+def run_benchmark(source_dir=".", images_dir=DEFAULT_IMAGES_DIR, repeat=3, limit=None, stages=None, crop_type=None,
+                  use_tensor_store=False):
+    """
+    Run the benchmark suite
+
+    Args:
+        source_dir: Source tree to import the pipeline from
+        images_dir: Directory containing the corpus
+        repeat: Number of passes over the corpus per stage
+        limit: Optional maximum number of images
+        stages: Optional subset of STAGES
+        crop_type: Optional crop type passed to enhanced_analysis
+        use_tensor_store: Whether the per-stage inputs come from the tensor store
+
+    Returns:
+        dict: Benchmark metadata and per-stage results
+    """
+    image_paths = find_images(images_dir, limit)
+    if not image_paths:
+        raise ValueError(f"No images found in {images_dir}")
+
+    stage_funcs, image_processing = load_pipeline(source_dir, crop_type)
+    corpus = decode_corpus(image_paths, image_processing, use_tensor_store)
+    if not corpus:
+        raise ValueError("No image in the corpus could be decoded")
+
+    results = {}
+    for stage in stages or STAGES:
+        results[stage] = benchmark_stage(stage_funcs[stage], corpus, repeat)
+
+    return {
+        "source_dir": os.path.abspath(source_dir),
+        "images": len(corpus),
+        "repeat": repeat,
+        "crop_type": crop_type,
+        "tensor_store": use_tensor_store,
+        "stages": results,
+        # ru_maxrss is KiB on Linux
+        "max_rss_mib": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+def format_report(report):
+    """Format a benchmark report as a text table"""
+    lines = [
+        f"Images: {report['images']}  Repeat: {report['repeat']}  Max RSS: {report['max_rss_mib']} MiB",
+        f"{'Stage':<24}{'Calls':>7}{'Mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'img/s':>10}{'Peak MiB':>10}"
+    ]
+    for stage, stats in report["stages"].items():
+        if "error" in stats:
+            lines.append(f"{stage:<24}  failed: {stats['error']}")
+            continue
+        lines.append(
+            f"{stage:<24}{stats['calls']:>7}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}"
+            f"{stats['p95_ms']:>10.2f}{stats['throughput']:>10.1f}{stats['peak_mib']:>10.2f}"
+        )
+    return "\n".join(lines)
+
+def format_comparison(report_a, report_b, label_a, label_b):
+    """Format two benchmark reports side by side (negative change means B is faster)"""
+    lines = [
+        f"A = {label_a}  B = {label_b}  Images: {report_a['images']}  Repeat: {report_a['repeat']}",
+        f"{'Stage':<24}{'A p50':>10}{'B p50':>10}{'A p95':>10}{'B p95':>10}{'p50 change':>12}{'A MiB':>9}{'B MiB':>9}"
+    ]
+    for stage in report_a["stages"]:
+        if stage not in report_b["stages"]:
+            continue
+        a, b = report_a["stages"][stage], report_b["stages"][stage]
+        if "error" in a or "error" in b:
+            lines.append(f"{stage:<24}  failed on {'A' if 'error' in a else 'B'}: {(a if 'error' in a else b)['error']}")
+            continue
+        change = (b["p50_ms"] - a["p50_ms"]) / a["p50_ms"] * 100 if a["p50_ms"] else 0.0
+        lines.append(
+            f"{stage:<24}{a['p50_ms']:>10.2f}{b['p50_ms']:>10.2f}{a['p95_ms']:>10.2f}{b['p95_ms']:>10.2f}"
+            f"{change:>+11.1f}%{a['peak_mib']:>9.2f}{b['peak_mib']:>9.2f}"
+        )
+    return "\n".join(lines)
+
+def benchmark_revision(revision, args):
+    """
+    Benchmark a git revision in a temporary worktree
+
+    Each revision runs in its own interpreter so the two trees' modules never mix.
+
+    Args:
+        revision: Any git revision (commit, tag, branch)
+        args: Parsed command line arguments
+
+    Returns:
+        dict: Benchmark report for the revision
+    """
+    images_dir = os.path.abspath(args.images)
+    worktree_dir = tempfile.mkdtemp(prefix="phytosense-bench-")
+    subprocess.run(["git", "worktree", "add", "--detach", worktree_dir, revision],
+                   check=True, capture_output=True)
+    try:
+        output_path = os.path.join(worktree_dir, "benchmark.json")
+        command = [
+            sys.executable, os.path.abspath(__file__),
+            "--source-dir", worktree_dir,
+            "--images", images_dir,
+            "--repeat", str(args.repeat),
+            "--json", output_path
+        ]
+        if args.limit:
+            command += ["--limit", str(args.limit)]
+        if args.stages:
+            command += ["--stages"] + args.stages
+        if args.crop_type:
+            command += ["--crop-type", args.crop_type]
+        if args.tensor_store:
+            command += ["--tensor-store"]
+
+        print(f"Benchmarking {revision}...")
+        # Run from inside the worktree so relative paths (cache/, models/) stay there
+        subprocess.run(command, check=True, cwd=worktree_dir, stdout=subprocess.DEVNULL)
+        with open(output_path, "r") as f:
+            return json.load(f)
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", worktree_dir], capture_output=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PhytoSense image pipeline")
+    parser.add_argument("--images", default=DEFAULT_IMAGES_DIR, help="Directory with the image corpus")
+    parser.add_argument("--repeat", type=int, default=3, help="Passes over the corpus per stage")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum number of images")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, help="Stages to run (default: all)")
+    parser.add_argument("--crop-type", default=None,
+                        help="Crop type for enhanced_analysis (default: identify the plant)")
+    parser.add_argument("--tensor-store", action="store_true",
+                        help="Read preprocessed inputs from the memory-mapped tensor store")
+    parser.add_argument("--source-dir", default=os.path.dirname(os.path.abspath(__file__)),
+                        help="Source tree to import the pipeline from")
+    parser.add_argument("--json", dest="json_path", help="Write the report as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("REV_A", "REV_B"),
+                        help="Compare two git revisions")
+    args = parser.parse_args()
+
+    if args.compare:
+        rev_a, rev_b = args.compare
+        report_a = benchmark_revision(rev_a, args)
+        report_b = benchmark_revision(rev_b, args)
+        print(format_comparison(report_a, report_b, rev_a, rev_b))
+        if args.json_path:
+            with open(args.json_path, "w") as f:
+                json.dump({rev_a: report_a, rev_b: report_b}, f, indent=2)
+        return
+
+    report = run_benchmark(args.source_dir, args.images, args.repeat, args.limit, args.stages, args.crop_type,
+                           args.tensor_store)
+    print(format_report(report))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
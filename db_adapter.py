@@ -6,11 +6,23 @@ Provides functions for interacting with the database for user management and ana
 import os
 import json
 import hashlib
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import datetime, date, timedelta
+
+# Default number of analyses per history page
+HISTORY_PAGE_SIZE = 20
+
+# Connection pool settings for the SQLAlchemy engine, each overridable with
+# the environment variable of the same name (DB_POOL_SIZE=0 disables pooling)
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+# Seconds before a pooled connection is replaced, below typical server idle timeouts
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
 
 # Attempt to import SQLAlchemy for database operations
 try:
-    from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Text, JSON
+    from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Text, JSON, Index, and_, or_
     from sqlalchemy.ext.declarative import declarative_base
     from sqlalchemy.orm import sessionmaker, relationship
     from sqlalchemy.pool import NullPool
@@ -25,14 +37,41 @@ try:
         if DATABASE_URL.startswith("postgres://"):
             DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
         
-        # Create engine with NullPool to avoid pool timeout issues
-        engine = create_engine(DATABASE_URL, poolclass=NullPool)
+        # One pooled engine per process; pre-ping replaces connections the
+        # server has dropped instead of failing the next query
+        if DB_POOL_SIZE > 0:
+            engine = create_engine(
+                DATABASE_URL,
+                pool_size=DB_POOL_SIZE,
+                max_overflow=DB_MAX_OVERFLOW,
+                pool_timeout=DB_POOL_TIMEOUT,
+                pool_recycle=DB_POOL_RECYCLE,
+                pool_pre_ping=True
+            )
+        else:
+            engine = create_engine(DATABASE_URL, poolclass=NullPool)
         
         # Create base class for SQLAlchemy models
         Base = declarative_base()
         
-        # Create session maker
-        Session = sessionmaker(bind=engine)
+        # Create session maker (objects stay readable after the scope commits)
+        Session = sessionmaker(bind=engine, expire_on_commit=False)
+        
+        @contextmanager
+        def session_scope():
+            """
+            Provide a session that commits on success, rolls back on error
+            and always returns its connection to the pool
+            """
+            session = Session()
+            try:
+                yield session
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.close()
         
         # Define SQLAlchemy models
         class User(Base):
@@ -76,6 +115,8 @@ try:
         class Analysis(Base):
             """Store analysis results"""
             __tablename__ = 'analyses'
+            # Serves history pages, seeking on (timestamp, id) in either direction
+            __table_args__ = (Index('ix_analyses_user_history', 'user_id', 'timestamp', 'id'),)
             
             id = Column(Integer, primary_key=True)
             user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -87,9 +128,23 @@ try:
             # Relationships
             user = relationship("User", back_populates="analyses")
         
+        def _analysis_to_dict(analysis):
+            """Convert an Analysis row to the dict the other backends return"""
+            return {
+                'id': analysis.id,
+                'user_id': analysis.user_id,
+                'analysis_type': analysis.analysis_type,
+                'image_path': analysis.image_path,
+                'results': analysis.results,
+                'timestamp': analysis.timestamp.isoformat()
+            }
+        
         # Create tables if they don't exist
         try:
             Base.metadata.create_all(engine)
+            # create_all skips indexes added to tables that already exist
+            for index in Analysis.__table__.indexes:
+                index.create(engine, checkfirst=True)
             USE_SQLALCHEMY = True
         except (sqlalchemy.exc.OperationalError, sqlalchemy.exc.ProgrammingError) as e:
             print(f"Could not create database tables: {e}")
@@ -99,6 +154,11 @@ try:
 except ImportError:
     USE_SQLALCHEMY = False
 
+# Use the SQLite backend when SQLITE_DB_PATH is set and no database server is configured
+USE_SQLITE = bool(os.environ.get('SQLITE_DB_PATH')) and not USE_SQLALCHEMY
+if USE_SQLITE:
+    import sqlite_db
+
 # Fall back to JSON-based storage if SQLAlchemy is not available
 # Fall back to MongoDB if SQLAlchemy is not available
 try:
@@ -107,7 +167,12 @@ try:
         verify_user as mongo_verify_user,
         update_user_profile as mongo_update_user_profile,
         save_analysis as mongo_save_analysis,
+        save_analyses as mongo_save_analyses,
         get_user_analyses as mongo_get_user_analyses,
+        get_user_analyses_page as mongo_get_user_analyses_page,
+        count_user_analyses as mongo_count_user_analyses,
+        get_analyses as mongo_get_analyses,
+        update_analysis_results as mongo_update_analysis_results,
         get_user_by_id as mongo_get_user_by_id,
         get_user_profile as mongo_get_user_profile,
         hash_password,
@@ -124,7 +189,12 @@ from local_db import (
     verify_user as json_verify_user,
     update_user_profile as json_update_user_profile,
     save_analysis as json_save_analysis,
+    save_analyses as json_save_analyses,
     get_user_analyses as json_get_user_analyses,
+    get_user_analyses_page as json_get_user_analyses_page,
+    count_user_analyses as json_count_user_analyses,
+    get_analyses as json_get_analyses,
+    update_analysis_results as json_update_analysis_results,
     get_user_by_id as json_get_user_by_id,
     get_user_profile as json_get_user_profile,
     hash_password as json_hash_password,
@@ -139,6 +209,10 @@ if not USE_MONGO:
     # re-export hash_password if mongo didn't load
     hash_password = json_hash_password
 
+if USE_SQLITE:
+    # Sessions live in the SQLite database too
+    from sqlite_db import hash_password, save_session, get_active_session, clear_session
+
 def create_user(username, password, email=None, farm_location=None):
     """
     Create a new user
@@ -154,39 +228,25 @@ def create_user(username, password, email=None, farm_location=None):
     """
     if USE_SQLALCHEMY:
         try:
-            session = Session()
-            
-            # Check if username already exists
-            existing_user = session.query(User).filter_by(username=username).first()
-            if existing_user:
-                session.close()
-                return False, "Username already exists"
-            
-            # Hash password
-            hashed_password = hash_password(password)
-            
-            # Create new user
-            new_user = User(
-                username=username,
-                password=hashed_password,
-                email=email,
-                farm_location=farm_location,
-                profile_complete=False
-            )
-            
-            session.add(new_user)
-            session.commit()
-            session.close()
+            with session_scope() as session:
+                # Check if username already exists
+                if session.query(User.id).filter_by(username=username).first():
+                    return False, "Username already exists"
+                
+                # Create new user
+                session.add(User(
+                    username=username,
+                    password=hash_password(password),
+                    email=email,
+                    farm_location=farm_location,
+                    profile_complete=False
+                ))
             
             return True, "User created successfully"
         except Exception as e:
-            try:
-                session.rollback()
-            except:
-                pass
-            finally:
-                session.close()
             return False, f"Error creating user: {str(e)}"
+    elif USE_SQLITE:
+        return sqlite_db.create_user(username, password, email, farm_location)
     elif USE_MONGO:
         return mongo_create_user(username, password, email, farm_location)
     else:
@@ -206,30 +266,24 @@ def verify_user(username, password):
     """
     if USE_SQLALCHEMY:
         try:
-            session = Session()
-            
-            # Find user by username
-            user = session.query(User).filter_by(username=username).first()
-            
-            if user and user.password == hash_password(password):
-                # Credentials are valid
-                result = {
-                    'id': user.id,
-                    'username': user.username,
-                    'farm_location': user.farm_location,
-                    'profile_complete': user.profile_complete
-                }
-                session.close()
-                return result
-            
-            session.close()
-            return None
+            with session_scope() as session:
+                # Find user by username
+                user = session.query(User).filter_by(username=username).first()
+                
+                if user and user.password == hash_password(password):
+                    # Credentials are valid
+                    return {
+                        'id': user.id,
+                        'username': user.username,
+                        'farm_location': user.farm_location,
+                        'profile_complete': user.profile_complete
+                    }
+                
+                return None
         except Exception as e:
-            try:
-                session.close()
-            except:
-                pass
             return None
+    elif USE_SQLITE:
+        return sqlite_db.verify_user(username, password)
     elif USE_MONGO:
         return mongo_verify_user(username, password)
     else:
@@ -249,53 +303,46 @@ def update_user_profile(user_id, profile_data):
     """
     if USE_SQLALCHEMY:
         try:
-            session = Session()
-            
-            # Find user by ID
-            user = session.query(User).filter_by(id=user_id).first()
-            
-            if not user:
-                session.close()
-                return False, "User not found"
-            
-            # Update farm_location if provided
-            if 'farm_location' in profile_data:
-                user.farm_location = profile_data['farm_location']
-            
-            # Mark profile as complete
-            user.profile_complete = True
-            
-            # Find existing profile or create new one
-            profile = session.query(UserProfile).filter_by(user_id=user_id).first()
-            
-            if not profile:
-                profile = UserProfile(user_id=user_id)
-                session.add(profile)
-            
-            # Update profile fields
-            for key, value in profile_data.items():
-                if key != 'farm_location' and hasattr(profile, key):
-                    setattr(profile, key, value)
-            
-            # Store additional fields in JSON column
-            additional_info = {}
-            for key, value in profile_data.items():
-                if not hasattr(profile, key) and key != 'farm_location':
-                    additional_info[key] = value
-            
-            if additional_info:
-                profile.additional_info = additional_info
-            
-            session.commit()
-            session.close()
+            with session_scope() as session:
+                # Find user by ID
+                user = session.query(User).filter_by(id=user_id).first()
+                
+                if not user:
+                    return False, "User not found"
+                
+                # Update farm_location if provided
+                if 'farm_location' in profile_data:
+                    user.farm_location = profile_data['farm_location']
+                
+                # Mark profile as complete
+                user.profile_complete = True
+                
+                # Find existing profile or create new one
+                profile = session.query(UserProfile).filter_by(user_id=user_id).first()
+                
+                if not profile:
+                    profile = UserProfile(user_id=user_id)
+                    session.add(profile)
+                
+                # Update profile fields
+                for key, value in profile_data.items():
+                    if key != 'farm_location' and hasattr(profile, key):
+                        setattr(profile, key, value)
+                
+                # Store additional fields in JSON column
+                additional_info = {}
+                for key, value in profile_data.items():
+                    if not hasattr(profile, key) and key != 'farm_location':
+                        additional_info[key] = value
+                
+                if additional_info:
+                    profile.additional_info = additional_info
             
             return True, "Profile updated successfully"
         except Exception as e:
-            try:
-                session.rollback()
-            except:
-                pass
             return False, f"Error updating profile: {str(e)}"
+    elif USE_SQLITE:
+        return sqlite_db.update_user_profile(user_id, profile_data)
     elif USE_MONGO:
         return mongo_update_user_profile(user_id, profile_data)
     else:
@@ -317,37 +364,29 @@ def save_analysis(user_id, analysis_type, image_path, results):
     """
     if USE_SQLALCHEMY:
         try:
-            session = Session()
-            
-            # Find user by ID
-            user = session.query(User).filter_by(id=user_id).first()
-            
-            if not user:
-                session.close()
-                return False, "User not found"
-            
-            # Create new analysis
-            new_analysis = Analysis(
-                user_id=user_id,
-                analysis_type=analysis_type,
-                image_path=image_path,
-                results=results
-            )
-            
-            session.add(new_analysis)
-            session.commit()
-            
-            analysis_id = new_analysis.id
-            
-            session.close()
+            with session_scope() as session:
+                # Find user by ID
+                if not session.query(User.id).filter_by(id=user_id).first():
+                    return False, "User not found"
+                
+                # Create new analysis
+                new_analysis = Analysis(
+                    user_id=user_id,
+                    analysis_type=analysis_type,
+                    image_path=image_path,
+                    results=results
+                )
+                
+                session.add(new_analysis)
+                # Flush to get the generated ID before the scope commits
+                session.flush()
+                analysis_id = new_analysis.id
             
             return True, analysis_id
         except Exception as e:
-            try:
-                session.rollback()
-            except:
-                pass
             return False, f"Error saving analysis: {str(e)}"
+    elif USE_SQLITE:
+        return sqlite_db.save_analysis(user_id, analysis_type, image_path, results)
     elif USE_MONGO:
         return mongo_save_analysis(user_id, analysis_type, image_path, results)
     else:
@@ -355,6 +394,43 @@ def save_analysis(user_id, analysis_type, image_path, results):
         success = json_save_analysis(user_id, analysis_type, image_path, results)
         return success, "Analysis saved successfully"
 
+def save_analyses(analyses):
+    """
+    Save several analyses in a single round trip (e.g. imports and batch jobs)
+    
+    Args:
+        analyses: List of dicts with 'user_id', 'analysis_type', 'image_path',
+            'results' and optionally an ISO 'timestamp'
+    
+    Returns:
+        tuple: (success, number of analyses saved or error message)
+    """
+    if not analyses:
+        return True, 0
+    
+    if USE_SQLALCHEMY:
+        now = datetime.utcnow()
+        rows = [{
+            'user_id': analysis['user_id'],
+            'analysis_type': analysis['analysis_type'],
+            'image_path': analysis.get('image_path'),
+            'results': analysis.get('results'),
+            'timestamp': datetime.fromisoformat(analysis['timestamp']) if analysis.get('timestamp') else now
+        } for analysis in analyses]
+        try:
+            with session_scope() as session:
+                # One multi-row INSERT instead of a unit-of-work flush per object
+                session.bulk_insert_mappings(Analysis, rows)
+            return True, len(rows)
+        except Exception as e:
+            return False, f"Error saving analyses: {str(e)}"
+    elif USE_SQLITE:
+        return sqlite_db.save_analyses(analyses)
+    elif USE_MONGO:
+        return mongo_save_analyses(analyses)
+    else:
+        return json_save_analyses(analyses)
+
 def get_user_analyses(user_id, limit=None):
     """
     Get analyses for a specific user
@@ -368,43 +444,196 @@ def get_user_analyses(user_id, limit=None):
     """
     if USE_SQLALCHEMY:
         try:
-            session = Session()
-            
-            # Query user's analyses, ordered by timestamp (newest first)
-            query = session.query(Analysis).filter_by(user_id=user_id).order_by(Analysis.timestamp.desc())
-            
-            if limit:
-                query = query.limit(limit)
-            
-            analyses = query.all()
-            
-            # Convert SQLAlchemy objects to dictionaries
-            result = []
-            for analysis in analyses:
-                result.append({
-                    'id': analysis.id,
-                    'user_id': analysis.user_id,
-                    'analysis_type': analysis.analysis_type,
-                    'image_path': analysis.image_path,
-                    'results': analysis.results,
-                    'timestamp': analysis.timestamp.isoformat()
-                })
-            
-            session.close()
-            
-            return result
+            with session_scope() as session:
+                # Query user's analyses, ordered by timestamp (newest first)
+                query = session.query(Analysis).filter_by(user_id=user_id).order_by(Analysis.timestamp.desc())
+                
+                if limit:
+                    query = query.limit(limit)
+                
+                # Convert SQLAlchemy objects to dictionaries
+                return [_analysis_to_dict(analysis) for analysis in query.all()]
         except Exception as e:
-            try:
-                session.close()
-            except:
-                pass
             return []
+    elif USE_SQLITE:
+        return sqlite_db.get_user_analyses(user_id, limit)
     elif USE_MONGO:
         return mongo_get_user_analyses(user_id, limit)
     else:
         # Fall back to JSON-based storage
         return json_get_user_analyses(user_id, limit)
 
+def _history_bounds(date_from=None, date_to=None):
+    """ISO timestamp bounds [since, until) covering whole days date_from..date_to"""
+    if isinstance(date_from, str):
+        date_from = date.fromisoformat(date_from[:10])
+    if isinstance(date_to, str):
+        date_to = date.fromisoformat(date_to[:10])
+    since = date_from.isoformat() if date_from else None
+    until = (date_to + timedelta(days=1)).isoformat() if date_to else None
+    return since, until
+
+def _sqlalchemy_history_query(session, user_id, analysis_type=None, since=None, until=None, plant_name=None):
+    """Analysis query with the history filters applied"""
+    query = session.query(Analysis).filter(Analysis.user_id == user_id)
+    if analysis_type is not None:
+        query = query.filter(Analysis.analysis_type == analysis_type)
+    if since is not None:
+        query = query.filter(Analysis.timestamp >= datetime.fromisoformat(since))
+    if until is not None:
+        query = query.filter(Analysis.timestamp < datetime.fromisoformat(until))
+    if plant_name:
+        pattern = plant_name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.filter(
+            Analysis.results[('plant_info', 'name')].as_string().ilike(f'%{pattern}%', escape='\\')
+        )
+    return query
+
+def get_user_analyses_page(user_id, limit=HISTORY_PAGE_SIZE, cursor=None, analysis_type=None,
+                           date_from=None, date_to=None, plant_name=None):
+    """
+    Get one page of a user's analysis history, newest first
+    
+    Pages are keyset-paginated on (timestamp, id): each page seeks past the
+    last analysis of the previous one, so later pages cost the same as the first.
+    
+    Args:
+        user_id: User ID
+        limit: Maximum number of analyses in the page
+        cursor: next_cursor returned with the previous page (None for the first page)
+        analysis_type: Optional analysis type ('plant', 'soil', ...)
+        date_from: Optional first day (date or 'YYYY-MM-DD'), inclusive
+        date_to: Optional last day (date or 'YYYY-MM-DD'), inclusive
+        plant_name: Optional case-insensitive part of the plant name
+    
+    Returns:
+        tuple: (list of analyses, next_cursor or None on the last page)
+    """
+    since, until = _history_bounds(date_from, date_to)
+    before = tuple(cursor.split('|', 1)) if cursor else None
+    # One extra row tells whether another page follows
+    fetch = limit + 1
+    
+    if USE_SQLALCHEMY:
+        try:
+            with session_scope() as session:
+                query = _sqlalchemy_history_query(session, user_id, analysis_type, since, until, plant_name)
+                if before is not None:
+                    timestamp, last_id = datetime.fromisoformat(before[0]), int(before[1])
+                    query = query.filter(or_(
+                        Analysis.timestamp < timestamp,
+                        and_(Analysis.timestamp == timestamp, Analysis.id < last_id)
+                    ))
+                query = query.order_by(Analysis.timestamp.desc(), Analysis.id.desc()).limit(fetch)
+                analyses = [_analysis_to_dict(analysis) for analysis in query.all()]
+        except Exception as e:
+            print(f"Error fetching analyses: {e}")
+            analyses = []
+    elif USE_SQLITE:
+        analyses = sqlite_db.get_user_analyses_page(user_id, fetch, before, analysis_type, since, until, plant_name)
+    elif USE_MONGO:
+        analyses = mongo_get_user_analyses_page(user_id, fetch, before, analysis_type, since, until, plant_name)
+    else:
+        analyses = json_get_user_analyses_page(user_id, fetch, before, analysis_type, since, until, plant_name)
+    
+    if len(analyses) <= limit:
+        return analyses, None
+    analyses = analyses[:limit]
+    last = analyses[-1]
+    return analyses, f"{last['timestamp']}|{last['id']}"
+
+def count_user_analyses(user_id, analysis_type=None, date_from=None, date_to=None, plant_name=None):
+    """
+    Count a user's analyses matching the history filters, without loading them
+    
+    Args:
+        user_id: User ID
+        analysis_type: Optional analysis type
+        date_from: Optional first day (date or 'YYYY-MM-DD'), inclusive
+        date_to: Optional last day (date or 'YYYY-MM-DD'), inclusive
+        plant_name: Optional case-insensitive part of the plant name
+    
+    Returns:
+        int: Number of matching analyses
+    """
+    since, until = _history_bounds(date_from, date_to)
+    
+    if USE_SQLALCHEMY:
+        try:
+            with session_scope() as session:
+                query = _sqlalchemy_history_query(session, user_id, analysis_type, since, until, plant_name)
+                return query.order_by(None).count()
+        except Exception as e:
+            print(f"Error counting analyses: {e}")
+            return 0
+    elif USE_SQLITE:
+        return sqlite_db.count_user_analyses(user_id, analysis_type, since, until, plant_name)
+    elif USE_MONGO:
+        return mongo_count_user_analyses(user_id, analysis_type, since, until, plant_name)
+    else:
+        return json_count_user_analyses(user_id, analysis_type, since, until, plant_name)
+
+def get_analyses(analysis_type=None):
+    """
+    Get every stored analysis across users (used by batch jobs)
+    
+    Args:
+        analysis_type: Optional type filter ('plant', 'soil', etc.)
+        
+    Returns:
+        list: Analyses, oldest first
+    """
+    if USE_SQLALCHEMY:
+        try:
+            with session_scope() as session:
+                query = session.query(Analysis)
+                if analysis_type is not None:
+                    query = query.filter_by(analysis_type=analysis_type)
+                
+                return [_analysis_to_dict(analysis) for analysis in query.order_by(Analysis.timestamp.asc()).all()]
+        except Exception as e:
+            return []
+    elif USE_SQLITE:
+        return sqlite_db.get_analyses(analysis_type)
+    elif USE_MONGO:
+        return mongo_get_analyses(analysis_type)
+    else:
+        # Fall back to JSON-based storage
+        return json_get_analyses(analysis_type)
+
+def update_analysis_results(updates):
+    """
+    Replace the stored results of existing analyses in one batch
+    
+    Args:
+        updates: Dict mapping analysis ID to its new results
+        
+    Returns:
+        int: Number of analyses updated
+    """
+    if not updates:
+        return 0
+    
+    if USE_SQLALCHEMY:
+        try:
+            with session_scope() as session:
+                updated = 0
+                for analysis in session.query(Analysis).filter(Analysis.id.in_(list(updates))).all():
+                    analysis.results = updates[analysis.id]
+                    updated += 1
+            
+            return updated
+        except Exception as e:
+            print(f"Error updating analyses: {e}")
+            return 0
+    elif USE_SQLITE:
+        return sqlite_db.update_analysis_results(updates)
+    elif USE_MONGO:
+        return mongo_update_analysis_results(updates)
+    else:
+        # Fall back to JSON-based storage
+        return json_update_analysis_results(updates)
+
 def get_user_by_id(user_id):
     """
     Get user by ID
@@ -417,30 +646,22 @@ def get_user_by_id(user_id):
     """
     if USE_SQLALCHEMY:
         try:
-            session = Session()
-            
-            user = session.query(User).filter_by(id=user_id).first()
-            
-            if not user:
-                session.close()
-                return None
-            
-            result = {
-                'id': user.id,
-                'username': user.username,
-                'farm_location': user.farm_location,
-                'profile_complete': user.profile_complete
-            }
-            
-            session.close()
-            
-            return result
+            with session_scope() as session:
+                user = session.query(User).filter_by(id=user_id).first()
+                
+                if not user:
+                    return None
+                
+                return {
+                    'id': user.id,
+                    'username': user.username,
+                    'farm_location': user.farm_location,
+                    'profile_complete': user.profile_complete
+                }
         except Exception as e:
-            try:
-                session.close()
-            except:
-                pass
             return None
+    elif USE_SQLITE:
+        return sqlite_db.get_user_by_id(user_id)
     elif USE_MONGO:
         return mongo_get_user_by_id(user_id)
     else:
@@ -459,46 +680,39 @@ def get_user_profile(user_id):
     """
     if USE_SQLALCHEMY:
         try:
-            session = Session()
-            
-            profile = session.query(UserProfile).filter_by(user_id=user_id).first()
-            
-            if not profile:
-                session.close()
-                return None
-            
-            # Extract profile attributes
-            result = {
-                'user_id': profile.user_id,
-                'name': profile.name,
-                'farm_size': profile.farm_size,
-                'farming_type': profile.farming_type,
-                'irrigation': profile.irrigation,
-                'primary_crops': profile.primary_crops,
-                'secondary_crops': profile.secondary_crops,
-                'receive_weather_alerts': profile.receive_weather_alerts,
-                'preferred_language': profile.preferred_language
-            }
-            
-            # Add additional info if available
-            if profile.additional_info:
-                for key, value in profile.additional_info.items():
-                    result[key] = value
-            
-            # Get farm_location from user
-            user = session.query(User).filter_by(id=user_id).first()
-            if user and user.farm_location:
-                result['farm_location'] = user.farm_location
-            
-            session.close()
-            
-            return result
+            with session_scope() as session:
+                profile = session.query(UserProfile).filter_by(user_id=user_id).first()
+                
+                if not profile:
+                    return None
+                
+                # Extract profile attributes
+                result = {
+                    'user_id': profile.user_id,
+                    'name': profile.name,
+                    'farm_size': profile.farm_size,
+                    'farming_type': profile.farming_type,
+                    'irrigation': profile.irrigation,
+                    'primary_crops': profile.primary_crops,
+                    'secondary_crops': profile.secondary_crops,
+                    'receive_weather_alerts': profile.receive_weather_alerts,
+                    'preferred_language': profile.preferred_language
+                }
+                
+                # Add additional info if available
+                if profile.additional_info:
+                    for key, value in profile.additional_info.items():
+                        result[key] = value
+                
+                # Get farm_location from user
+                if profile.user and profile.user.farm_location:
+                    result['farm_location'] = profile.user.farm_location
+                
+                return result
         except Exception as e:
-            try:
-                session.close()
-            except:
-                pass
             return None
+    elif USE_SQLITE:
+        return sqlite_db.get_user_profile(user_id)
     elif USE_MONGO:
         return mongo_get_user_profile(user_id)
     else:
@@ -518,24 +732,19 @@ def verify_forgot_password(username, email, full_name):
         bool: True if details match, False otherwise
     """
     if USE_SQLALCHEMY:
-        # Placeholder for SQL implementation - not requested but good practice to have structure
         try:
-            session = Session()
-            user = session.query(User).filter_by(username=username).first()
-            if not user or user.email != email:
-                session.close()
-                return False
-                
-            # Check profile name
-            profile = session.query(UserProfile).filter_by(user_id=user.id).first()
-            if not profile or profile.name != full_name:
-                session.close()
-                return False
+            with session_scope() as session:
+                user = session.query(User).filter_by(username=username).first()
+                if not user or user.email != email:
+                    return False
                 
-            session.close()
-            return True
-        except:
+                # Check profile name
+                profile = session.query(UserProfile).filter_by(user_id=user.id).first()
+                return bool(profile and profile.name == full_name)
+        except Exception:
             return False
+    elif USE_SQLITE:
+        return sqlite_db.verify_forgot_password(username, email, full_name)
     elif USE_MONGO:
         return mongo_verify_forgot_password(username, email, full_name)
     else:
@@ -554,19 +763,18 @@ def reset_password(username, new_password):
     """
     if USE_SQLALCHEMY:
         try:
-            session = Session()
-            user = session.query(User).filter_by(username=username).first()
-            if not user:
-                session.close()
-                return False
+            with session_scope() as session:
+                user = session.query(User).filter_by(username=username).first()
+                if not user:
+                    return False
                 
-            user.password = hash_password(new_password)
-            user.updated_at = datetime.utcnow()
-            session.commit()
-            session.close()
+                user.password = hash_password(new_password)
+                user.updated_at = datetime.utcnow()
             return True
-        except:
+        except Exception:
             return False
+    elif USE_SQLITE:
+        return sqlite_db.reset_password(username, new_password)
     elif USE_MONGO:
         return mongo_reset_password(username, new_password)
     else:
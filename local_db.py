@@ -4,15 +4,36 @@ This file provides a fallback when SQLAlchemy is not available
 """
 import os
 import json
+import time
+import atexit
 import hashlib
+import tempfile
+import threading
 from datetime import datetime
 
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
 # File to store user data
 USERS_FILE = 'users.json'
 ANALYSES_FILE = 'analyses.json'
 PROFILES_FILE = 'profiles.json'
 SESSION_FILE = 'session.json'
 
+# Append-only analysis log: one JSON record per line, plus a per-user offset index
+# that can always be rebuilt from the log. "jsonl" switches to the log (migrating
+# analyses.json on first use); an existing log is always used.
+ANALYSES_STORAGE = os.environ.get('PHYTOSENSE_ANALYSES_STORAGE', 'json')
+ANALYSES_LOG_FILE = 'analyses.jsonl'
+ANALYSES_INDEX_FILE = 'analyses.idx.json'
+# The index file is rewritten once this many records are indexed but unsaved,
+# or on the first new record after INDEX_FLUSH_SECONDS (and at exit)
+INDEX_FLUSH_RECORDS = 50
+INDEX_FLUSH_SECONDS = 30
+
 from datetime import datetime, timedelta
 
 def save_session(username):
@@ -63,6 +84,186 @@ def _save_json(filename, data):
     with open(filename, 'w') as f:
         json.dump(data, f, indent=2)
 
+_log_lock = threading.Lock()
+_log_index = None
+_unsaved_records = 0
+_last_index_save = 0.0
+
+def _use_analyses_log():
+    """Whether analyses are stored in the append-only log"""
+    if os.path.exists(ANALYSES_LOG_FILE):
+        return True
+    if ANALYSES_STORAGE != 'jsonl':
+        return False
+    if os.path.exists(ANALYSES_FILE):
+        migrate_analyses_to_log()
+    return True
+
+def _empty_log_index():
+    return {'log_size': 0, 'next_id': 1, 'users': {}}
+
+def _index_record(index, record, offset):
+    """Point the index at the latest version of a record"""
+    index['users'].setdefault(record['user_id'], {})[str(record['id'])] = [offset, record['timestamp']]
+    index['next_id'] = max(index['next_id'], int(record['id']) + 1)
+
+def _catch_up_log_index(index):
+    """Index the records appended to the log since the index was written"""
+    log_size = os.path.getsize(ANALYSES_LOG_FILE) if os.path.exists(ANALYSES_LOG_FILE) else 0
+    if log_size < index['log_size']:
+        # The log was replaced; start over
+        index = _empty_log_index()
+    if log_size == index['log_size']:
+        return index, 0
+    
+    added = 0
+    with open(ANALYSES_LOG_FILE, 'rb') as f:
+        offset = index['log_size']
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b'\n'):
+                # Another process is still writing this record
+                break
+            try:
+                _index_record(index, json.loads(line), offset)
+                added += 1
+            except (ValueError, KeyError) as e:
+                print(f"Skipping corrupt analysis log record at offset {offset}: {e}")
+            offset += len(line)
+    index['log_size'] = offset
+    return index, added
+
+def _save_log_index(index):
+    """Atomically replace the index file"""
+    global _unsaved_records, _last_index_save
+    # A private temp file per writer, so concurrent processes never share one
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(ANALYSES_INDEX_FILE)), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+    os.replace(tmp_file, ANALYSES_INDEX_FILE)
+    _unsaved_records = 0
+    _last_index_save = time.monotonic()
+
+def _note_indexed(count):
+    """Record newly indexed records, persisting the index when enough are unsaved"""
+    global _unsaved_records
+    _unsaved_records += count
+    if not _unsaved_records:
+        return
+    if _unsaved_records >= INDEX_FLUSH_RECORDS or time.monotonic() - _last_index_save >= INDEX_FLUSH_SECONDS:
+        _save_log_index(_log_index)
+
+@atexit.register
+def _flush_log_index():
+    """Persist records indexed since the last save"""
+    with _log_lock:
+        if _log_index is not None and _unsaved_records:
+            try:
+                _save_log_index(_log_index)
+            except (IOError, OSError):
+                pass
+
+def _load_log_index():
+    """Get the offset index, brought up to date with the log"""
+    global _log_index
+    if _log_index is None:
+        _log_index = _load_json(ANALYSES_INDEX_FILE, _empty_log_index())
+        if set(_log_index) != set(_empty_log_index()):
+            _log_index = _empty_log_index()
+    _log_index, added = _catch_up_log_index(_log_index)
+    _note_indexed(added)
+    return _log_index
+
+def _lock_file(f):
+    if HAS_FCNTL:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+def _unlock_file(f):
+    if HAS_FCNTL:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def _append_records(records):
+    """
+    Append records to the log, assigning IDs to those without one
+    
+    Returns:
+        list: The appended records
+    """
+    with _log_lock, open(ANALYSES_LOG_FILE, 'ab') as f:
+        # The file lock keeps IDs unique across processes
+        _lock_file(f)
+        try:
+            index = _load_log_index()
+            offset = f.seek(0, os.SEEK_END)
+            for record in records:
+                if record.get('id') is None:
+                    record['id'] = index['next_id']
+                line = (json.dumps(record, separators=(',', ':'), default=str) + '\n').encode('utf-8')
+                f.write(line)
+                _index_record(index, record, offset)
+                offset += len(line)
+            f.flush()
+            index['log_size'] = offset
+            # Our own appends count too, so a restart does not rescan them
+            _note_indexed(len(records))
+        finally:
+            _unlock_file(f)
+    return records
+
+def _read_log_records(offsets):
+    """Read the records at the given log offsets, in order"""
+    records = []
+    with open(ANALYSES_LOG_FILE, 'rb') as f:
+        for offset in offsets:
+            f.seek(offset)
+            records.append(json.loads(f.readline()))
+    return records
+
+def rebuild_analyses_index():
+    """
+    Rebuild the offset index from the analysis log
+    
+    Returns:
+        int: Number of records indexed
+    """
+    global _log_index
+    with _log_lock:
+        _log_index, added = _catch_up_log_index(_empty_log_index())
+        _save_log_index(_log_index)
+    return added
+
+def migrate_analyses_to_log():
+    """
+    One-time migration of analyses.json into the append-only log
+    
+    The JSON array is kept as analyses.json.migrated.
+    
+    Returns:
+        int: Number of analyses migrated (0 if the log already exists)
+    """
+    # Serialize concurrent sessions and processes; the first one migrates
+    with open(ANALYSES_LOG_FILE + '.lock', 'a') as lock:
+        _lock_file(lock)
+        try:
+            if os.path.exists(ANALYSES_LOG_FILE):
+                return 0
+            
+            analyses = _load_json(ANALYSES_FILE, [])
+            
+            fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(ANALYSES_LOG_FILE)), suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                for analysis in analyses:
+                    f.write(json.dumps(analysis, separators=(',', ':'), default=str) + '\n')
+            os.replace(tmp_file, ANALYSES_LOG_FILE)
+            
+            rebuild_analyses_index()
+            if os.path.exists(ANALYSES_FILE):
+                os.replace(ANALYSES_FILE, ANALYSES_FILE + '.migrated')
+        finally:
+            _unlock_file(lock)
+    
+    return len(analyses)
+
 def hash_password(password):
     """Create a hash of a password"""
     return hashlib.sha256(password.encode('utf-8')).hexdigest()
@@ -131,6 +332,18 @@ def update_user_profile(user_id, profile_data):
 
 def save_analysis(user_id, analysis_type, image_path, results):
     """Save analysis results"""
+    if _use_analyses_log():
+        # O(1): one appended line, the ID comes from the index
+        _append_records([{
+            'id': None,
+            'user_id': user_id,
+            'timestamp': datetime.utcnow().isoformat(),
+            'analysis_type': analysis_type,
+            'image_path': image_path,
+            'results': results
+        }])
+        return True
+    
     analyses = _load_json(ANALYSES_FILE, [])
     
     analysis = {
@@ -147,8 +360,52 @@ def save_analysis(user_id, analysis_type, image_path, results):
     
     return True
 
+def save_analyses(analyses):
+    """
+    Save several analyses in one write
+    
+    Args:
+        analyses: List of dicts with 'user_id', 'analysis_type', 'image_path',
+            'results' and optionally an ISO 'timestamp'
+    
+    Returns:
+        tuple: (success, number of analyses saved)
+    """
+    now = datetime.utcnow().isoformat()
+    records = [{
+        'id': None,
+        'user_id': analysis['user_id'],
+        'timestamp': analysis.get('timestamp') or now,
+        'analysis_type': analysis['analysis_type'],
+        'image_path': analysis.get('image_path'),
+        'results': analysis.get('results')
+    } for analysis in analyses]
+    if not records:
+        return True, 0
+    
+    if _use_analyses_log():
+        _append_records(records)
+        return True, len(records)
+    
+    stored = _load_json(ANALYSES_FILE, [])
+    for record in records:
+        record['id'] = len(stored) + 1
+        stored.append(record)
+    _save_json(ANALYSES_FILE, stored)
+    
+    return True, len(records)
+
 def get_user_analyses(user_id, limit=None):
     """Get user's analysis history"""
+    if _use_analyses_log():
+        with _log_lock:
+            entries = list(_load_log_index()['users'].get(user_id, {}).values())
+        # Newest first, then seek straight to this user's records
+        entries.sort(key=lambda entry: entry[1], reverse=True)
+        if limit is not None:
+            entries = entries[:limit]
+        return _read_log_records([offset for offset, _ in entries])
+    
     analyses = _load_json(ANALYSES_FILE, [])
     
     # Filter by user_id and sort by timestamp (newest first)
@@ -161,6 +418,139 @@ def get_user_analyses(user_id, limit=None):
     
     return user_analyses
 
+def _in_history_range(timestamp, analysis_id, before=None, since=None, until=None):
+    """Whether a record falls in a history page's timestamp window and after its cursor"""
+    if since is not None and timestamp < since:
+        return False
+    if until is not None and timestamp >= until:
+        return False
+    return before is None or (timestamp, analysis_id) < before
+
+def _matches_history_filters(analysis, analysis_type=None, plant_name=None):
+    """Whether a record matches the analysis type and plant name filters"""
+    if analysis_type is not None and analysis.get('analysis_type') != analysis_type:
+        return False
+    if plant_name:
+        plant_info = (analysis.get('results') or {}).get('plant_info') or {}
+        return plant_name.lower() in (plant_info.get('name') or '').lower()
+    return True
+
+def get_user_analyses_page(user_id, limit=None, before=None, analysis_type=None,
+                           since=None, until=None, plant_name=None):
+    """
+    Get one page of a user's analysis history, newest first
+    
+    Args:
+        user_id: User ID
+        limit: Maximum number of analyses (None for all)
+        before: Optional (timestamp, id) key; only older analyses are returned
+        analysis_type: Optional analysis type to match
+        since: Optional ISO timestamp, inclusive lower bound
+        until: Optional ISO timestamp, exclusive upper bound
+        plant_name: Optional case-insensitive substring of the plant name
+    
+    Returns:
+        list: Analyses ordered by (timestamp, id) descending
+    """
+    if before is not None:
+        before = (before[0], int(before[1]))
+    
+    if _use_analyses_log():
+        with _log_lock:
+            user_entries = _load_log_index()['users'].get(user_id, {})
+            entries = [
+                (timestamp, int(analysis_id), offset)
+                for analysis_id, (offset, timestamp) in user_entries.items()
+            ]
+        # The index alone resolves the cursor and date range
+        entries = sorted(
+            (entry for entry in entries if _in_history_range(entry[0], entry[1], before, since, until)),
+            reverse=True
+        )
+        if analysis_type is None and not plant_name:
+            return _read_log_records([offset for _, _, offset in entries[:limit]])
+        
+        # Other filters need the records; read them a page at a time
+        page = []
+        chunk = limit or len(entries) or 1
+        for start in range(0, len(entries), chunk):
+            for record in _read_log_records([offset for _, _, offset in entries[start:start + chunk]]):
+                if _matches_history_filters(record, analysis_type, plant_name):
+                    page.append(record)
+                    if limit is not None and len(page) == limit:
+                        return page
+        return page
+    
+    analyses = [
+        a for a in _load_json(ANALYSES_FILE, [])
+        if a['user_id'] == user_id
+        and _in_history_range(a['timestamp'], a['id'], before, since, until)
+        and _matches_history_filters(a, analysis_type, plant_name)
+    ]
+    analyses.sort(key=lambda a: (a['timestamp'], a['id']), reverse=True)
+    return analyses[:limit]
+
+def count_user_analyses(user_id, analysis_type=None, since=None, until=None, plant_name=None):
+    """Count a user's analyses matching the history filters"""
+    if _use_analyses_log() and analysis_type is None and not plant_name:
+        with _log_lock:
+            user_entries = _load_log_index()['users'].get(user_id, {})
+            return sum(
+                1 for _, timestamp in user_entries.values()
+                if _in_history_range(timestamp, 0, since=since, until=until)
+            )
+    return len(get_user_analyses_page(user_id, None, None, analysis_type, since, until, plant_name))
+
+def get_analyses(analysis_type=None):
+    """Get every stored analysis across users, oldest first"""
+    if _use_analyses_log():
+        with _log_lock:
+            users = _load_log_index()['users']
+            entries = sorted(
+                (int(analysis_id), offset)
+                for user_entries in users.values()
+                for analysis_id, (offset, _) in user_entries.items()
+            )
+        analyses = _read_log_records([offset for _, offset in entries])
+    else:
+        analyses = _load_json(ANALYSES_FILE, [])
+    if analysis_type is not None:
+        analyses = [a for a in analyses if a['analysis_type'] == analysis_type]
+    return analyses
+
+def update_analysis_results(updates):
+    """Replace the results of existing analyses (dict of analysis id -> results)"""
+    if not updates:
+        return 0
+    
+    if _use_analyses_log():
+        # Append new versions of the records; the index then points at them
+        with _log_lock:
+            offsets = [
+                offset
+                for user_entries in _load_log_index()['users'].values()
+                for analysis_id, (offset, _) in user_entries.items()
+                if int(analysis_id) in updates
+            ]
+        records = _read_log_records(offsets)
+        for record in records:
+            record['results'] = updates[record['id']]
+        return len(_append_records(records))
+    
+    analyses = _load_json(ANALYSES_FILE, [])
+    
+    updated = 0
+    for analysis in analyses:
+        if analysis['id'] in updates:
+            analysis['results'] = updates[analysis['id']]
+            updated += 1
+    
+    # One rewrite of the file for the whole batch
+    if updated:
+        _save_json(ANALYSES_FILE, analyses)
+    
+    return updated
+
 def get_user_by_id(user_id):
     """Get user by ID"""
     users = _load_json(USERS_FILE, {})
@@ -1,5 +1,6 @@
 import numpy as np
 from crop_data import onion_diseases, tomato_diseases
+from model_registry import get_model
 
 # We're creating a simpler model implementation that doesn't rely on TensorFlow
 # This will be a placeholder that simulates disease detection
@@ -27,14 +28,15 @@ class SimpleModel:
         """
         # This is a placeholder prediction function that returns pseudo-random
         # but consistent results based on image features
-        return np.random.rand(self.num_classes)
+        rng = np.random.default_rng(int(np.mean(image) * 1000))
+        return rng.random(self.num_classes)
 
 def load_model(crop_type):
     """
     Load pretrained model for specific crop type
     
-    Since we don't have actual pretrained models, this creates a simple model and returns it.
-    In a real application, this would load weights from a saved model file.
+    Returns the shared classifier from the model registry when an artifact for
+    the crop exists in models/, otherwise falls back to a SimpleModel.
     
     Args:
         crop_type: 'onion' or 'tomato'
@@ -42,6 +44,11 @@ def load_model(crop_type):
     Returns:
         Model for disease classification
     """
+    # Use a trained model if one is available (loaded once and shared)
+    model = get_model(crop_type)
+    if model is not None:
+        return model
+    
     # Determine number of classes based on crop type
     if crop_type == 'onion':
         num_classes = len(onion_diseases) + 1  # +1 for healthy class
@@ -55,18 +62,42 @@ def load_model(crop_type):
     
     return model
 
+def extract_model_features(image):
+    """
+    Build the feature vector consumed by trained classifiers
+    
+    Args:
+        image: Preprocessed image array (values in [0, 1])
+        
+    Returns:
+        Array of shape (7,): mean R, G, B, variance R, G, B, green ratio
+    """
+    if len(image.shape) == 4:  # If image has batch dimension
+        image = image[0]
+    
+    means = np.mean(image[:, :, :3], axis=(0, 1))
+    variances = np.var(image[:, :, :3], axis=(0, 1))
+    g_ratio = means[1] / (np.sum(means) + 1e-10)
+    return np.concatenate([means, variances, [g_ratio]]).astype(np.float64)
+
 def predict_disease(model, image, crop_type):
     """
     Predict disease from image using the model
     
     Args:
-        model: SimpleModel instance
+        model: SimpleModel instance or a trained model from the registry
         image: Preprocessed image
         crop_type: 'onion' or 'tomato'
         
     Returns:
         Tuple of (disease_id, confidence)
     """
+    # Trained classifiers score the shared feature vector
+    if hasattr(model, "predict_proba"):
+        probabilities = model.predict_proba(extract_model_features(image)[np.newaxis, :])[0]
+        disease_id = int(np.argmax(probabilities))
+        return disease_id, float(probabilities[disease_id] * 100)
+    
     # Extract image features for consistent predictions
     if len(image.shape) == 4:  # If image has batch dimension
         image_rgb = image[0]  # Take first image from batch
@@ -90,8 +121,9 @@ def predict_disease(model, image, crop_type):
     g_ratio = avg_g / (avg_r + avg_g + avg_b + 1e-10)
     color_variance = (var_r + var_g + var_b) / 3
     
-    # Set a seed based on image properties for consistent predictions
-    np.random.seed(int((avg_r + avg_g + avg_b) * 1000))
+    # Per-call generator seeded from image properties for consistent predictions
+    # (never reseeds the global NumPy RNG, so concurrent calls stay independent)
+    rng = np.random.default_rng(int((avg_r + avg_g + avg_b) * 1000))
     
     # Get number of classes
     num_classes = model.num_classes
@@ -99,17 +131,17 @@ def predict_disease(model, image, crop_type):
     if g_ratio > 0.4 and color_variance < 0.05:
         # Likely healthy
         disease_id = num_classes - 1  # Healthy class is the last one
-        confidence = 85 + np.random.randint(0, 15)  # Random confidence between 85-99%
+        confidence = 85 + int(rng.integers(0, 15))  # Random confidence between 85-99%
     else:
         # Some disease present, determine which one based on color features
         if avg_r > avg_b:
             # Reddish/yellowish symptoms (like Purple Blotch or Downy Mildew)
-            disease_id = np.random.randint(0, min(2, num_classes-1))
+            disease_id = int(rng.integers(0, min(2, num_classes-1)))
         else:
             # Darker symptoms (like Basal Rot or White Rot)
-            disease_id = np.random.randint(min(2, num_classes-1), min(4, num_classes-1))
+            disease_id = int(rng.integers(min(2, num_classes-1), min(4, num_classes-1)))
         
-        confidence = 70 + np.random.randint(0, 25)  # Random confidence between 70-94%
+        confidence = 70 + int(rng.integers(0, 25))  # Random confidence between 70-94%
     
     return disease_id, confidence
 
@@ -3,11 +3,50 @@ Model handler module for PhytoSense application.
 Provides functions for interacting with ML models and performing analysis.
 """
 
-import random
 import numpy as np
-from datetime import datetime
 from model import load_model, predict_disease, SOIL_CLASSES
 from crop_data import onion_diseases, tomato_diseases, common_pests, maharashtra_crop_varieties
+from image_processing import ImageContext
+from symptom_index import get_disease_index, get_pest_index
+from symptom_matcher import get_symptom_matcher
+from model_registry import get_model
+
+# Disease score added for a TF-IDF similarity of 1.0 between the user's symptoms and a description
+TEXT_MATCH_WEIGHT = 20
+
+# Disease score added for a trained classifier probability of 1.0 on a disease class
+CLASSIFIER_WEIGHT = 20
+
+def _get_image_context(image, context=None):
+    """
+    Get the shared ImageContext for an image
+    
+    Args:
+        image: Preprocessed image (PIL Image or numpy array)
+        context: Optional analysis context that may carry an 'image_context'
+        
+    Returns:
+        ImageContext: The shared context, or a new one built from the image
+    """
+    if context and context.get('image_context') is not None:
+        return context['image_context']
+    return ImageContext(image)
+
+def _image_rng(image_context, scale=100):
+    """
+    Create a random generator seeded from the image statistics
+    
+    A per-call Generator keeps results reproducible for the same image without
+    touching NumPy's global RNG, so concurrent analyses can't reseed each other.
+    
+    Args:
+        image_context: ImageContext of the image being analyzed
+        scale: Multiplier applied to the summed mean colour before truncation
+        
+    Returns:
+        numpy.random.Generator: Generator for this analysis
+    """
+    return np.random.default_rng(int(np.sum(image_context.mean_color) * scale))
 
 def identify_plant(image, context=None):
     """
@@ -23,6 +62,10 @@ def identify_plant(image, context=None):
     # List of possible crops for identification
     crops = ["Tomato", "Potato", "Corn", "Wheat", "Rice", "Onion", "Soybean", "Cotton"]
     
+    # Set up a generator based on image properties for consistent results
+    image_context = _get_image_context(image, context)
+    rng = _image_rng(image_context)
+    
     # Check context for explicit mentions
     if context:
         user_symptoms = context.get('symptoms', '').lower() if context.get('symptoms') else ""
@@ -41,12 +84,12 @@ def identify_plant(image, context=None):
                 return {
                     "name": crop,
                     "scientific_name": scientific_names.get(crop, ""),
-                    "probability": 95.0 + np.random.random() * 4
+                    "probability": 95.0 + rng.random() * 4
                 }
     
     # Extract color features
-    if len(image.shape) == 3:
-        avg_color = np.mean(np.array(image), axis=(0, 1))
+    if len(image_context.image.shape) == 3:
+        avg_color = image_context.mean_color
         r, g, b = avg_color
         
         # Calculate ratios
@@ -58,50 +101,47 @@ def identify_plant(image, context=None):
         probability = 0.0
         scientific_name = ""
         
-        # Set a seed based on image properties for consistent results
-        np.random.seed(int(np.sum(avg_color) * 100))
-        
         # Apply rule-based prediction
         if g_r_ratio > 1.2 and g > 100:
             # Green leafy crops
             candidates = ["Spinach", "Cabbage", "Lettuce"]
-            plant_name = candidates[np.random.randint(0, len(candidates))]
-            probability = 75 + np.random.randint(0, 20)
+            plant_name = candidates[int(rng.integers(0, len(candidates)))]
+            probability = 75 + int(rng.integers(0, 20))
         elif g_r_ratio > 1.0 and g_b_ratio > 1.3:
             # Likely a Solanaceae family plant (tomato, potato, etc.)
             if r > 100 and b < 90:
                 plant_name = "Tomato"
                 scientific_name = "Solanum lycopersicum"
-                probability = 85 + np.random.randint(0, 15)
+                probability = 85 + int(rng.integers(0, 15))
             else:
                 plant_name = "Potato"
                 scientific_name = "Solanum tuberosum"
-                probability = 80 + np.random.randint(0, 15)
+                probability = 80 + int(rng.integers(0, 15))
         elif g_r_ratio < 0.9 and g > 80:
             # Likely a cereal crop
             if b > 80:
                 plant_name = "Wheat"
                 scientific_name = "Triticum aestivum"
-                probability = 80 + np.random.randint(0, 15)
+                probability = 80 + int(rng.integers(0, 15))
             else:
                 plant_name = "Corn"
                 scientific_name = "Zea mays"
-                probability = 75 + np.random.randint(0, 20)
+                probability = 75 + int(rng.integers(0, 20))
         elif g_r_ratio > 0.9 and g_r_ratio < 1.1:
             # Could be other crops
             if g > 120:
                 plant_name = "Rice"
                 scientific_name = "Oryza sativa"
-                probability = 75 + np.random.randint(0, 20)
+                probability = 75 + int(rng.integers(0, 20))
             else:
                 plant_name = "Onion"
                 scientific_name = "Allium cepa"
-                probability = 70 + np.random.randint(0, 25)
+                probability = 70 + int(rng.integers(0, 25))
         else:
             # Default case - select a random crop from the list
-            idx = np.random.randint(0, len(crops))
+            idx = int(rng.integers(0, len(crops)))
             plant_name = crops[idx]
-            probability = 60 + np.random.randint(0, 30)
+            probability = 60 + int(rng.integers(0, 30))
             
             # Add scientific names for common crops
             scientific_names = {
@@ -124,9 +164,9 @@ def identify_plant(image, context=None):
     else:
         # If image is not RGB, return a default response
         return {
-            "name": random.choice(crops),
+            "name": crops[int(rng.integers(0, len(crops)))],
             "scientific_name": "",
-            "probability": 60 + np.random.randint(0, 15)
+            "probability": 60 + int(rng.integers(0, 15))
         }
 
 def detect_water_content(image, context=None):
@@ -148,9 +188,9 @@ def detect_water_content(image, context=None):
     is_wilting = "wilt" in user_symptoms or "droop" in user_symptoms or "dry" in user_symptoms
     
     # Extract color features for analysis
-    img_array = np.array(image)
-    if len(img_array.shape) == 3:
-        avg_color = np.mean(img_array, axis=(0, 1))
+    image_context = _get_image_context(image, context)
+    if len(image_context.image.shape) == 3:
+        avg_color = image_context.mean_color
         r, g, b = avg_color
         
         # Calculate green intensity as a proxy for plant health/hydration
@@ -161,7 +201,7 @@ def detect_water_content(image, context=None):
         g_b_ratio = g / (b + 1e-10)
         
         # Create a deterministic prediction based on color features
-        np.random.seed(int(np.sum(avg_color) * 100))
+        rng = _image_rng(image_context)
         
         # Determine water content and status
         water_percentage = 0.0
@@ -170,24 +210,24 @@ def detect_water_content(image, context=None):
         # Logic override based on user input
         if is_wilting:
             # User says it's wilting, so it IS low/critical even if green
-            water_percentage = 30 + np.random.randint(0, 20)
+            water_percentage = 30 + int(rng.integers(0, 20))
             status = "Low"
             if "severe" in user_symptoms or "die" in user_symptoms:
-                water_percentage = 15 + np.random.randint(0, 10)
+                water_percentage = 15 + int(rng.integers(0, 10))
                 status = "Critical"
         else:
             # Standard logic
             if g_intensity > 0.45 and g_r_ratio > 1.1 and g_b_ratio > 1.1:
                 # Well-hydrated plant
-                water_percentage = 75 + np.random.randint(0, 20)
+                water_percentage = 75 + int(rng.integers(0, 20))
                 status = "Optimal"
             elif (g_intensity > 0.3 and g_intensity <= 0.45) or (g_r_ratio > 0.9 and g_r_ratio <= 1.1):
                 # Moderately hydrated plant
-                water_percentage = 40 + np.random.randint(0, 35)
+                water_percentage = 40 + int(rng.integers(0, 35))
                 status = "Low"
             else:
                 # Under-hydrated plant
-                water_percentage = 10 + np.random.randint(0, 30)
+                water_percentage = 10 + int(rng.integers(0, 30))
                 status = "Critical"
         
         return {
@@ -196,12 +236,63 @@ def detect_water_content(image, context=None):
         }
     else:
         # Default response for non-RGB images
-        np.random.seed(int(datetime.now().timestamp()) % 1000)
+        rng = _image_rng(image_context)
+        statuses = ["Optimal", "Low", "Critical"]
         return {
-            "percentage": 50 + np.random.randint(0, 30),
-            "status": random.choice(["Optimal", "Low", "Critical"])
+            "percentage": 50 + int(rng.integers(0, 30)),
+            "status": statuses[int(rng.integers(0, len(statuses)))]
         }
 
+def _disease_treatment(d_info):
+    """Treatment text for a crop_data (chemicals list) or CROP_DATABASE (treatment text) disease"""
+    if d_info.get("chemicals"):
+        return "Apply: " + ", ".join(d_info["chemicals"][:2])
+    return d_info.get("treatment", "")
+
+def _pest_description(p_info):
+    """Description text for a crop_data or CROP_DATABASE pest"""
+    if "identification" in p_info:
+        return p_info.get("identification", "") + ". " + p_info.get("damage", "")
+    return p_info.get("description", "") or p_info.get("symptoms", "")
+
+def _pest_treatment(p_info):
+    """Treatment text for a crop_data (chemicals list) or CROP_DATABASE (treatment text) pest"""
+    if p_info.get("chemicals"):
+        return "Control: " + ", ".join(p_info["chemicals"][:2])
+    return p_info.get("treatment", "")
+
+def _classifier_scores(image_context, plant_name):
+    """
+    Score diseases with the trained classifier for the crop, if one is installed
+    
+    Only artifacts from the model registry are used; the SimpleModel placeholder
+    that load_model falls back to is never consulted here.
+    
+    Args:
+        image_context: ImageContext of the preprocessed image
+        plant_name: Name of the plant
+        
+    Returns:
+        dict: Disease name -> (disease info, score), empty without a trained model
+    """
+    crop_type = (plant_name or "").strip().lower()
+    diseases = {"tomato": tomato_diseases, "onion": onion_diseases}.get(crop_type)
+    if diseases is None or len(image_context.image.shape) != 3:
+        return {}
+    
+    model = get_model(crop_type)
+    if model is None:
+        return {}
+    
+    # Classifiers take features of the image scaled to [0, 1]
+    disease_id, confidence = predict_disease(model, image_context.image / 255.0, crop_type)
+    names = list(diseases)
+    if disease_id >= len(names):
+        # The healthy class is last
+        return {}
+    name = names[disease_id]
+    return {name: (diseases[name], int(round(confidence / 100 * CLASSIFIER_WEIGHT)))}
+
 def detect_diseases(image, plant_name, context=None):
     """
     Detect diseases in plants using image analysis and user context
@@ -234,64 +325,70 @@ def detect_diseases(image, plant_name, context=None):
         if anomalies.get("brown_spots"): signals.append("spots")
         if anomalies.get("green_deficiency"): signals.append("chlorosis")
 
-    # 2. Load Disease List for Crop
-    if plant_name.lower() == "tomato":
-        disease_list = tomato_diseases
-    elif plant_name.lower() == "onion":
-        disease_list = onion_diseases
-    else:
-        # Try to get from crop_database via imports in plant_analysis, but here we don't have it easily.
-        # Fallback to generic known lists or return empty if very specific.
-        # Check against simple lists for robust fallback
-        disease_list = tomato_diseases # Default fallback
+    # 2. Load the precompiled disease index for the crop
+    # (crop_data lists for tomato/onion, CROP_DATABASE for other crops, tomato as fallback)
+    disease_index = get_disease_index(plant_name)
 
     # 3. Match Signals to Diseases
     best_match = None
     max_score = 0
     
     # Analyze image stats for confidence base
-    img_array = np.array(image)
-    if len(img_array.shape) == 3:
-        avg_color = np.mean(img_array, axis=(0, 1))
+    image_context = _get_image_context(image, context)
+    is_rgb = len(image_context.image.shape) == 3
+    if is_rgb:
         # Base confidence on image quality/clarity (simple heuristic)
-        base_confidence = 70 + (np.std(img_array) / 10) 
+        base_confidence = 70 + (image_context.std / 10) 
         base_confidence = min(95, max(60, base_confidence))
     else:
         base_confidence = 70
 
     detected_diseases = []
     
-    if disease_list:
-        for d_name, d_info in disease_list.items():
-            score = 0
-            d_symptoms = d_info.get("symptoms", "").lower()
-            
-            # Keyword matching
-            if "yellow" in d_symptoms and "yellowing" in signals: score += 3
-            if "spot" in d_symptoms and "spots" in signals: score += 3
-            if "powder" in d_symptoms and "powdery" in signals: score += 4
-            if "rot" in d_symptoms and "rot" in signals: score += 3
-            if "wilt" in d_symptoms and "wilt" in signals: score += 4
-            if "curl" in d_symptoms and "curl" in signals: score += 4
-            
-            # User text specific matches (higher weight)
-            if user_symptoms:
-                for word in user_symptoms.split():
-                    if len(word) > 3 and word in d_symptoms:
-                        score += 2
-                        
-            if score > max_score:
-                max_score = score
-                best_match = (d_name, d_info)
-            
-            if score > 2: # Threshold to consider it a candidate
-                detected_diseases.append({
-                    "name": d_name,
-                    "confidence": base_confidence + (score * 2),
-                    "scientific_name": d_info.get("scientific_name", ""),
-                    "description": d_info.get("symptoms", ""),
-                    "treatment": "Apply: " + ", ".join(d_info.get("chemicals", [])[:2])
-                })
+    # Signal keywords are scored by index lookup. Free-text symptoms are ranked by
+    # TF-IDF similarity when scikit-learn is available and the crop has its own
+    # catalog, otherwise by the index's word lookup
+    matcher = get_symptom_matcher() if user_symptoms else None
+    if matcher is not None and not matcher.covers("disease", plant_name):
+        matcher = None
+    
+    candidates = {}
+    for d_name, d_info, score in disease_index.score(user_symptoms, signals, match_terms=matcher is None):
+        candidates[d_name] = [d_info, score]
+    
+    if matcher is not None:
+        text_scores = {}
+        for match in matcher.match(user_symptoms, kind="disease", crop=plant_name, top_k=None):
+            # A disease listed in both catalogs keeps its best similarity
+            if match["name"] not in text_scores:
+                text_scores[match["name"]] = (match["info"], match["score"])
+        for d_name, (d_info, similarity) in text_scores.items():
+            text_score = int(round(similarity * TEXT_MATCH_WEIGHT))
+            if d_name in candidates:
+                candidates[d_name][1] += text_score
+            else:
+                candidates[d_name] = [d_info, text_score]
+    
+    # A trained classifier for the crop adds its predicted disease
+    for d_name, (d_info, classifier_score) in _classifier_scores(image_context, plant_name).items():
+        if d_name in candidates:
+            candidates[d_name][1] += classifier_score
+        else:
+            candidates[d_name] = [d_info, classifier_score]
+    
+    for d_name, (d_info, score) in candidates.items():
+        if score > max_score:
+            max_score = score
+            best_match = (d_name, d_info)
+        
+        if score > 2: # Threshold to consider it a candidate
+            detected_diseases.append({
+                "name": d_name,
+                "confidence": min(99, base_confidence + (score * 2)),
+                "scientific_name": d_info.get("scientific_name", ""),
+                "description": d_info.get("symptoms", ""),
+                "treatment": _disease_treatment(d_info)
+            })
 
     # 4. Construct Result
     result = {
@@ -313,14 +410,14 @@ def detect_diseases(image, plant_name, context=None):
             "confidence": base_confidence, 
             "scientific_name": d_info.get("scientific_name", ""),
             "description": d_info.get("symptoms", ""),
-            "treatment": "Apply: " + ", ".join(d_info.get("chemicals", [])[:2])
+            "treatment": _disease_treatment(d_info)
         })
     else:
         # No specific signals -> Check for general health
         # If image is very green and no user complaints, assume healthy
         is_green = False
-        if len(img_array.shape) == 3:
-            r, g, b = np.mean(img_array, axis=(0, 1))
+        if is_rgb:
+            r, g, b = image_context.mean_color
             if g > r and g > b and g > 100:
                 is_green = True
         
@@ -339,13 +436,14 @@ def detect_diseases(image, plant_name, context=None):
 
     return result
 
-def detect_pests(image, context=None):
+def detect_pests(image, context=None, plant_name=None):
     """
     Detect pests in plants using image analysis and user context
     
     Args:
         image: Preprocessed image array
         context: Optional dict containing 'symptoms', 'anomalies', 'shape_analysis'
+        plant_name: Optional name of the plant (adds the crop's own pests to the common ones)
         
     Returns:
         dict: Information about detected pests
@@ -370,29 +468,16 @@ def detect_pests(image, context=None):
     detected_pests = []
     base_confidence = 75.0
     
-    pest_candidates = list(common_pests.keys())
-    
-    for pest_name in pest_candidates:
-        p_info = common_pests[pest_name]
-        score = 0
-        p_desc = p_info.get("identification", "").lower() + " " + p_info.get("damage", "").lower()
-        
-        if "hole" in p_desc and "holes" in signals: score += 4
-        if "web" in p_desc and "webbing" in signals: score += 5
-        if "suck" in p_desc and "sucking_pests" in signals: score += 4
-        
-        # Specific name match in user text
-        if pest_name.lower() in user_symptoms: score += 5
-        
-        if score > 0:
-            detected_pests.append({
-                "name": pest_name,
-                "confidence": min(98, base_confidence + (score * 5)),
-                "scientific_name": p_info.get("scientific_name", ""),
-                "infestation_level": "Medium", # Default
-                "description": p_info.get("identification", "") + ". " + p_info.get("damage", ""),
-                "treatment": "Control: " + ", ".join(p_info.get("chemicals", [])[:2])
-            })
+    # Signal keywords and pest names in the user's text are scored by index lookup
+    for pest_name, p_info, score in get_pest_index(plant_name).score(user_symptoms, signals, match_terms=False):
+        detected_pests.append({
+            "name": pest_name,
+            "confidence": min(98, base_confidence + (score * 5)),
+            "scientific_name": p_info.get("scientific_name", ""),
+            "infestation_level": "Medium", # Default
+            "description": _pest_description(p_info),
+            "treatment": _pest_treatment(p_info)
+        })
             
     result = {
         "detected": False,
@@ -433,9 +518,6 @@ def analyze_soil_type(image):
         std_color = np.std(img_array, axis=(0, 1))
         std_r, std_g, std_b = std_color
         
-        # Set seed for consistent results
-        np.random.seed(int((r + g + b) * 10))
-        
         # Determine soil type based on color
         if r > g and r > b and r > 150:
             # Reddish soil
@@ -453,5 +535,6 @@ def analyze_soil_type(image):
             # Default to alluvial soil
             return SOIL_CLASSES[3]  # Alluvial Soil
     else:
-        # For grayscale images, make a random selection
-        return np.random.choice(SOIL_CLASSES)
+        # For grayscale images, make a deterministic pseudo-random selection
+        rng = np.random.default_rng(int(np.mean(img_array) * 10))
+        return SOIL_CLASSES[int(rng.integers(0, len(SOIL_CLASSES)))]
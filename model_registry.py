@@ -0,0 +1,176 @@
+"""
+Model registry module for PhytoSense application.
+Lazily loads trained disease classifiers from the models/ directory and shares
+them across sessions in the process.
+
+Supported artifacts (class ids follow the disease order in crop_data, with the
+healthy class last):
+    models/<crop>.joblib  scikit-learn estimator saved with joblib.dump; NumPy
+                          arrays inside it are memory-mapped on load
+    models/<crop>.pkl     scikit-learn estimator saved with pickle
+    models/<crop>/weights.npy (+ optional bias.npy)
+                          linear classifier weights of shape
+                          (n_features, n_classes), memory-mapped read-only
+
+Memory-mapped weights live in the OS page cache, so every process that maps
+the same file (Streamlit sessions, batch and reprocessing workers) shares one
+physical copy instead of loading its own.
+"""
+
+import os
+import pickle
+import threading
+
+import numpy as np
+
+# Directory containing model artifacts
+MODELS_DIR = os.environ.get("PHYTOSENSE_MODELS_DIR", "models")
+
+# Comma-separated crop types to load at startup ("all" loads every artifact)
+WARM_MODELS = os.environ.get("PHYTOSENSE_WARM_MODELS", "")
+
+_models = {}
+_models_lock = threading.Lock()
+
+class LinearModel:
+    """Softmax linear classifier backed by memory-mapped NumPy weights"""
+
+    def __init__(self, weights, bias=None):
+        """
+        Initialize the model
+
+        Args:
+            weights: Array of shape (n_features, n_classes)
+            bias: Optional array of shape (n_classes,)
+        """
+        self.weights = weights
+        self.bias = bias
+        self.num_classes = weights.shape[1]
+
+    def predict_proba(self, features):
+        """
+        Predict class probabilities
+
+        Args:
+            features: Array of shape (n_samples, n_features)
+
+        Returns:
+            Array of shape (n_samples, n_classes)
+        """
+        logits = np.asarray(features, dtype=np.float64) @ self.weights
+        if self.bias is not None:
+            logits = logits + self.bias
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp_logits = np.exp(logits)
+        return exp_logits / exp_logits.sum(axis=1, keepdims=True)
+
+def _artifact_name(crop_type):
+    """Normalize a crop type to its artifact file name"""
+    return crop_type.strip().lower().replace(" ", "_")
+
+def _load_artifact(crop_type):
+    """
+    Load the model artifact for a crop type from MODELS_DIR
+
+    Args:
+        crop_type: Crop type, e.g. 'onion' or 'tomato'
+
+    Returns:
+        Loaded model, or None if no artifact exists
+    """
+    name = _artifact_name(crop_type)
+
+    joblib_path = os.path.join(MODELS_DIR, f"{name}.joblib")
+    if os.path.exists(joblib_path):
+        import joblib
+        model = joblib.load(joblib_path, mmap_mode="r")
+    else:
+        pickle_path = os.path.join(MODELS_DIR, f"{name}.pkl")
+        weights_path = os.path.join(MODELS_DIR, name, "weights.npy")
+        if os.path.exists(pickle_path):
+            with open(pickle_path, "rb") as f:
+                model = pickle.load(f)
+        elif os.path.exists(weights_path):
+            weights = np.load(weights_path, mmap_mode="r")
+            bias_path = os.path.join(MODELS_DIR, name, "bias.npy")
+            bias = np.load(bias_path, mmap_mode="r") if os.path.exists(bias_path) else None
+            model = LinearModel(weights, bias)
+        else:
+            return None
+
+    # Expose num_classes the same way SimpleModel does
+    if not hasattr(model, "num_classes") and hasattr(model, "classes_"):
+        model.num_classes = len(model.classes_)
+
+    return model
+
+def get_model(crop_type):
+    """
+    Get the shared model for a crop type, loading it on first use
+
+    Args:
+        crop_type: Crop type, e.g. 'onion' or 'tomato'
+
+    Returns:
+        Loaded model, or None if no artifact exists for the crop
+    """
+    name = _artifact_name(crop_type)
+
+    with _models_lock:
+        if name not in _models:
+            try:
+                _models[name] = _load_artifact(name)
+            except Exception as e:
+                print(f"Error loading model for {crop_type}: {e}")
+                _models[name] = None
+        return _models[name]
+
+def available_models():
+    """
+    List crop types that have a model artifact in MODELS_DIR
+
+    Returns:
+        list: Sorted crop type names
+    """
+    if not os.path.isdir(MODELS_DIR):
+        return []
+
+    names = set()
+    for entry in os.scandir(MODELS_DIR):
+        if entry.is_file() and entry.name.endswith((".joblib", ".pkl")):
+            names.add(os.path.splitext(entry.name)[0])
+        elif entry.is_dir() and os.path.exists(os.path.join(entry.path, "weights.npy")):
+            names.add(entry.name)
+    return sorted(names)
+
+def warm_models(crop_types=None):
+    """
+    Load models ahead of the first request
+
+    Args:
+        crop_types: Crop types to load (defaults to every available artifact)
+
+    Returns:
+        list: Crop types that were loaded successfully
+    """
+    if crop_types is None:
+        crop_types = available_models()
+    return [crop_type for crop_type in crop_types if get_model(crop_type) is not None]
+
+def warm_models_from_env():
+    """
+    Warm the models listed in PHYTOSENSE_WARM_MODELS (safe to call repeatedly)
+
+    Returns:
+        list: Crop types that are loaded
+    """
+    if not WARM_MODELS.strip():
+        return []
+    if WARM_MODELS.strip().lower() == "all":
+        return warm_models()
+    return warm_models([name for name in WARM_MODELS.split(",") if name.strip()])
+
+def clear_models():
+    """Drop all loaded models (they are reloaded lazily on next use)"""
+    with _models_lock:
+        _models.clear()
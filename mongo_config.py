@@ -1,34 +1,164 @@
 import os
+import time
+import threading
 import streamlit as st
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING
 import urllib.parse
 
+# Optional in-memory stand-in, selected with MONGO_URI=mongomock://
+try:
+    import mongomock
+    HAS_MONGOMOCK = True
+except ImportError:
+    HAS_MONGOMOCK = False
+
+DEFAULT_DB_NAME = "phytosense_db"
+
+# Client pool and timeout options, each read from the secret/environment
+# variable of the same upper-case name, with its default
+CLIENT_OPTIONS = {
+    "maxPoolSize": ("MONGO_MAX_POOL_SIZE", 50),
+    "minPoolSize": ("MONGO_MIN_POOL_SIZE", 0),
+    "maxIdleTimeMS": ("MONGO_MAX_IDLE_TIME_MS", 300000),
+    "serverSelectionTimeoutMS": ("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000),
+    "connectTimeoutMS": ("MONGO_CONNECT_TIMEOUT_MS", 5000),
+    "socketTimeoutMS": ("MONGO_SOCKET_TIMEOUT_MS", 20000)
+}
+
+# Seconds to wait before trying again after a failed connection
+RETRY_INTERVAL = 30
+
+_client = None
+_database = None
+_last_failure = 0.0
+_lock = threading.Lock()
+
+def _setting(name, default=None):
+    """
+    Read a setting from Streamlit secrets, falling back to the environment
+    """
+    try:
+        value = st.secrets.get(name)
+    except Exception:
+        # No secrets file (e.g. batch jobs run outside Streamlit)
+        value = None
+    return value or os.environ.get(name) or default
+
+def _client_options():
+    """Pool and timeout options for MongoClient"""
+    return {option: int(_setting(name, default)) for option, (name, default) in CLIENT_OPTIONS.items()}
+
+def _create_client(mongo_uri):
+    """Create a client for the URI (mongomock:// gives an in-memory stand-in)"""
+    if mongo_uri.startswith("mongomock://"):
+        if not HAS_MONGOMOCK:
+            raise ImportError("mongomock is required for mongomock:// URIs")
+        return mongomock.MongoClient()
+    return MongoClient(mongo_uri, **_client_options())
+
 def get_mongo_client():
     """
-    Get MongoDB client connection
+    Get the process-wide MongoDB client, connecting on first use
+
+    MongoClient is thread-safe and pools its connections, so one client is
+    shared by every session in the process.
+    """
+    global _client, _last_failure
+
+    if _client is not None:
+        return _client
+
+    with _lock:
+        if _client is not None:
+            return _client
+
+        # Try to get URI from secrets or environment
+        mongo_uri = _setting("MONGO_URI")
+        if not mongo_uri:
+            return None
+
+        # Don't stall every request on an unreachable server
+        if time.monotonic() - _last_failure < RETRY_INTERVAL:
+            return None
+
+        try:
+            client = _create_client(mongo_uri)
+            # Test connection once per process
+            client.admin.command('ping')
+            _client = client
+        except Exception as e:
+            _last_failure = time.monotonic()
+            print(f"Error connecting to MongoDB: {e}")
+            return None
+
+    return _client
+
+def ensure_indexes(db):
+    """
+    Create the indexes the queries in mongo_db rely on (no-op if they exist)
+
+    Args:
+        db: Database instance
     """
-    # Try to get URI from secrets or environment
-    mongo_uri = st.secrets.get("MONGO_URI") or os.environ.get("MONGO_URI")
-    
-    if not mongo_uri:
-        return None
-        
     try:
-        client = MongoClient(mongo_uri)
-        # Test connection
-        client.admin.command('ping')
-        return client
+        db.users.create_index([("username", ASCENDING)], unique=True, name="username_unique")
+        db.user_profiles.create_index([("user_id", ASCENDING)], unique=True, name="user_id_unique")
+        # _id breaks timestamp ties so history pages can seek on (timestamp, _id)
+        db.analyses.create_index(
+            [("user_id", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+            name="user_history_keyset"
+        )
     except Exception as e:
-        print(f"Error connecting to MongoDB: {e}")
-        return None
+        # e.g. duplicate usernames created before the unique index existed
+        print(f"Error creating MongoDB indexes: {e}")
 
 def get_database():
     """
     Get database instance
     """
+    global _database
+
+    if _database is not None:
+        return _database
+
     client = get_mongo_client()
-    if client:
-        # Get database name from URI or default
-        db_name = st.secrets.get("MONGO_DB_NAME") or os.environ.get("MONGO_DB_NAME") or "phytosense_db"
-        return client[db_name]
-    return None
+    if client is None:
+        return None
+
+    with _lock:
+        if _database is None:
+            # Get database name from URI or default
+            db_name = _setting("MONGO_DB_NAME", DEFAULT_DB_NAME)
+            db = client[db_name]
+            ensure_indexes(db)
+            _database = db
+    return _database
+
+def set_mongo_client(client, db_name=None):
+    """
+    Use the given client instead of connecting (e.g. mongomock.MongoClient() in tests)
+
+    Args:
+        client: MongoClient-compatible object
+        db_name: Optional database name (defaults to the MONGO_DB_NAME setting)
+    """
+    global _client, _database
+    with _lock:
+        _client = client
+        _database = None
+        if db_name is not None:
+            _database = client[db_name]
+            ensure_indexes(_database)
+
+def reset_mongo_client():
+    """Close and forget the shared client (the next call reconnects)"""
+    global _client, _database, _last_failure
+    with _lock:
+        if _client is not None:
+            try:
+                _client.close()
+            except Exception:
+                pass
+        _client = None
+        _database = None
+        _last_failure = 0.0
@@ -1,6 +1,8 @@
+import re
 from datetime import datetime
 from mongo_config import get_database
-from pymongo import DESCENDING
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from bson import ObjectId
 
 # Import hash_password from local_db (or utils if moved, but currently in local_db)
 # We need to ensure we don't break if local_db is removed later, 
@@ -126,6 +128,30 @@ def save_analysis(user_id, analysis_type, image_path, results):
     except Exception as e:
         return False, f"Error saving analysis: {str(e)}"
 
+def save_analyses(analyses):
+    """Save several analyses with one insert_many round trip"""
+    if not analyses:
+        return True, 0
+
+    db = get_database()
+    if db is None:
+        return False, "Database connection failed"
+
+    now = datetime.utcnow()
+    docs = [{
+        "user_id": analysis["user_id"],
+        "timestamp": datetime.fromisoformat(analysis["timestamp"]) if analysis.get("timestamp") else now,
+        "analysis_type": analysis["analysis_type"],
+        "image_path": analysis.get("image_path"),
+        "results": analysis.get("results")
+    } for analysis in analyses]
+
+    try:
+        result = db.analyses.insert_many(docs, ordered=False)
+        return True, len(result.inserted_ids)
+    except Exception as e:
+        return False, f"Error saving analyses: {str(e)}"
+
 def get_user_analyses(user_id, limit=None):
     """Get user's analysis history"""
     db = get_database()
@@ -151,6 +177,104 @@ def get_user_analyses(user_id, limit=None):
         print(f"Error fetching analyses: {e}")
         return []
 
+def _history_query(user_id, analysis_type=None, since=None, until=None, plant_name=None):
+    """Query document for the history filters"""
+    query = {"user_id": user_id}
+    if analysis_type is not None:
+        query["analysis_type"] = analysis_type
+    if since is not None or until is not None:
+        query["timestamp"] = {}
+        if since is not None:
+            query["timestamp"]["$gte"] = datetime.fromisoformat(since)
+        if until is not None:
+            query["timestamp"]["$lt"] = datetime.fromisoformat(until)
+    if plant_name:
+        query["results.plant_info.name"] = {"$regex": re.escape(plant_name), "$options": "i"}
+    return query
+
+def get_user_analyses_page(user_id, limit=None, before=None, analysis_type=None,
+                           since=None, until=None, plant_name=None):
+    """Get one page of a user's analysis history, newest first (see local_db)"""
+    db = get_database()
+    if db is None:
+        return []
+
+    query = _history_query(user_id, analysis_type, since, until, plant_name)
+    if before is not None:
+        # Keyset: a range on the user_history_keyset index past the previous page
+        timestamp, last_id = datetime.fromisoformat(before[0]), ObjectId(before[1])
+        query["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": last_id}}
+        ]
+
+    try:
+        cursor = db.analyses.find(query).sort([("timestamp", DESCENDING), ("_id", DESCENDING)])
+        if limit:
+            cursor = cursor.limit(limit)
+
+        analyses = []
+        for doc in cursor:
+            doc['id'] = str(doc['_id'])
+            doc['timestamp'] = doc['timestamp'].isoformat()
+            del doc['_id']
+            analyses.append(doc)
+        return analyses
+    except Exception as e:
+        print(f"Error fetching analyses: {e}")
+        return []
+
+def count_user_analyses(user_id, analysis_type=None, since=None, until=None, plant_name=None):
+    """Count a user's analyses matching the history filters"""
+    db = get_database()
+    if db is None:
+        return 0
+
+    try:
+        return db.analyses.count_documents(_history_query(user_id, analysis_type, since, until, plant_name))
+    except Exception as e:
+        print(f"Error counting analyses: {e}")
+        return 0
+
+def get_analyses(analysis_type=None):
+    """Get every stored analysis across users, oldest first"""
+    db = get_database()
+    if db is None:
+        return []
+        
+    try:
+        query = {"analysis_type": analysis_type} if analysis_type else {}
+        analyses = []
+        for doc in db.analyses.find(query).sort("timestamp", ASCENDING):
+            doc['id'] = str(doc['_id'])
+            doc['timestamp'] = doc['timestamp'].isoformat()
+            del doc['_id']
+            analyses.append(doc)
+        return analyses
+    except Exception as e:
+        print(f"Error fetching analyses: {e}")
+        return []
+
+def update_analysis_results(updates):
+    """Replace the results of existing analyses (dict of analysis id -> results)"""
+    if not updates:
+        return 0
+    
+    db = get_database()
+    if db is None:
+        return 0
+        
+    try:
+        # One round trip for the whole batch
+        result = db.analyses.bulk_write([
+            UpdateOne({"_id": ObjectId(analysis_id)}, {"$set": {"results": results}})
+            for analysis_id, results in updates.items()
+        ], ordered=False)
+        return result.matched_count
+    except Exception as e:
+        print(f"Error updating analyses: {e}")
+        return 0
+
 def get_user_by_id(user_id):
     """Get user by ID (username)"""
     db = get_database()
@@ -0,0 +1,165 @@
+"""
+Pipeline timing module for PhytoSense application.
+Records wall and CPU time per stage of the plant analysis pipeline and keeps
+percentile aggregates across calls in process memory.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+# Timing is opt-in: pass collect_timings=True or set PHYTOSENSE_TIMINGS=1
+TIMINGS_ENABLED = os.environ.get("PHYTOSENSE_TIMINGS", "").lower() in ("1", "true", "yes")
+
+# Number of recent samples kept per stage for the aggregates
+MAX_SAMPLES_PER_STAGE = 1000
+
+_samples = {}
+_samples_lock = threading.Lock()
+
+class StageTimer:
+    """Collects wall and CPU time for the named stages of one pipeline run"""
+
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Time a block of code as a pipeline stage
+
+        Args:
+            name: Stage name (repeated names are accumulated)
+        """
+        wall_start = time.perf_counter()
+        # thread_time keeps CPU figures per request when sessions share a process
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            previous_wall, previous_cpu = self.stages.get(name, (0.0, 0.0))
+            self.stages[name] = (previous_wall + wall, previous_cpu + cpu)
+
+    def as_dict(self):
+        """
+        Get the timings of this run
+
+        Returns:
+            dict: 'stages' mapping stage name to wall_ms/cpu_ms, plus totals
+        """
+        stages = {
+            name: {"wall_ms": round(wall * 1000, 3), "cpu_ms": round(cpu * 1000, 3)}
+            for name, (wall, cpu) in self.stages.items()
+        }
+        return {
+            "stages": stages,
+            "total_wall_ms": round(sum(wall for wall, _ in self.stages.values()) * 1000, 3),
+            "total_cpu_ms": round(sum(cpu for _, cpu in self.stages.values()) * 1000, 3)
+        }
+
+    def record(self):
+        """Add this run's stage timings to the process-wide aggregates"""
+        with _samples_lock:
+            for name, sample in self.stages.items():
+                if name not in _samples:
+                    _samples[name] = deque(maxlen=MAX_SAMPLES_PER_STAGE)
+                _samples[name].append(sample)
+
+class _NullTimer:
+    """Stand-in used when timing is disabled"""
+
+    def stage(self, name):
+        return nullcontext()
+
+    def as_dict(self):
+        return None
+
+    def record(self):
+        pass
+
+NULL_TIMER = _NullTimer()
+
+def get_stage_timer(enabled=None):
+    """
+    Get a timer for one pipeline run
+
+    Args:
+        enabled: Whether to collect timings (defaults to TIMINGS_ENABLED)
+
+    Returns:
+        StageTimer or a no-op timer
+    """
+    if enabled is None:
+        enabled = TIMINGS_ENABLED
+    return StageTimer() if enabled else NULL_TIMER
+
+def _percentile(sorted_values, percent):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(percent / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[rank]
+
+def _summarize(values):
+    """Summary statistics in milliseconds"""
+    values = sorted(value * 1000 for value in values)
+    return {
+        "mean": round(sum(values) / len(values), 3),
+        "p50": round(_percentile(values, 50), 3),
+        "p90": round(_percentile(values, 90), 3),
+        "p95": round(_percentile(values, 95), 3),
+        "p99": round(_percentile(values, 99), 3),
+        "max": round(values[-1], 3)
+    }
+
+def get_timing_summary():
+    """
+    Get aggregated timings across all recorded pipeline runs
+
+    Returns:
+        dict: Stage name mapped to 'count', 'wall_ms' and 'cpu_ms' statistics
+    """
+    with _samples_lock:
+        snapshot = {name: list(samples) for name, samples in _samples.items()}
+
+    summary = {}
+    for name, samples in snapshot.items():
+        if not samples:
+            continue
+        summary[name] = {
+            "count": len(samples),
+            "wall_ms": _summarize([wall for wall, _ in samples]),
+            "cpu_ms": _summarize([cpu for _, cpu in samples])
+        }
+    return summary
+
+def dump_timings(path=None):
+    """
+    Dump the aggregated timings as JSON
+
+    Args:
+        path: Optional file to write the JSON to
+
+    Returns:
+        string: JSON document with the timing summary
+    """
+    document = json.dumps({
+        "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "stages": get_timing_summary()
+    }, indent=2)
+
+    if path:
+        with open(path, "w") as f:
+            f.write(document)
+
+    return document
+
+def reset_timings():
+    """Clear all aggregated timings"""
+    with _samples_lock:
+        _samples.clear()
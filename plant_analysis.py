@@ -1,10 +1,16 @@
+import os
 import time
-from image_processing import preprocess_image, extract_features
+from concurrent.futures import ProcessPoolExecutor
+from image_processing import preprocess_image, extract_features, detect_color_anomalies, analyze_leaf_shape, ImageContext, DEFAULT_PREPROCESS_BACKEND, load_image, scan_leaf_tiles, assess_image_quality
 from model_handler import identify_plant, detect_water_content, detect_diseases, detect_pests
 from maharashtra import get_local_recommendations
 from crop_database import get_crop_info, get_crop_disease_info, get_crop_pest_info, get_crop_deficiency_info
+from analysis_cache import get_analysis_cache, make_cache_key, PIPELINE_VERSION
+from pipeline_timing import get_stage_timer
 
-def enhanced_analysis(image, crop_type=None, plant_details=None):
+def enhanced_analysis(image, crop_type=None, plant_details=None, simulate_delay=True, use_cache=True,
+                      preprocess_backend=None, collect_timings=None, lesion_scan=False, full_resolution_image=None,
+                      quality_gate=True, multi_leaf=False, preprocessed_image=None):
     """
     Combined analysis function that integrates multiple forms of analysis
     
@@ -12,34 +18,114 @@ def enhanced_analysis(image, crop_type=None, plant_details=None):
         image: PIL Image object
         crop_type: Optional crop type override
         plant_details: Optional dictionary of user-provided details (symptoms, etc.)
+        simulate_delay: Whether to add the short artificial delay used by the UI
+        use_cache: Whether to reuse results of an identical earlier request
+        preprocess_backend: "pil" or "opencv" preprocessing (defaults to DEFAULT_PREPROCESS_BACKEND)
+        collect_timings: Whether to attach per-stage 'timings' to the results
+            (defaults to pipeline_timing.TIMINGS_ENABLED)
+        lesion_scan: Whether to run the tiled full-resolution lesion scan and
+            attach its summary as 'lesion_scan'
+        full_resolution_image: Optional undecimated version of the image to scan
+            (defaults to image)
+        quality_gate: Whether to reject blurry, badly exposed or plant-less
+            images before running the pipeline
+        multi_leaf: Whether to measure every leaf in the photo and attach the
+            per-leaf metrics and their distribution as 'leaf_shape'
+        preprocessed_image: Optional preprocess_image output for this image
+            (e.g. a tensor_store row), used instead of preprocessing again
         
     Returns:
-        dict: Combined analysis results
+        dict: Combined analysis results. Images failing the quality gate
+            return {'quality_rejected': True, 'quality': assessment} instead
     """
+    if preprocess_backend is None:
+        preprocess_backend = DEFAULT_PREPROCESS_BACKEND
+    
+    pipeline_version = f"{PIPELINE_VERSION}:{preprocess_backend}"
+    scan_image = image
+    if lesion_scan:
+        pipeline_version += ":lesion_scan"
+        if full_resolution_image is not None:
+            scan_image = full_resolution_image
+    if multi_leaf:
+        pipeline_version += ":multi_leaf"
+    
+    timer = get_stage_timer(collect_timings)
+    
+    # Cheap checks on a small downsample before any heavy work
+    quality = None
+    if quality_gate:
+        with timer.stage("quality_gate"):
+            quality = assess_image_quality(image)
+        if not quality["passed"]:
+            return _attach_timings({"quality_rejected": True, "quality": quality}, timer)
+    
+    # Return cached results for an identical image/crop/symptoms request
+    cache_key = None
+    if use_cache:
+        with timer.stage("cache_lookup"):
+            cache_key = make_cache_key(
+                scan_image,
+                crop_type=crop_type,
+                symptoms=plant_details.get("symptoms") if plant_details else None,
+                pipeline_version=pipeline_version
+            )
+            cached_results = get_analysis_cache().get(cache_key)
+        if cached_results is not None:
+            return _attach_timings(cached_results, timer)
+    
     # Preprocess image for analysis
-    processed_image = preprocess_image(image)
+    with timer.stage("preprocess"):
+        if preprocessed_image is not None:
+            processed_image = preprocessed_image
+        else:
+            processed_image = preprocess_image(image, backend=preprocess_backend)
+    
+    # Shared intermediate products (grayscale, HSV, plant mask, edges, ...)
+    # so that every detector below reuses the same OpenCV passes
+    with timer.stage("segmentation"):
+        image_context = ImageContext(processed_image)
+        # Build the plant mask up front so segmentation is timed as its own stage
+        image_context.mask
     
     # Extract features for custom analysis
-    features = extract_features(processed_image)
+    with timer.stage("features"):
+        features = extract_features(processed_image, image_context=image_context)
     
     # Advanced Image Analysis
-    from image_processing import detect_color_anomalies, analyze_leaf_shape
-    anomalies = detect_color_anomalies(processed_image)
-    shape_analysis = analyze_leaf_shape(processed_image)
+    with timer.stage("color_anomalies"):
+        anomalies = detect_color_anomalies(processed_image, image_context=image_context)
+    with timer.stage("leaf_shape"):
+        shape_analysis = analyze_leaf_shape(processed_image, image_context=image_context, multi_leaf=multi_leaf)
+    
+    # Scan the full-resolution image for spots that the downscaled image loses
+    lesion_summary = None
+    if lesion_scan:
+        with timer.stage("lesion_scan"):
+            lesion_summary = scan_leaf_tiles(scan_image)
+            # The full-size map is not JSON friendly; the score grid is its coarse form
+            lesion_summary.pop("lesion_map")
+        if lesion_summary["brown_spots"] and isinstance(anomalies, dict):
+            anomalies["brown_spots"] = True
+            anomalies["anomalies_detected"] = True
     
     # Build Analysis Context
     analysis_context = {
         "symptoms": plant_details.get("symptoms") if plant_details else None,
         "anomalies": anomalies,
-        "shape_analysis": shape_analysis
+        "shape_analysis": shape_analysis,
+        "image_context": image_context
     }
     
     # Simulate some processing time for a better user experience
-    time.sleep(0.5)
+    if simulate_delay:
+        with timer.stage("simulated_delay"):
+            time.sleep(0.5)
     
     # Identify the plant if crop_type is not specified
     if crop_type is None:
-        plant_info = identify_plant(processed_image, context=analysis_context)
+        with timer.stage("identify_plant"):
+            plant_info = identify_plant(processed_image, context=analysis_context)
         plant_name = plant_info["name"]
     else:
         # Use the provided crop type
@@ -51,82 +137,87 @@ def enhanced_analysis(image, crop_type=None, plant_details=None):
         }
     
     # Analyze water content with context
-    water_content = detect_water_content(processed_image, context=analysis_context)
+    with timer.stage("detect_water_content"):
+        water_content = detect_water_content(processed_image, context=analysis_context)
     
     # Detect diseases with context
-    diseases = detect_diseases(processed_image, plant_name, context=analysis_context)
+    with timer.stage("detect_diseases"):
+        diseases = detect_diseases(processed_image, plant_name, context=analysis_context)
     
     # Detect pests with context
-    pests = detect_pests(processed_image, context=analysis_context)
+    with timer.stage("detect_pests"):
+        pests = detect_pests(processed_image, context=analysis_context, plant_name=plant_name)
     
     # Get Maharashtra-specific recommendations
-    local_recommendations = get_local_recommendations(plant_name)
+    with timer.stage("local_recommendations"):
+        local_recommendations = get_local_recommendations(plant_name)
     
     # Get detailed crop information from database if available
-    crop_info = get_crop_info(plant_name)
-    if crop_info:
-        # Enhance plant info with database information
-        if "scientific_name" not in plant_info or not plant_info["scientific_name"]:
-            if "info" in crop_info and "scientific_name" in crop_info["info"]:
-                plant_info["scientific_name"] = crop_info["info"]["scientific_name"]
-        
-        # Add detailed crop information
-        crop_details = {
-            "varieties": crop_info["info"].get("varieties", []),
-            "best_season": crop_info["info"].get("best_season", ""),
-            "best_soil": crop_info["info"].get("best_soil", ""),
-            "time_period": crop_info["info"].get("time_period", "")
-        }
-        
-        # Get more detailed disease information if possible
-        detailed_diseases = []
-        if diseases and diseases.get("detected", False):
-            for disease in diseases.get("diseases", []):
-                disease_name = disease.get("name", "")
-                db_disease_info = get_crop_disease_info(plant_name, disease_name)
-                
-                if db_disease_info:
-                    # Get the first matching disease from the database
-                    db_disease_name, db_disease_data = next(iter(db_disease_info.items()))
-                    disease["detailed_info"] = {
-                        "symptoms": db_disease_data.get("symptoms", ""),
-                        "causes": db_disease_data.get("causes", ""),
-                        "treatment": db_disease_data.get("treatment", ""),
-                        "prevention": db_disease_data.get("prevention", "")
-                    }
-                
-                detailed_diseases.append(disease)
+    with timer.stage("crop_database"):
+        crop_info = get_crop_info(plant_name)
+        if crop_info:
+            # Enhance plant info with database information
+            if "scientific_name" not in plant_info or not plant_info["scientific_name"]:
+                if "info" in crop_info and "scientific_name" in crop_info["info"]:
+                    plant_info["scientific_name"] = crop_info["info"]["scientific_name"]
             
-            if detailed_diseases:
-                diseases["diseases"] = detailed_diseases
-        
-        # Get more detailed pest information if possible
-        detailed_pests = []
-        if pests and pests.get("detected", False):
-            for pest in pests.get("pests", []):
-                pest_name = pest.get("name", "")
-                db_pest_info = get_crop_pest_info(plant_name, pest_name)
+            # Add detailed crop information
+            crop_details = {
+                "varieties": crop_info["info"].get("varieties", []),
+                "best_season": crop_info["info"].get("best_season", ""),
+                "best_soil": crop_info["info"].get("best_soil", ""),
+                "time_period": crop_info["info"].get("time_period", "")
+            }
+            
+            # Get more detailed disease information if possible
+            detailed_diseases = []
+            if diseases and diseases.get("detected", False):
+                for disease in diseases.get("diseases", []):
+                    disease_name = disease.get("name", "")
+                    db_disease_info = get_crop_disease_info(plant_name, disease_name)
+                    
+                    if db_disease_info:
+                        # Get the first matching disease from the database
+                        db_disease_name, db_disease_data = next(iter(db_disease_info.items()))
+                        disease["detailed_info"] = {
+                            "symptoms": db_disease_data.get("symptoms", ""),
+                            "causes": db_disease_data.get("causes", ""),
+                            "treatment": db_disease_data.get("treatment", ""),
+                            "prevention": db_disease_data.get("prevention", "")
+                        }
+                    
+                    detailed_diseases.append(disease)
                 
-                if db_pest_info:
-                    # Get the first matching pest from the database
-                    db_pest_name, db_pest_data = next(iter(db_pest_info.items()))
-                    pest["detailed_info"] = {
-                        "symptoms": db_pest_data.get("symptoms", ""),
-                        "description": db_pest_data.get("description", ""),
-                        "treatment": db_pest_data.get("treatment", "")
-                    }
+                if detailed_diseases:
+                    diseases["diseases"] = detailed_diseases
+            
+            # Get more detailed pest information if possible
+            detailed_pests = []
+            if pests and pests.get("detected", False):
+                for pest in pests.get("pests", []):
+                    pest_name = pest.get("name", "")
+                    db_pest_info = get_crop_pest_info(plant_name, pest_name)
+                    
+                    if db_pest_info:
+                        # Get the first matching pest from the database
+                        db_pest_name, db_pest_data = next(iter(db_pest_info.items()))
+                        pest["detailed_info"] = {
+                            "symptoms": db_pest_data.get("symptoms", ""),
+                            "description": db_pest_data.get("description", ""),
+                            "treatment": db_pest_data.get("treatment", "")
+                        }
+                    
+                    detailed_pests.append(pest)
                 
-                detailed_pests.append(pest)
+                if detailed_pests:
+                    pests["pests"] = detailed_pests
             
-            if detailed_pests:
-                pests["pests"] = detailed_pests
+            # Get common deficiencies
+            deficiencies = get_crop_deficiency_info(plant_name)
+        else:
+            crop_details = {}
+            deficiencies = None
         
-        # Get common deficiencies
-        deficiencies = get_crop_deficiency_info(plant_name)
-    else:
-        crop_details = {}
-        deficiencies = None
-    
     # Combine all results
     analysis_results = {
         "plant_info": plant_info,
@@ -139,4 +230,116 @@ def enhanced_analysis(image, crop_type=None, plant_details=None):
         "deficiencies": deficiencies
     }
     
-    return analysis_results
\ No newline at end of file
+    if lesion_summary is not None:
+        analysis_results["lesion_scan"] = lesion_summary
+    
+    if multi_leaf:
+        analysis_results["leaf_shape"] = shape_analysis
+    
+    if quality is not None:
+        analysis_results["quality"] = quality
+    
+    if cache_key is not None:
+        get_analysis_cache().put(cache_key, analysis_results)
+    
+    return _attach_timings(analysis_results, timer)
+
+def _attach_timings(analysis_results, timer):
+    """
+    Attach the run's stage timings to the results and record them in the aggregates
+    
+    Args:
+        analysis_results: Combined analysis results
+        timer: StageTimer (or no-op timer) used for this run
+        
+    Returns:
+        dict: The results, with a 'timings' block when timing is enabled
+    """
+    timings = timer.as_dict()
+    if timings is not None:
+        timer.record()
+        analysis_results["timings"] = timings
+    return analysis_results
+
+def _init_batch_worker():
+    """Limit OpenCV to one thread per worker so processes don't oversubscribe cores"""
+    import cv2
+    cv2.setNumThreads(1)
+
+def _analyze_batch_item(item, crop_type, plant_details, use_cache=True):
+    """
+    Analyze a single batch item (runs inside a worker process)
+    
+    Args:
+        item: PIL Image object or path to an image file
+        crop_type: Optional crop type override
+        plant_details: Optional dictionary of user-provided details
+        use_cache: Whether to reuse cached analysis results
+        
+    Returns:
+        dict: Combined analysis results
+    """
+    if isinstance(item, (str, os.PathLike)):
+        with load_image(item) as image:
+            return enhanced_analysis(image, crop_type=crop_type, plant_details=plant_details,
+                                     simulate_delay=False, use_cache=use_cache)
+    return enhanced_analysis(item, crop_type=crop_type, plant_details=plant_details,
+                             simulate_delay=False, use_cache=use_cache)
+
+def batch_enhanced_analysis(images, crop_type=None, plant_details=None, max_workers=None, use_cache=True):
+    """
+    Run enhanced_analysis over many images using a process pool
+    
+    Args:
+        images: List of PIL Image objects and/or image file paths (e.g. files in uploads/)
+        crop_type: Optional crop type override applied to every image
+        plant_details: Optional dictionary of user-provided details applied to every image
+        max_workers: Number of worker processes (defaults to the CPU count; 1 runs in-process)
+        use_cache: Whether to reuse cached analysis results
+        
+    Returns:
+        list: One entry per input image, in input order. Each entry is a dict with
+            'index', 'source', 'success' and either 'results' or 'error'
+    """
+    images = list(images)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = max(1, min(max_workers, len(images) or 1))
+    
+    def describe(item):
+        return str(item) if isinstance(item, (str, os.PathLike)) else None
+    
+    batch_results = []
+    
+    if max_workers == 1:
+        # Run in-process (no pickling or worker start-up cost)
+        for index, item in enumerate(images):
+            entry = {"index": index, "source": describe(item)}
+            try:
+                entry["results"] = _analyze_batch_item(item, crop_type, plant_details, use_cache)
+                entry["success"] = True
+            except Exception as e:
+                entry["success"] = False
+                entry["error"] = f"{type(e).__name__}: {e}"
+            batch_results.append(entry)
+        return batch_results
+    
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_batch_worker) as executor:
+        futures = [
+            executor.submit(_analyze_batch_item, item, crop_type, plant_details, use_cache)
+            for item in images
+        ]
+        
+        # Collect in submission order so results line up with the inputs
+        for index, (item, future) in enumerate(zip(images, futures)):
+            entry = {"index": index, "source": describe(item)}
+            try:
+                entry["results"] = future.result()
+                entry["success"] = True
+            except Exception as e:
+                # A failing image is reported without aborting the rest of the batch
+                entry["success"] = False
+                entry["error"] = f"{type(e).__name__}: {e}"
+            batch_results.append(entry)
+    
+    return batch_results
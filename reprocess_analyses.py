@@ -0,0 +1,277 @@
+"""
+Reprocessing job for PhytoSense application.
+Re-runs enhanced_analysis over stored plant analyses whose results were
+produced by an older version of the detection rules, and writes the refreshed
+results back tagged with the current pipeline version.
+
+Work is spread over a low-priority process pool, submitted at a bounded rate
+so the live app keeps its CPU, and checkpointed after every batch of writes so
+an interrupted run resumes where it stopped.
+
+Usage:
+    python reprocess_analyses.py
+    python reprocess_analyses.py --workers 2 --rate 1 --limit 50
+    python reprocess_analyses.py --dry-run
+"""
+
+import os
+import json
+import time
+import tempfile
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from analysis_cache import PIPELINE_VERSION
+from plant_analysis import enhanced_analysis, _init_batch_worker
+from image_processing import load_image
+from recommendations import get_preventive_measures, get_fertilizer_recommendations
+
+# Checkpoints live next to the other local caches, one file per pipeline version
+CHECKPOINT_DIR = os.path.join("cache", "reprocess")
+
+# Defaults that keep the job in the background
+DEFAULT_NICE = 10         # Added to the workers' scheduling niceness
+DEFAULT_BATCH_SIZE = 20   # Results written (and checkpointed) together
+
+def default_workers():
+    """Half the CPUs, leaving the rest to the live app"""
+    return max(1, (os.cpu_count() or 1) // 2)
+
+def checkpoint_path(pipeline_version=PIPELINE_VERSION):
+    """Checkpoint file for a pipeline version"""
+    return os.path.join(CHECKPOINT_DIR, f"checkpoint-{pipeline_version}.json")
+
+def load_checkpoint(path):
+    """
+    Read a checkpoint
+
+    Args:
+        path: Checkpoint file path
+
+    Returns:
+        dict: 'done' (list of analysis IDs written) and 'failed' (ID -> error)
+    """
+    if not os.path.exists(path):
+        return {"done": [], "failed": {}}
+    try:
+        with open(path, "r") as f:
+            checkpoint = json.load(f)
+        return {"done": checkpoint.get("done", []), "failed": checkpoint.get("failed", {})}
+    except (IOError, ValueError) as e:
+        print(f"Error reading checkpoint {path}: {e}")
+        return {"done": [], "failed": {}}
+
+def save_checkpoint(path, checkpoint):
+    """Atomically replace a checkpoint"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(dict(checkpoint, updated_at=datetime.utcnow().isoformat()), f)
+    os.replace(tmp_path, path)
+
+def needs_reprocessing(analysis, pipeline_version=PIPELINE_VERSION, force=False):
+    """
+    Check whether a stored analysis is stale and can be rerun
+
+    Args:
+        analysis: Stored analysis record
+        pipeline_version: Current pipeline version
+        force: Whether analyses already at pipeline_version count as stale
+
+    Returns:
+        bool: True if it has an image on disk and was not produced by this pipeline version
+    """
+    image_path = analysis.get("image_path")
+    if not image_path or not os.path.exists(image_path):
+        return False
+    results = analysis.get("results") or {}
+    return force or results.get("pipeline_version") != pipeline_version
+
+def _init_reprocess_worker(nice):
+    """Lower the worker's priority and limit OpenCV threads"""
+    _init_batch_worker()
+    if nice:
+        try:
+            os.nice(nice)
+        except (AttributeError, OSError):
+            pass
+
+def reprocess_analysis(analysis, use_tensor_store=True):
+    """
+    Re-run the plant pipeline for one stored analysis (runs inside a worker process)
+
+    Args:
+        analysis: Stored analysis record with 'image_path' and 'results'
+        use_tensor_store: Whether to read the preprocessed image from the tensor store
+
+    Returns:
+        dict: New results in the shape the app stores in history
+    """
+    old_results = analysis.get("results") or {}
+    plant_details = old_results.get("plant_details") or {}
+
+    preprocessed_image = None
+    if use_tensor_store:
+        from tensor_store import get_tensor_store
+        preprocessed_image = get_tensor_store().get(analysis["image_path"])
+
+    with load_image(analysis["image_path"]) as image:
+        results = enhanced_analysis(
+            image,
+            crop_type=plant_details.get("crop_type"),
+            plant_details=plant_details,
+            simulate_delay=False,
+            use_cache=False,
+            # Keep every historical entry comparable to what was stored before
+            quality_gate=False,
+            preprocessed_image=preprocessed_image
+        )
+
+    plant_name = results["plant_info"]["name"]
+    return {
+        "plant_info": results["plant_info"],
+        "water_content": results["water_content"],
+        "diseases": results["diseases"],
+        "pests": results["pests"],
+        "preventive_measures": get_preventive_measures(plant_name, results["diseases"], results["pests"]),
+        "fertilizer_recommendations": get_fertilizer_recommendations(plant_name),
+        "plant_details": old_results.get("plant_details"),
+        "pipeline_version": PIPELINE_VERSION,
+        "reprocessed_at": datetime.utcnow().isoformat()
+    }
+
+def reprocess_analyses(workers=None, rate=None, limit=None, batch_size=DEFAULT_BATCH_SIZE,
+                       nice=DEFAULT_NICE, use_tensor_store=True, force=False, dry_run=False,
+                       checkpoint_file=None):
+    """
+    Reprocess stale plant analyses
+
+    Args:
+        workers: Number of worker processes (defaults to half the CPUs)
+        rate: Optional maximum number of analyses started per second
+        limit: Optional maximum number of analyses to reprocess in this run
+        batch_size: Number of results written to the database per batch
+        nice: Niceness added to the worker processes
+        use_tensor_store: Whether to preprocess each image once into the tensor store
+        force: Whether to rerun analyses already at the current pipeline version
+        dry_run: Only report what would be reprocessed
+        checkpoint_file: Checkpoint path (defaults to one per pipeline version)
+
+    Returns:
+        dict: Counts of 'pending', 'updated' and 'failed' analyses
+    """
+    # Imported here so workers never open database connections
+    from db_adapter import get_analyses, update_analysis_results
+
+    checkpoint_file = checkpoint_file or checkpoint_path()
+    checkpoint = load_checkpoint(checkpoint_file)
+    finished = {str(analysis_id) for analysis_id in checkpoint["done"]} | set(checkpoint["failed"])
+
+    pending = [
+        analysis for analysis in get_analyses("plant")
+        if str(analysis["id"]) not in finished and needs_reprocessing(analysis, force=force)
+    ]
+    if limit:
+        pending = pending[:limit]
+
+    summary = {"pending": len(pending), "updated": 0, "failed": 0}
+    print(f"Pipeline version {PIPELINE_VERSION}: {len(pending)} analyses to reprocess")
+    if dry_run or not pending:
+        return summary
+
+    if use_tensor_store:
+        # Single writer: fill the store here, workers only read it
+        from tensor_store import get_tensor_store
+        get_tensor_store().add_many(sorted({analysis["image_path"] for analysis in pending}))
+
+    workers = max(1, min(workers or default_workers(), len(pending)))
+    min_interval = 1.0 / rate if rate else 0.0
+    updates = {}
+    new_failures = []
+
+    def flush():
+        if not updates and not new_failures:
+            return
+        if updates:
+            summary["updated"] += update_analysis_results(updates)
+            # IDs are checkpointed only after their results are stored
+            checkpoint["done"].extend(str(analysis_id) for analysis_id in updates)
+        save_checkpoint(checkpoint_file, checkpoint)
+        updates.clear()
+        new_failures.clear()
+
+    queue = iter(pending)
+    in_flight = {}
+    last_submit = 0.0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_reprocess_worker,
+                             initargs=(nice,)) as executor:
+        try:
+            while True:
+                # Keep at most two tasks per worker queued, started no faster than rate
+                while len(in_flight) < workers * 2:
+                    analysis = next(queue, None)
+                    if analysis is None:
+                        break
+                    wait_time = last_submit + min_interval - time.monotonic()
+                    if wait_time > 0:
+                        time.sleep(wait_time)
+                    last_submit = time.monotonic()
+                    in_flight[executor.submit(reprocess_analysis, analysis, use_tensor_store)] = analysis
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    analysis = in_flight.pop(future)
+                    try:
+                        updates[analysis["id"]] = future.result()
+                    except Exception as e:
+                        # A broken image is recorded and skipped on resume
+                        summary["failed"] += 1
+                        checkpoint["failed"][str(analysis["id"])] = f"{type(e).__name__}: {e}"
+                        new_failures.append(analysis["id"])
+                        print(f"Error reprocessing analysis {analysis['id']}: {e}")
+
+                if len(updates) + len(new_failures) >= batch_size:
+                    flush()
+                    print(f"Reprocessed {summary['updated']}/{len(pending)}")
+        except KeyboardInterrupt:
+            print("Interrupted; saving progress")
+            for future in in_flight:
+                future.cancel()
+        finally:
+            flush()
+
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprocess stored plant analyses with the current pipeline")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: half the CPUs)")
+    parser.add_argument("--rate", type=float, default=None, help="Maximum analyses started per second")
+    parser.add_argument("--limit", type=int, default=None, help="Maximum analyses to reprocess in this run")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Results written per batch")
+    parser.add_argument("--nice", type=int, default=DEFAULT_NICE, help="Niceness added to the workers")
+    parser.add_argument("--no-tensor-store", action="store_true", help="Preprocess images in the workers")
+    parser.add_argument("--force", action="store_true", help="Also rerun analyses already at this version")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: one per pipeline version)")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the analyses to reprocess")
+    args = parser.parse_args()
+
+    summary = reprocess_analyses(
+        workers=args.workers,
+        rate=args.rate,
+        limit=args.limit,
+        batch_size=args.batch_size,
+        nice=args.nice,
+        use_tensor_store=not args.no_tensor_store,
+        force=args.force,
+        dry_run=args.dry_run,
+        checkpoint_file=args.checkpoint
+    )
+    print(f"Updated {summary['updated']}, failed {summary['failed']}, pending {summary['pending']}")
+
+if __name__ == "__main__":
+    main()
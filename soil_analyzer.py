@@ -1,14 +1,46 @@
-import numpy as np
+import os
+import json
 import random
+from types import MappingProxyType
+
+import numpy as np
+import cv2
+from PIL import Image
 from model import SOIL_CLASSES
 
-def analyze_soil(model, image):
+# Data file with the soil knowledge table (characteristics, crop suitability,
+# recommendations and properties per soil type)
+SOIL_KNOWLEDGE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "soil_knowledge.json")
+
+# Sections available for each soil type
+SOIL_SECTIONS = ("characteristics", "suitability", "recommendations", "properties")
+
+# Side length soil photos are reduced to before batch classification
+SOIL_SAMPLE_SIZE = 64
+
+# Returned for soil types missing from the table
+DEFAULT_SOIL_DETAILS = {
+    "characteristics": "Information not available for this soil type.",
+    "suitability": {
+        "onion": "Information not available.",
+        "tomato": "Information not available."
+    },
+    "recommendations": "Specific recommendations not available for this soil type.",
+    "properties": {
+        "ph": "Unknown",
+        "organic_matter": "Unknown",
+        "drainage": "Unknown"
+    }
+}
+
+def analyze_soil(model, image, sections=None):
     """
     Analyze soil from an image
     
     Args:
         model: Loaded soil analysis model
         image: Preprocessed image as numpy array
+        sections: Optional soil knowledge sections to include (defaults to all)
         
     Returns:
         Dictionary containing soil analysis results
@@ -16,9 +48,11 @@ def analyze_soil(model, image):
     # In a real system, we would use the model for inference
     # For now, we'll simulate predictions based on image characteristics
     
+    # The colour rules work on 0..1 values; uint8 images are scaled first
+    image = _normalize_soil_image(image)
+    
     # Calculate color features
     avg_color = np.mean(image, axis=(0, 1))
-    r, g, b = avg_color[0], avg_color[1], avg_color[2]
     
     # Calculate texture features (simplistic approach)
     std_color = np.std(image, axis=(0, 1))
@@ -26,18 +60,7 @@ def analyze_soil(model, image):
     
     # Simulate soil type prediction based on color and texture
     # This is just for demonstration - a real system would use the trained model
-    
-    # Use simplified rules for soil type classification
-    if r > 0.6 and g < 0.4:  # Reddish
-        soil_type_index = 1  # Red Soil
-    elif r > 0.4 and g > 0.4 and b < 0.3:  # Brownish-yellow
-        soil_type_index = 3  # Alluvial Soil
-    elif r < 0.3 and g < 0.3 and b < 0.3:  # Dark
-        soil_type_index = 0  # Black Soil
-    elif r > 0.5 and g > 0.5 and b > 0.4:  # Light colored
-        soil_type_index = 4  # Coastal Sandy Soil
-    else:  # Other
-        soil_type_index = 2  # Laterite Soil
+    soil_type_index = int(_classify_soil_colors(avg_color[np.newaxis, :3])[0])
     
     # Add some randomness for demonstration
     if random.random() < 0.3:
@@ -46,217 +69,202 @@ def analyze_soil(model, image):
     soil_type = SOIL_CLASSES[soil_type_index]
     
     # Process soil analysis based on predicted soil type
-    return get_soil_details(soil_type)
+    return get_soil_sections(soil_type, sections)
 
-def get_soil_details(soil_type):
+def _normalize_soil_image(image):
     """
-    Get detailed information about a soil type
+    Convert a soil image to a float array with values in 0..1
     
     Args:
-        soil_type: String indicating soil type
+        image: PIL Image or numpy array (uint8 0..255 or float 0..1)
         
     Returns:
-        Dictionary containing detailed soil information
+        numpy.ndarray: float32 array
     """
-    soil_details = {
-        "Black Soil": {
-            "characteristics": """
-            - High clay content (30-80%)
-            - Good water retention capacity
-            - Rich in calcium, magnesium, potassium, and lime
-            - Poor drainage when wet
-            - Deep cracks when dry
-            - pH range: 7.5-8.5 (slightly alkaline)
-            """,
-            "suitability": {
-                "onion": "Excellent for onion cultivation with proper drainage. Rich in nutrients required for bulb development.",
-                "tomato": "Good for tomato cultivation, but may need drainage improvements and pH adjustment."
-            },
-            "recommendations": """
-            ### Recommendations for Black Soil:
-            
-            1. **Drainage Management:**
-               - Create raised beds to improve drainage
-               - Add organic matter to improve soil structure
-               - Implement drip irrigation to control water distribution
-            
-            2. **Soil Amendments:**
-               - Add gypsum (500 kg/ha) to improve soil structure
-               - Incorporate well-decomposed FYM (15-20 tonnes/ha)
-               - Apply sulfur if pH is above 8.0
-            
-            3. **Crop-Specific Recommendations:**
-               - **For Onions:** Add phosphorus-rich fertilizers before planting
-               - **For Tomatoes:** Adjust pH using elemental sulfur if necessary
-            """,
-            "properties": {
-                "ph": "7.8",
-                "organic_matter": "Medium",
-                "drainage": "Poor to Moderate"
-            }
-        },
-        
-        "Red Soil": {
-            "characteristics": """
-            - Sandy to loamy texture
-            - Low water retention capacity
-            - Rich in iron oxides (gives red color)
-            - Low organic matter content
-            - Good drainage
-            - pH range: 5.5-6.8 (slightly acidic)
-            """,
-            "suitability": {
-                "onion": "Moderately suitable for onions. Requires additional organic matter and regular irrigation.",
-                "tomato": "Well-suited for tomatoes with proper fertilization and irrigation management."
-            },
-            "recommendations": """
-            ### Recommendations for Red Soil:
-            
-            1. **Organic Matter Enhancement:**
-               - Add compost or well-rotted manure (20-25 tonnes/ha)
-               - Implement green manuring practices
-               - Use mulching to conserve soil moisture
-            
-            2. **Nutrient Management:**
-               - Apply balanced NPK fertilizers
-               - Incorporate micronutrient mixtures containing zinc, boron, and manganese
-               - Use split application of nitrogen fertilizers
-            
-            3. **Crop-Specific Recommendations:**
-               - **For Onions:** Ensure regular water supply and add potassium fertilizers
-               - **For Tomatoes:** Apply calcium-rich amendments to prevent blossom end rot
-            """,
-            "properties": {
-                "ph": "6.2",
-                "organic_matter": "Low",
-                "drainage": "Good"
-            }
-        },
-        
-        "Laterite Soil": {
-            "characteristics": """
-            - Highly weathered soil with sesquioxides
-            - Poor in organic matter and nutrients
-            - Porous and well-drained
-            - High iron and aluminum content
-            - Acidic in nature
-            - pH range: 4.5-6.0 (acidic)
-            """,
-            "suitability": {
-                "onion": "Poor suitability for onions. Requires significant soil amendments and pH correction.",
-                "tomato": "Moderate suitability with proper liming and nutrient management."
-            },
-            "recommendations": """
-            ### Recommendations for Laterite Soil:
-            
-            1. **pH Correction:**
-               - Apply agricultural lime (1-2 tonnes/ha)
-               - Use dolomitic lime for magnesium supplementation
-               - Retest soil pH after 3-4 months
-            
-            2. **Fertility Enhancement:**
-               - Incorporate high rates of organic matter (25-30 tonnes/ha)
-               - Apply rock phosphate for slow phosphorus release
-               - Use balanced NPK fertilizers with micronutrients
-            
-            3. **Crop-Specific Recommendations:**
-               - **For Onions:** Create raised beds with amended soil mixture
-               - **For Tomatoes:** Apply vermicompost and use mulching
-            """,
-            "properties": {
-                "ph": "5.3",
-                "organic_matter": "Very Low",
-                "drainage": "Excessive"
-            }
-        },
+    img_array = np.asarray(image)
+    if img_array.dtype == np.uint8 or img_array.max(initial=0) > 1.0:
+        return img_array.astype(np.float32) / 255.0
+    return img_array.astype(np.float32)
+
+def _classify_soil_colors(mean_colors):
+    """
+    Apply the soil colour rules to many samples at once
+    
+    Args:
+        mean_colors: Array of shape (n_samples, 3) with mean RGB values in 0..1
         
-        "Alluvial Soil": {
-            "characteristics": """
-            - Deposited by rivers and streams
-            - Varying texture (sandy to clayey)
-            - Rich in potash and lime
-            - Good fertility and moisture retention
-            - Moderate to good drainage
-            - pH range: 6.5-7.5 (neutral)
-            """,
-            "suitability": {
-                "onion": "Excellent for onion cultivation. Naturally fertile with good physical properties.",
-                "tomato": "Highly suitable for tomatoes with minimal amendments required."
-            },
-            "recommendations": """
-            ### Recommendations for Alluvial Soil:
-            
-            1. **Maintenance Practices:**
-               - Add organic matter annually (10-15 tonnes/ha)
-               - Implement crop rotation with legumes
-               - Use conservation tillage practices
-            
-            2. **Nutrient Management:**
-               - Apply balanced fertilizers based on soil test results
-               - Use micronutrient supplements if deficiency symptoms appear
-               - Implement split application of nitrogen
-            
-            3. **Crop-Specific Recommendations:**
-               - **For Onions:** Regular but controlled irrigation to prevent disease
-               - **For Tomatoes:** Stake plants and maintain optimal spacing
-            """,
-            "properties": {
-                "ph": "7.0",
-                "organic_matter": "Medium to High",
-                "drainage": "Good"
-            }
-        },
+    Returns:
+        numpy.ndarray: SOIL_CLASSES index per sample
+    """
+    r, g, b = mean_colors[:, 0], mean_colors[:, 1], mean_colors[:, 2]
+    # The first matching rule wins, as in an if/elif chain
+    return np.select(
+        [
+            (r > 0.6) & (g < 0.4),                # Reddish -> Red Soil
+            (r > 0.4) & (g > 0.4) & (b < 0.3),    # Brownish-yellow -> Alluvial Soil
+            (r < 0.3) & (g < 0.3) & (b < 0.3),    # Dark -> Black Soil
+            (r > 0.5) & (g > 0.5) & (b > 0.4)     # Light colored -> Coastal Sandy Soil
+        ],
+        [1, 3, 0, 4],
+        default=2                                 # Other -> Laterite Soil
+    )
+
+def _soil_sample_array(image):
+    """Load and reduce one soil photo to a SOIL_SAMPLE_SIZE square RGB uint8 array"""
+    if isinstance(image, (str, os.PathLike)) or hasattr(image, "read"):
+        with Image.open(image) as opened:
+            opened.draft("RGB", (SOIL_SAMPLE_SIZE, SOIL_SAMPLE_SIZE))
+            image = opened.convert("RGB")
+    elif isinstance(image, Image.Image):
+        image = image.convert("RGB")
+    
+    img_array = np.asarray(image)
+    if img_array.dtype != np.uint8:
+        img_array = (_normalize_soil_image(img_array) * 255).astype(np.uint8)
+    if len(img_array.shape) == 2:
+        img_array = cv2.cvtColor(img_array, cv2.COLOR_GRAY2RGB)
+    elif img_array.shape[2] == 4:
+        img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
+    
+    # Colour and texture statistics don't depend on the aspect ratio, so squash to a square
+    return cv2.resize(img_array, (SOIL_SAMPLE_SIZE, SOIL_SAMPLE_SIZE), interpolation=cv2.INTER_AREA)
+
+def classify_soil_batch(images, sections=None):
+    """
+    Classify many soil photos (e.g. a farm survey) in one vectorized pass
+    
+    Every photo is reduced to SOIL_SAMPLE_SIZE and stacked into one array, the
+    colour and texture statistics are computed for the whole stack at once and
+    the colour rules classify all samples together. Unlike analyze_soil there
+    is no random reassignment, so the same photos always give the same result.
+    
+    Args:
+        images: List of PIL Images, numpy arrays, image file paths and/or
+            file-like objects (e.g. Streamlit uploads)
+        sections: Optional soil knowledge sections for the majority soil type
+            (defaults to all; pass an empty tuple to skip)
         
-        "Coastal Sandy Soil": {
-            "characteristics": """
-            - High sand content (>70%)
-            - Very low water retention
-            - Poor in organic matter and nutrients
-            - Excellent drainage (often excessive)
-            - May have salinity issues
-            - pH range: 7.0-8.5 (neutral to alkaline)
-            """,
-            "suitability": {
-                "onion": "Poor suitability for onions without significant amendments. Requires intensive management.",
-                "tomato": "Moderate suitability with irrigation, mulching, and nutrient management."
-            },
-            "recommendations": """
-            ### Recommendations for Coastal Sandy Soil:
-            
-            1. **Water Management:**
-               - Install drip irrigation systems
-               - Use mulching extensively to conserve moisture
-               - Apply hydrogels for improving water retention
-            
-            2. **Soil Improvement:**
-               - Add clay or silt-rich soil to improve texture
-               - Incorporate very high rates of organic matter (30-40 tonnes/ha)
-               - Use cocopeat or vermiculite as soil amendments
-            
-            3. **Crop-Specific Recommendations:**
-               - **For Onions:** Consider container or raised bed cultivation
-               - **For Tomatoes:** Use salt-tolerant varieties and mulching
-            """,
-            "properties": {
-                "ph": "7.7",
-                "organic_matter": "Very Low",
-                "drainage": "Excessive"
-            }
+    Returns:
+        Dictionary with per-sample results in 'samples' and the farm-level
+        'aggregate' (majority soil type, distribution and spread)
+    """
+    if not images:
+        return {"samples": [], "aggregate": None}
+    
+    batch = np.stack([_soil_sample_array(image) for image in images]).astype(np.float64) / 255.0
+    
+    # Colour and texture statistics for the whole batch
+    mean_colors = batch.mean(axis=(1, 2))                 # (n, 3)
+    std_colors = batch.std(axis=(1, 2))                   # (n, 3)
+    texture = std_colors.mean(axis=1)                     # (n,)
+    soil_indices = _classify_soil_colors(mean_colors)
+    
+    samples = [
+        {
+            "index": i,
+            "soil_type": SOIL_CLASSES[soil_indices[i]],
+            "mean_color": mean_colors[i].round(4).tolist(),
+            "texture": round(float(texture[i]), 4)
         }
+        for i in range(len(images))
+    ]
+    
+    # Farm-level aggregate
+    counts = np.bincount(soil_indices, minlength=len(SOIL_CLASSES))
+    majority_index = int(np.argmax(counts))
+    majority_type = SOIL_CLASSES[majority_index]
+    distribution = {
+        SOIL_CLASSES[i]: int(count) for i, count in enumerate(counts) if count
     }
     
-    # Return details for the specific soil type or a default message
-    return soil_details.get(soil_type, {
-        "soil_type": soil_type,
-        "characteristics": "Information not available for this soil type.",
-        "suitability": {
-            "onion": "Information not available.",
-            "tomato": "Information not available."
-        },
-        "recommendations": "Specific recommendations not available for this soil type.",
-        "properties": {
-            "ph": "Unknown",
-            "organic_matter": "Unknown",
-            "drainage": "Unknown"
-        }
-    })
\ No newline at end of file
+    aggregate = {
+        "sample_count": len(samples),
+        "majority_soil_type": majority_type,
+        "agreement": round(float(counts[majority_index] / len(samples)), 4),
+        "distribution": distribution,
+        "distinct_soil_types": len(distribution),
+        "mean_color": mean_colors.mean(axis=0).round(4).tolist(),
+        # How much the samples differ from each other in colour and texture
+        "color_spread": mean_colors.std(axis=0).round(4).tolist(),
+        "texture_spread": round(float(texture.std()), 4)
+    }
+    if sections is None or sections:
+        aggregate["details"] = get_soil_sections(majority_type, sections)
+    
+    return {"samples": samples, "aggregate": aggregate}
+
+def _freeze(value):
+    """Recursively wrap dicts in read-only mappings and lists in tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+def _thaw(value):
+    """Recursively copy a frozen value back into plain dicts and lists"""
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+def load_soil_knowledge(path=SOIL_KNOWLEDGE_FILE):
+    """
+    Load the soil knowledge table from a JSON data file
+    
+    Args:
+        path: Path to the data file
+        
+    Returns:
+        Read-only mapping of soil type to its sections
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            soil_types = json.load(f)["soil_types"]
+    except (FileNotFoundError, IOError, KeyError, json.JSONDecodeError) as e:
+        print(f"Error loading soil knowledge from {path}: {e}")
+        soil_types = {}
+    return _freeze(soil_types)
+
+# Built once at import and shared read-only by every session
+SOIL_KNOWLEDGE = load_soil_knowledge()
+_DEFAULT_SOIL_DETAILS = _freeze(DEFAULT_SOIL_DETAILS)
+
+def get_soil_sections(soil_type, sections=None, crops=None):
+    """
+    Get selected sections of the soil knowledge for a soil type
+    
+    Args:
+        soil_type: String indicating soil type
+        sections: Sections to include (defaults to all of SOIL_SECTIONS)
+        crops: Optional crop names to limit 'suitability' to
+        
+    Returns:
+        Dictionary with 'soil_type' and the requested sections (a fresh copy
+        the caller may modify)
+    """
+    entry = SOIL_KNOWLEDGE.get(soil_type, _DEFAULT_SOIL_DETAILS)
+    
+    result = {"soil_type": soil_type}
+    for section in sections or SOIL_SECTIONS:
+        if section not in entry:
+            continue
+        if section == "suitability" and crops is not None:
+            wanted = {crop.lower() for crop in crops}
+            result[section] = {crop: text for crop, text in entry[section].items() if crop in wanted}
+        else:
+            result[section] = _thaw(entry[section])
+    return result
+
+def get_soil_details(soil_type):
+    """
+    Get detailed information about a soil type
+    
+    Args:
+        soil_type: String indicating soil type
+        
+    Returns:
+        Dictionary containing detailed soil information
+    """
+    return get_soil_sections(soil_type)
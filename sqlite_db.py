@@ -0,0 +1,378 @@
+"""
+SQLite database backend for PhytoSense application.
+Implements the same functions as local_db and mongo_db on a single SQLite
+file, for deployments without a database server. The database runs in WAL
+mode so history reads proceed while an analysis is being saved, and analysis
+history is served (and keyset-paginated) from an index on
+(user_id, timestamp DESC, id DESC).
+
+As in local_db, the username is the user ID.
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+# Database file, set SQLITE_DB_PATH to enable this backend in db_adapter
+DB_PATH = os.environ.get('SQLITE_DB_PATH', 'phytosense.db')
+
+# Milliseconds a writer waits for another writer's lock before failing
+BUSY_TIMEOUT_MS = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    email TEXT,
+    farm_location TEXT,
+    profile_complete INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS profiles (
+    user_id TEXT PRIMARY KEY REFERENCES users(username) ON DELETE CASCADE,
+    data BLOB NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    analysis_type TEXT NOT NULL,
+    image_path TEXT,
+    results BLOB
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_user_history ON analyses (user_id, timestamp DESC, id DESC);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    username TEXT NOT NULL,
+    expires_at TEXT NOT NULL
+);
+"""
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = set()
+
+def get_connection(db_path=None):
+    """
+    Get this thread's connection, creating the schema on first use
+
+    Args:
+        db_path: Optional database file (defaults to DB_PATH)
+
+    Returns:
+        sqlite3.Connection: Connection in WAL mode with rows as sqlite3.Row
+    """
+    db_path = db_path or DB_PATH
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        # NORMAL is durable in WAL mode except for the last commits on power loss
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA foreign_keys=ON')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        with _schema_lock:
+            if db_path not in _schema_ready:
+                conn.executescript(SCHEMA)
+                _schema_ready.add(db_path)
+        connections[db_path] = conn
+    return conn
+
+def _encode(data):
+    """Serialize a JSON document for a BLOB column"""
+    return json.dumps(data, separators=(',', ':'), default=str).encode('utf-8')
+
+def _decode(blob):
+    """Deserialize a BLOB column"""
+    return json.loads(blob) if blob is not None else None
+
+def _analysis_from_row(row):
+    return {
+        'id': row['id'],
+        'user_id': row['user_id'],
+        'timestamp': row['timestamp'],
+        'analysis_type': row['analysis_type'],
+        'image_path': row['image_path'],
+        'results': _decode(row['results'])
+    }
+
+def _user_from_row(row):
+    return {
+        'id': row['username'],
+        'username': row['username'],
+        'farm_location': row['farm_location'],
+        'profile_complete': bool(row['profile_complete'])
+    }
+
+def hash_password(password):
+    """Create a hash of a password"""
+    return hashlib.sha256(password.encode('utf-8')).hexdigest()
+
+def save_session(username):
+    """Save active session"""
+    expires_at = (datetime.utcnow() + timedelta(days=2)).isoformat()
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO sessions (id, username, expires_at) VALUES (1, ?, ?)',
+            (username, expires_at)
+        )
+
+def get_active_session():
+    """Get active session if valid"""
+    conn = get_connection()
+    row = conn.execute('SELECT username, expires_at FROM sessions WHERE id = 1').fetchone()
+    if row is None:
+        return None
+
+    if datetime.utcnow() > datetime.fromisoformat(row['expires_at']):
+        clear_session()
+        return None
+
+    return row['username']
+
+def clear_session():
+    """Clear active session"""
+    conn = get_connection()
+    with conn:
+        conn.execute('DELETE FROM sessions')
+
+def create_user(username, password, email=None, farm_location=None):
+    """Create a new user with farm location"""
+    now = datetime.utcnow().isoformat()
+    conn = get_connection()
+    try:
+        with conn:
+            conn.execute(
+                'INSERT INTO users (username, password, email, farm_location, profile_complete, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, 0, ?, ?)',
+                (username, hash_password(password), email, farm_location, now, now)
+            )
+        return True, "User created successfully"
+    except sqlite3.IntegrityError:
+        return False, "Username already exists"
+    except sqlite3.Error as e:
+        return False, f"Error creating user: {str(e)}"
+
+def verify_user(username, password):
+    """Verify user credentials"""
+    conn = get_connection()
+    row = conn.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
+    if row is None or row['password'] != hash_password(password):
+        return None
+    return _user_from_row(row)
+
+def update_user_profile(user_id, profile_data):
+    """Update user profile"""
+    now = datetime.utcnow().isoformat()
+    conn = get_connection()
+    try:
+        with conn:
+            if 'farm_location' in profile_data:
+                cursor = conn.execute(
+                    'UPDATE users SET farm_location = ?, profile_complete = 1, updated_at = ? WHERE username = ?',
+                    (profile_data['farm_location'], now, user_id)
+                )
+            else:
+                cursor = conn.execute(
+                    'UPDATE users SET profile_complete = 1, updated_at = ? WHERE username = ?',
+                    (now, user_id)
+                )
+            if cursor.rowcount == 0:
+                return False, "User not found"
+
+            conn.execute(
+                'INSERT OR REPLACE INTO profiles (user_id, data, updated_at) VALUES (?, ?, ?)',
+                (user_id, _encode(dict(profile_data, updated_at=now)), now)
+            )
+        return True, "Profile updated successfully"
+    except sqlite3.Error as e:
+        return False, f"Error updating profile: {str(e)}"
+
+def save_analysis(user_id, analysis_type, image_path, results):
+    """Save analysis results"""
+    conn = get_connection()
+    try:
+        with conn:
+            cursor = conn.execute(
+                'INSERT INTO analyses (user_id, timestamp, analysis_type, image_path, results) VALUES (?, ?, ?, ?, ?)',
+                (user_id, datetime.utcnow().isoformat(), analysis_type, image_path, _encode(results))
+            )
+        return True, cursor.lastrowid
+    except sqlite3.Error as e:
+        return False, f"Error saving analysis: {str(e)}"
+
+def save_analyses(analyses):
+    """Save several analyses in one transaction"""
+    now = datetime.utcnow().isoformat()
+    rows = [
+        (analysis['user_id'], analysis.get('timestamp') or now, analysis['analysis_type'],
+         analysis.get('image_path'), _encode(analysis.get('results')))
+        for analysis in analyses
+    ]
+    conn = get_connection()
+    try:
+        with conn:
+            conn.executemany(
+                'INSERT INTO analyses (user_id, timestamp, analysis_type, image_path, results) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+        return True, len(rows)
+    except sqlite3.Error as e:
+        return False, f"Error saving analyses: {str(e)}"
+
+def get_user_analyses(user_id, limit=None):
+    """Get user's analysis history"""
+    conn = get_connection()
+    # Served from idx_analyses_user_history, already in newest-first order
+    query = 'SELECT * FROM analyses WHERE user_id = ? ORDER BY timestamp DESC'
+    params = [user_id]
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+    return [_analysis_from_row(row) for row in conn.execute(query, params)]
+
+def _history_filters(user_id, analysis_type=None, since=None, until=None, plant_name=None):
+    """WHERE clause and parameters for the history filters"""
+    clauses = ['user_id = ?']
+    params = [user_id]
+    if analysis_type is not None:
+        clauses.append('analysis_type = ?')
+        params.append(analysis_type)
+    if since is not None:
+        clauses.append('timestamp >= ?')
+        params.append(since)
+    if until is not None:
+        clauses.append('timestamp < ?')
+        params.append(until)
+    if plant_name:
+        # LIKE is case-insensitive for ASCII; escape the user's wildcards
+        pattern = plant_name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        clauses.append("json_extract(CAST(results AS TEXT), '$.plant_info.name') LIKE ? ESCAPE '\\'")
+        params.append(f'%{pattern}%')
+    return ' AND '.join(clauses), params
+
+def get_user_analyses_page(user_id, limit=None, before=None, analysis_type=None,
+                           since=None, until=None, plant_name=None):
+    """Get one page of a user's analysis history, newest first (see local_db)"""
+    where, params = _history_filters(user_id, analysis_type, since, until, plant_name)
+    if before is not None:
+        # Keyset: seek past the last row of the previous page through the index
+        where += ' AND (timestamp, id) < (?, ?)'
+        params += [before[0], int(before[1])]
+    query = f'SELECT * FROM analyses WHERE {where} ORDER BY timestamp DESC, id DESC'
+    if limit is not None:
+        query += ' LIMIT ?'
+        params.append(limit)
+    conn = get_connection()
+    return [_analysis_from_row(row) for row in conn.execute(query, params)]
+
+def count_user_analyses(user_id, analysis_type=None, since=None, until=None, plant_name=None):
+    """Count a user's analyses matching the history filters"""
+    where, params = _history_filters(user_id, analysis_type, since, until, plant_name)
+    conn = get_connection()
+    return conn.execute(f'SELECT COUNT(*) FROM analyses WHERE {where}', params).fetchone()[0]
+
+def get_analyses(analysis_type=None):
+    """Get every stored analysis across users, oldest first"""
+    conn = get_connection()
+    if analysis_type is not None:
+        rows = conn.execute('SELECT * FROM analyses WHERE analysis_type = ? ORDER BY id', (analysis_type,))
+    else:
+        rows = conn.execute('SELECT * FROM analyses ORDER BY id')
+    return [_analysis_from_row(row) for row in rows]
+
+def update_analysis_results(updates):
+    """Replace the results of existing analyses (dict of analysis id -> results)"""
+    if not updates:
+        return 0
+
+    conn = get_connection()
+    try:
+        with conn:
+            cursor = conn.executemany(
+                'UPDATE analyses SET results = ? WHERE id = ?',
+                [(_encode(results), analysis_id) for analysis_id, results in updates.items()]
+            )
+        return cursor.rowcount
+    except sqlite3.Error as e:
+        print(f"Error updating analyses: {e}")
+        return 0
+
+def get_user_by_id(user_id):
+    """Get user by ID"""
+    conn = get_connection()
+    row = conn.execute('SELECT * FROM users WHERE username = ?', (user_id,)).fetchone()
+    return _user_from_row(row) if row is not None else None
+
+def get_user_profile(user_id):
+    """Get user profile"""
+    conn = get_connection()
+    user = conn.execute('SELECT farm_location FROM users WHERE username = ?', (user_id,)).fetchone()
+    row = conn.execute('SELECT data FROM profiles WHERE user_id = ?', (user_id,)).fetchone()
+
+    profile = _decode(row['data']) if row is not None else None
+
+    # If profile doesn't exist but user does, create a basic profile with location
+    if not profile and user is not None:
+        profile = {'user_id': user_id}
+
+    if not profile:
+        return None
+
+    if user is not None and user['farm_location']:
+        profile['farm_location'] = user['farm_location']
+
+    return profile
+
+def verify_forgot_password(username, email, full_name):
+    """
+    Verify user details for password reset
+
+    Args:
+        username: Username
+        email: Email address
+        full_name: Full name of the user
+
+    Returns:
+        bool: True if details match, False otherwise
+    """
+    conn = get_connection()
+    user = conn.execute('SELECT email FROM users WHERE username = ?', (username,)).fetchone()
+    if user is None or user['email'] != email:
+        return False
+
+    row = conn.execute('SELECT data FROM profiles WHERE user_id = ?', (username,)).fetchone()
+    if row is None:
+        return False
+
+    return _decode(row['data']).get('name') == full_name
+
+def reset_password(username, new_password):
+    """
+    Reset user password
+
+    Args:
+        username: Username
+        new_password: New password
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(
+            'UPDATE users SET password = ?, updated_at = ? WHERE username = ?',
+            (hash_password(new_password), datetime.utcnow().isoformat(), username)
+        )
+    return cursor.rowcount > 0
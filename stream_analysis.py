@@ -0,0 +1,319 @@
+"""
+Stream analysis module for PhytoSense application.
+Analyzes a continuous stream of frames (a camera feed or a video file) without
+running the full enhanced_analysis on every frame:
+
+- frames whose 8x8 average hash barely differs from the last analyzed frame
+  are skipped, except that after FRAME_REFRESH_SKIPS skips in a row the next
+  frame is analyzed anyway, so a steady camera on one plant still gathers
+  real samples,
+- the remaining frames go through the fast OpenCV preprocessing and the colour
+  and lesion detectors, and their measurements update running means and
+  variances (Welford's algorithm) in O(1) per frame,
+- once every tracked statistic has settled, a stabilized verdict is emitted.
+"""
+
+import cv2
+import numpy as np
+
+from image_processing import (
+    ImageContext, preprocess_array, detect_color_anomalies, detect_brown_spots, ANALYSIS_SIZE
+)
+
+# Frame skipping: side of the average hash and the Hamming distance (in bits)
+# at or below which a frame counts as unchanged
+FRAME_HASH_SIZE = 8
+FRAME_HASH_THRESHOLD = 4
+# Consecutive skipped frames after which an unchanged frame is analyzed again
+FRAME_REFRESH_SKIPS = 5
+
+# Convergence: minimum analyzed frames, and the standard error each colour
+# mean (0-255) and the lesion fraction must fall below
+MIN_STABLE_FRAMES = 8
+COLOR_TOLERANCE = 2.0
+LESION_TOLERANCE = 0.005
+# z-score a flag's share of frames must clear 50% by for its verdict to be settled
+FLAG_CONFIDENCE_Z = 1.96
+
+# Measurements tracked per frame, in vector order
+STREAM_METRICS = ["mean_red", "mean_green", "mean_blue", "plant_coverage", "lesion_fraction"]
+STREAM_FLAGS = ["green_deficiency", "yellow_discoloration", "brown_spots"]
+
+def average_hash(frame, hash_size=FRAME_HASH_SIZE):
+    """
+    Compute the average hash of a frame
+
+    Args:
+        frame: RGB or grayscale uint8 numpy array
+        hash_size: Side of the downsampled grid
+
+    Returns:
+        int: hash_size * hash_size bit hash
+    """
+    gray = cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY) if frame.ndim == 3 else frame
+    small = cv2.resize(gray, (hash_size, hash_size), interpolation=cv2.INTER_AREA)
+    bits = np.packbits(small > small.mean())
+    return int.from_bytes(bits.tobytes(), "big")
+
+def hash_distance(hash_a, hash_b):
+    """Number of differing bits between two hashes"""
+    return bin(hash_a ^ hash_b).count("1")
+
+class RunningStats:
+    """Running mean and variance of a vector of measurements (Welford's algorithm)"""
+
+    def __init__(self, size):
+        self.count = 0
+        self.mean = np.zeros(size, np.float64)
+        self.m2 = np.zeros(size, np.float64)
+
+    def update(self, values):
+        """
+        Add one sample
+
+        Args:
+            values: Sequence of measurements
+        """
+        values = np.asarray(values, np.float64)
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+
+    @property
+    def variance(self):
+        """Sample variance of each measurement"""
+        if self.count < 2:
+            return np.zeros_like(self.mean)
+        return self.m2 / (self.count - 1)
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+    @property
+    def standard_error(self):
+        """Standard error of each running mean (infinite before two samples)"""
+        if self.count < 2:
+            return np.full_like(self.mean, np.inf)
+        return np.sqrt(self.variance / self.count)
+
+class StreamAnalyzer:
+    """Incremental plant health analysis over a stream of frames"""
+
+    def __init__(self, hash_threshold=FRAME_HASH_THRESHOLD, min_frames=MIN_STABLE_FRAMES,
+                 color_tolerance=COLOR_TOLERANCE, lesion_tolerance=LESION_TOLERANCE,
+                 target_size=ANALYSIS_SIZE, refresh_skips=FRAME_REFRESH_SKIPS):
+        """
+        Initialize the analyzer
+
+        Args:
+            hash_threshold: Frames within this many hash bits of the last analyzed frame are skipped
+            min_frames: Minimum analyzed frames before a verdict can be emitted
+            color_tolerance: Standard error the colour means must fall below
+            lesion_tolerance: Standard error the lesion fraction must fall below
+            target_size: Tuple of (width, height) frames are reduced to
+            refresh_skips: Consecutive skips after which an unchanged frame is
+                analyzed again (None never re-analyzes unchanged frames)
+        """
+        self.hash_threshold = hash_threshold
+        self.refresh_skips = refresh_skips
+        self.min_frames = min_frames
+        self.target_size = target_size
+        self.tolerances = np.array([color_tolerance] * 3 + [np.inf, lesion_tolerance])
+
+        self.metrics = RunningStats(len(STREAM_METRICS))
+        self.flags = RunningStats(len(STREAM_FLAGS))
+        self.last_hash = None
+        self.frames_seen = 0
+        self.frames_skipped = 0
+        self.skips_in_a_row = 0
+        self.frames_without_plant = 0
+        self.verdict = None
+
+    @property
+    def frames_analyzed(self):
+        return self.metrics.count
+
+    def process_frame(self, frame):
+        """
+        Feed one frame to the analyzer
+
+        Args:
+            frame: RGB uint8 numpy array (or PIL Image) of any size
+
+        Returns:
+            dict: 'frame_index', 'skipped' and, for analyzed frames, the
+                frame's 'measurements'; 'verdict' is set on the frame where
+                the statistics first converge
+        """
+        frame = np.asarray(frame)
+        update = {"frame_index": self.frames_seen, "skipped": False}
+        self.frames_seen += 1
+
+        frame_hash = average_hash(frame)
+        unchanged = self.last_hash is not None and hash_distance(frame_hash, self.last_hash) <= self.hash_threshold
+        refresh_due = self.refresh_skips is not None and self.skips_in_a_row >= self.refresh_skips
+        if unchanged and not refresh_due:
+            # Skipped frames never enter the statistics
+            self.frames_skipped += 1
+            self.skips_in_a_row += 1
+            update["skipped"] = True
+            return update
+        self.last_hash = frame_hash
+        self.skips_in_a_row = 0
+
+        context = ImageContext(preprocess_array(frame, self.target_size))
+        anomalies = detect_color_anomalies(context.image, image_context=context)
+        if "mean_color" not in anomalies:
+            # Not enough plant in view; nothing to learn from this frame
+            self.frames_without_plant += 1
+            update["no_plant"] = True
+            return update
+
+        spots = detect_brown_spots(context.image, image_context=context)
+        measurements = anomalies["mean_color"] + [
+            cv2.countNonZero(context.mask) / context.mask.size,
+            spots["lesion_fraction"]
+        ]
+        # A frame flags brown spots if either the mean colour or the lesion scan does
+        flags = [
+            anomalies["green_deficiency"],
+            anomalies["yellow_discoloration"],
+            anomalies["brown_spots"] or spots["brown_spots"]
+        ]
+        self.metrics.update(measurements)
+        self.flags.update(flags)
+        update["measurements"] = dict(zip(STREAM_METRICS + STREAM_FLAGS, measurements + flags))
+
+        if self.verdict is None and self.converged:
+            self.verdict = self._make_verdict()
+            update["verdict"] = self.verdict
+        return update
+
+    @property
+    def converged(self):
+        """True once enough frames agree on every colour statistic and flag"""
+        if self.frames_analyzed < self.min_frames:
+            return False
+        if np.any(self.metrics.standard_error > self.tolerances):
+            return False
+        # Each flag's share of frames must be clearly above or below one half.
+        # The Agresti-Coull adjustment keeps the margin non-zero for unanimous flags.
+        trials = self.frames_analyzed + FLAG_CONFIDENCE_Z ** 2
+        share = (self.flags.mean * self.frames_analyzed + FLAG_CONFIDENCE_Z ** 2 / 2) / trials
+        margin = FLAG_CONFIDENCE_Z * np.sqrt(share * (1 - share) / trials)
+        return bool(np.all(np.abs(share - 0.5) > margin))
+
+    def _confidence(self):
+        """Agreement between frames: 1 when every flag is unanimous, 0 when split evenly"""
+        if self.frames_analyzed == 0:
+            return 0.0
+        return float(np.min(np.abs(self.flags.mean - 0.5) * 2))
+
+    def _make_verdict(self):
+        detected = [flag for flag, share in zip(STREAM_FLAGS, self.flags.mean) if share > 0.5]
+        return {
+            "status": "issues_detected" if detected else "healthy",
+            "issues": detected,
+            "confidence": round(self._confidence() * 100, 1),
+            "frames_analyzed": self.frames_analyzed,
+            "frame_index": self.frames_seen - 1
+        }
+
+    def summary(self):
+        """
+        Get the current state of the stream analysis
+
+        Returns:
+            dict: Frame counts, running mean/std of each measurement, share of
+                frames raising each flag, confidence and the stabilized verdict
+                (None until converged)
+        """
+        return {
+            "frames_seen": self.frames_seen,
+            "frames_analyzed": self.frames_analyzed,
+            "frames_skipped": self.frames_skipped,
+            "frames_without_plant": self.frames_without_plant,
+            "metrics": {
+                name: {"mean": float(mean), "std": float(std)}
+                for name, mean, std in zip(STREAM_METRICS, self.metrics.mean, self.metrics.std)
+            },
+            "flags": {name: float(share) for name, share in zip(STREAM_FLAGS, self.flags.mean)},
+            "confidence": round(self._confidence() * 100, 1),
+            "converged": self.verdict is not None,
+            "verdict": self.verdict
+        }
+
+def iter_video_frames(source, frame_step=1, max_frames=None):
+    """
+    Read RGB frames from a video file or camera
+
+    Args:
+        source: Video file path, or a camera index for cv2.VideoCapture
+        frame_step: Yield every frame_step-th frame
+        max_frames: Optional maximum number of frames to yield
+
+    Yields:
+        numpy.ndarray: RGB uint8 frame
+    """
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise IOError(f"Could not open video source: {source}")
+    try:
+        index = 0
+        yielded = 0
+        while max_frames is None or yielded < max_frames:
+            if index % frame_step:
+                # grab() skips decoding frames that are not used
+                if not capture.grab():
+                    break
+            else:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                yielded += 1
+            index += 1
+    finally:
+        capture.release()
+
+def analyze_stream(frames, analyzer=None, stop_on_verdict=True, callback=None):
+    """
+    Run a StreamAnalyzer over an iterable of frames
+
+    Args:
+        frames: Iterable of RGB frames
+        analyzer: Optional StreamAnalyzer to continue (a new one by default)
+        stop_on_verdict: Whether to stop reading once the verdict is stable
+        callback: Optional function called with each frame's update dict
+
+    Returns:
+        dict: The analyzer's summary
+    """
+    if analyzer is None:
+        analyzer = StreamAnalyzer()
+    for frame in frames:
+        update = analyzer.process_frame(frame)
+        if callback is not None:
+            callback(update)
+        if stop_on_verdict and analyzer.verdict is not None:
+            break
+    return analyzer.summary()
+
+def analyze_video(source, frame_step=1, max_frames=None, stop_on_verdict=True, callback=None):
+    """
+    Analyze a video file or camera feed
+
+    Args:
+        source: Video file path, or a camera index for cv2.VideoCapture
+        frame_step: Analyze every frame_step-th frame
+        max_frames: Optional maximum number of frames to read
+        stop_on_verdict: Whether to stop reading once the verdict is stable
+        callback: Optional function called with each frame's update dict
+
+    Returns:
+        dict: Stream analysis summary
+    """
+    return analyze_stream(iter_video_frames(source, frame_step, max_frames),
+                          stop_on_verdict=stop_on_verdict, callback=callback)
@@ -0,0 +1,198 @@
+"""
+Symptom index module for PhytoSense application.
+Precompiles inverted indexes from symptom terms to the diseases and pests in
+crop_data and crop_database at import time, so matching a user's symptom text
+costs one dictionary lookup per query word instead of a scan of the catalog.
+"""
+
+import re
+from collections import defaultdict
+
+from crop_data import onion_diseases, tomato_diseases, common_pests
+from crop_database import CROP_DATABASE, standardize_crop_name
+
+# Image/user signals and the keyword a description must contain to match them, with its score
+DISEASE_SIGNALS = {
+    "yellowing": ("yellow", 3),
+    "spots": ("spot", 3),
+    "powdery": ("powder", 4),
+    "rot": ("rot", 3),
+    "wilt": ("wilt", 4),
+    "curl": ("curl", 4)
+}
+PEST_SIGNALS = {
+    "holes": ("hole", 4),
+    "webbing": ("web", 5),
+    "sucking_pests": ("suck", 4)
+}
+
+# Score for each word of the user's symptoms found in a disease description
+TERM_WEIGHT = 2
+# Score for a pest mentioned by name in the user's symptoms
+NAME_WEIGHT = 5
+# Shortest query word that is matched against descriptions
+MIN_TERM_LENGTH = 4
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    """
+    Split text into lowercase alphanumeric tokens
+
+    Args:
+        text: Free text
+
+    Returns:
+        list: Tokens in order of appearance
+    """
+    return _TOKEN_PATTERN.findall(text.lower()) if text else []
+
+def _index_terms(text):
+    """
+    Terms under which a description is indexed: every token and each of its
+    prefixes of at least MIN_TERM_LENGTH characters, so that a query word
+    matches longer forms of it ("spot" finds "spots", "yellow" finds "yellowing")
+    """
+    terms = set()
+    for token in tokenize(text):
+        for end in range(MIN_TERM_LENGTH, len(token) + 1):
+            terms.add(token[:end])
+    return terms
+
+class SymptomIndex:
+    """Inverted index over one catalog of diseases or pests"""
+
+    def __init__(self, catalog, text_fields, signals, index_names=False):
+        """
+        Build the index
+
+        Args:
+            catalog: Dict mapping entry name to its info dict
+            text_fields: Info fields whose text describes the entry
+            signals: Dict mapping signal name to (keyword, score)
+            index_names: Whether to match entry names mentioned in the query
+        """
+        self.entries = list(catalog.items())
+        self.term_index = defaultdict(dict)
+        self.signal_index = {}
+        self.name_index = defaultdict(list)
+        self.max_name_tokens = 0
+
+        signal_entries = defaultdict(list)
+        for entry_id, (name, info) in enumerate(self.entries):
+            text = " ".join(str(info.get(field, "")) for field in text_fields).lower()
+
+            for term in _index_terms(text):
+                self.term_index[term][entry_id] = TERM_WEIGHT
+
+            # Signal keywords keep the substring semantics of the original rules
+            for signal, (keyword, score) in signals.items():
+                if keyword in text:
+                    signal_entries[signal].append((entry_id, score))
+
+            if index_names:
+                name_tokens = tuple(tokenize(name))
+                if name_tokens:
+                    self.name_index[name_tokens].append(entry_id)
+                    self.max_name_tokens = max(self.max_name_tokens, len(name_tokens))
+
+        self.term_index = dict(self.term_index)
+        self.signal_index = dict(signal_entries)
+        self.name_index = dict(self.name_index)
+
+    def score(self, query="", signals=(), match_terms=True):
+        """
+        Score the catalog entries against a query
+
+        Args:
+            query: User-provided symptoms text
+            signals: Signal names raised by the image analysis or the query
+            match_terms: Whether query words are matched against descriptions
+
+        Returns:
+            list: (name, info, score) for entries with a positive score, in catalog order
+        """
+        scores = defaultdict(int)
+
+        for signal in set(signals):
+            for entry_id, weight in self.signal_index.get(signal, ()):
+                scores[entry_id] += weight
+
+        tokens = tokenize(query)
+        if match_terms:
+            for token in tokens:
+                if len(token) >= MIN_TERM_LENGTH:
+                    for entry_id, weight in self.term_index.get(token, {}).items():
+                        scores[entry_id] += weight
+
+        # Entry names mentioned anywhere in the query (multi-word names as phrases)
+        if self.name_index:
+            for start in range(len(tokens)):
+                for length in range(1, min(self.max_name_tokens, len(tokens) - start) + 1):
+                    for entry_id in self.name_index.get(tuple(tokens[start:start + length]), ()):
+                        scores[entry_id] += NAME_WEIGHT
+
+        return [
+            (self.entries[entry_id][0], self.entries[entry_id][1], score)
+            for entry_id, score in sorted(scores.items())
+            if score > 0
+        ]
+
+def _build_disease_indexes():
+    """One disease index per crop: crop_data catalogs first, then CROP_DATABASE"""
+    indexes = {
+        "tomato": SymptomIndex(tomato_diseases, ["symptoms"], DISEASE_SIGNALS),
+        "onion": SymptomIndex(onion_diseases, ["symptoms"], DISEASE_SIGNALS)
+    }
+    for crop_name, crop_info in CROP_DATABASE.items():
+        if crop_name.lower() not in indexes and crop_info.get("diseases"):
+            indexes[crop_name.lower()] = SymptomIndex(crop_info["diseases"], ["symptoms"], DISEASE_SIGNALS)
+    return indexes
+
+def _build_pest_indexes():
+    """The common pest index plus one per crop that adds the crop's CROP_DATABASE pests"""
+    text_fields = ["identification", "damage", "symptoms", "description"]
+    indexes = {None: SymptomIndex(common_pests, text_fields, PEST_SIGNALS, index_names=True)}
+    for crop_name, crop_info in CROP_DATABASE.items():
+        if crop_info.get("pests"):
+            catalog = dict(common_pests)
+            for pest_name, pest_info in crop_info["pests"].items():
+                catalog.setdefault(pest_name, pest_info)
+            indexes[crop_name.lower()] = SymptomIndex(catalog, text_fields, PEST_SIGNALS, index_names=True)
+    return indexes
+
+DISEASE_INDEXES = _build_disease_indexes()
+PEST_INDEXES = _build_pest_indexes()
+
+def _crop_key(plant_name):
+    """Normalize a plant name to an index key"""
+    if not plant_name:
+        return None
+    key = plant_name.strip().lower()
+    if key in DISEASE_INDEXES or key in PEST_INDEXES:
+        return key
+    return standardize_crop_name(plant_name).lower()
+
+def get_disease_index(plant_name):
+    """
+    Get the disease index for a crop
+
+    Args:
+        plant_name: Name of the plant
+
+    Returns:
+        SymptomIndex: The crop's disease index (tomato diseases for unknown crops)
+    """
+    return DISEASE_INDEXES.get(_crop_key(plant_name), DISEASE_INDEXES["tomato"])
+
+def get_pest_index(plant_name=None):
+    """
+    Get the pest index for a crop
+
+    Args:
+        plant_name: Optional name of the plant
+
+    Returns:
+        SymptomIndex: Common pests plus the crop's own pests when known
+    """
+    return PEST_INDEXES.get(_crop_key(plant_name), PEST_INDEXES[None])
@@ -0,0 +1,239 @@
+"""
+Symptom matcher module for PhytoSense application.
+Ranks diseases and pests by TF-IDF cosine similarity between the user's
+symptom text and the catalog descriptions in crop_data and crop_database.
+The vectorizer is fitted once and the sparse matrix is cached on disk (keyed
+on the catalog text), so a batch of queries is a single sparse matrix product.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+import numpy as np
+
+from crop_data import onion_diseases, tomato_diseases, common_pests
+from crop_database import CROP_DATABASE, standardize_crop_name
+
+try:
+    import joblib
+    import sklearn
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    HAS_SKLEARN = True
+except ImportError:
+    HAS_SKLEARN = False
+
+# On-disk cache of the fitted vectorizer and document matrix
+CACHE_DIR = os.path.join("cache", "symptom_matcher")
+
+# Matches below this cosine similarity are dropped
+MIN_SIMILARITY = 0.1
+
+# TfidfVectorizer settings; part of the cache key, so changing them refits
+VECTORIZER_OPTIONS = {"stop_words": "english", "ngram_range": (1, 2), "sublinear_tf": True}
+
+def _catalog_entries():
+    """
+    Collect every disease and pest description
+
+    Returns:
+        list: Dicts with 'kind', 'crop' (lowercase, None for common pests), 'name', 'text' and 'info'
+    """
+    entries = []
+
+    def add(kind, crop, name, info, fields):
+        text = ". ".join(str(info[field]) for field in fields if info.get(field))
+        entries.append({"kind": kind, "crop": crop, "name": name, "text": text, "info": info})
+
+    for name, info in tomato_diseases.items():
+        add("disease", "tomato", name, info, ["symptoms", "favorable_conditions"])
+    for name, info in onion_diseases.items():
+        add("disease", "onion", name, info, ["symptoms", "favorable_conditions"])
+    for name, info in common_pests.items():
+        add("pest", None, name, info, ["identification", "damage"])
+
+    for crop_name, crop_info in CROP_DATABASE.items():
+        crop = crop_name.lower()
+        for name, info in crop_info.get("diseases", {}).items():
+            add("disease", crop, name, info, ["symptoms", "causes"])
+        for name, info in crop_info.get("pests", {}).items():
+            add("pest", crop, name, info, ["symptoms", "description"])
+
+    return entries
+
+def _crop_key(crop):
+    """Normalize a crop name the same way the catalog entries are keyed"""
+    if not crop:
+        return None
+    return standardize_crop_name(crop).lower()
+
+class SymptomMatcher:
+    """TF-IDF index over the disease and pest descriptions"""
+
+    def __init__(self, entries=None, cache_dir=CACHE_DIR):
+        """
+        Fit the vectorizer, or load it from the disk cache when the catalog is unchanged
+
+        Args:
+            entries: Catalog entries (defaults to every disease and pest description)
+            cache_dir: Directory for the cached model (None disables the disk cache)
+        """
+        if not HAS_SKLEARN:
+            raise ImportError("scikit-learn is required for the TF-IDF symptom matcher")
+
+        self.entries = entries if entries is not None else _catalog_entries()
+        self.kinds = np.array([entry["kind"] for entry in self.entries])
+        self.crops = np.array([entry["crop"] or "" for entry in self.entries])
+
+        self.cache_path = None
+        if cache_dir:
+            self.cache_path = os.path.join(cache_dir, f"tfidf-{self._catalog_digest()}.joblib")
+
+        cached = self._load_cache()
+        if cached is not None:
+            self.vectorizer, self.matrix = cached
+        else:
+            self.vectorizer = TfidfVectorizer(**VECTORIZER_OPTIONS)
+            # Rows are L2-normalized, so a dot product with a query vector is the cosine similarity
+            self.matrix = self.vectorizer.fit_transform([entry["text"] for entry in self.entries]).tocsr()
+            self._save_cache()
+
+    def _catalog_digest(self):
+        """Hash of the catalog text, vectorizer settings and scikit-learn version, used to key the cache file"""
+        digest = hashlib.sha256(sklearn.__version__.encode("utf-8"))
+        digest.update(json.dumps(VECTORIZER_OPTIONS, sort_keys=True).encode("utf-8"))
+        digest.update(json.dumps(
+            [(entry["kind"], entry["crop"], entry["name"], entry["text"]) for entry in self.entries]
+        ).encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        try:
+            cached = joblib.load(self.cache_path)
+            return cached["vectorizer"], cached["matrix"]
+        except Exception as e:
+            print(f"Error loading symptom matcher cache: {e}")
+            return None
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.cache_path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                joblib.dump({"vectorizer": self.vectorizer, "matrix": self.matrix}, f)
+            os.replace(tmp_path, self.cache_path)
+        except (IOError, OSError) as e:
+            print(f"Error saving symptom matcher cache: {e}")
+
+    def _candidate_mask(self, kind, crop):
+        """Boolean mask of the catalog entries a query may match"""
+        mask = np.ones(len(self.entries), dtype=bool)
+        if kind:
+            mask &= self.kinds == kind
+        crop = _crop_key(crop)
+        if crop:
+            # Common pests apply to every crop
+            mask &= (self.crops == crop) | (self.crops == "")
+        return mask
+
+    def _rank(self, scores, mask, top_k, min_score):
+        """Turn one row of similarities into ranked matches"""
+        candidates = np.flatnonzero(mask & (scores >= min_score))
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        if top_k:
+            order = order[:top_k]
+        return [
+            {
+                "name": self.entries[i]["name"],
+                "kind": self.entries[i]["kind"],
+                "crop": self.entries[i]["crop"],
+                "score": float(scores[i]),
+                "info": self.entries[i]["info"]
+            }
+            for i in order
+        ]
+
+    def covers(self, kind, crop):
+        """
+        Check whether the catalog has crop-specific entries
+
+        Args:
+            kind: 'disease' or 'pest'
+            crop: Crop name
+
+        Returns:
+            bool: True if at least one entry of this kind belongs to the crop
+        """
+        crop = _crop_key(crop)
+        return bool(crop) and bool(np.any((self.kinds == kind) & (self.crops == crop)))
+
+    def match(self, symptoms, kind=None, crop=None, top_k=5, min_score=MIN_SIMILARITY):
+        """
+        Rank catalog entries for one symptom description
+
+        Args:
+            symptoms: User-provided symptoms text
+            kind: Optional 'disease' or 'pest'
+            crop: Optional crop name (common pests are always included)
+            top_k: Maximum number of matches (None for all)
+            min_score: Minimum cosine similarity
+
+        Returns:
+            list: Matches with 'name', 'kind', 'crop', 'score' and 'info', best first
+        """
+        return self.match_batch([symptoms], kind, crop, top_k, min_score)[0]
+
+    def match_batch(self, texts, kinds=None, crops=None, top_k=5, min_score=MIN_SIMILARITY):
+        """
+        Rank catalog entries for many symptom descriptions at once
+
+        Args:
+            texts: List of symptoms texts
+            kinds: Optional 'disease' or 'pest', or a list with one kind per text
+            crops: Optional crop name, or a list with one crop per text
+            top_k: Maximum number of matches per text (None for all)
+            min_score: Minimum cosine similarity
+
+        Returns:
+            list: One list of matches per input text
+        """
+        texts = [text or "" for text in texts]
+        if not texts:
+            return []
+
+        # One sparse product scores every query against every entry
+        scores = (self.vectorizer.transform(texts) @ self.matrix.T).toarray()
+
+        kinds = kinds if isinstance(kinds, (list, tuple)) else [kinds] * len(texts)
+        crops = crops if isinstance(crops, (list, tuple)) else [crops] * len(texts)
+        masks = {}
+        results = []
+        for row, kind, crop in zip(scores, kinds, crops):
+            if (kind, crop) not in masks:
+                masks[(kind, crop)] = self._candidate_mask(kind, crop)
+            results.append(self._rank(row, masks[(kind, crop)], top_k, min_score))
+        return results
+
+_default_matcher = None
+_default_matcher_lock = threading.Lock()
+
+def get_symptom_matcher():
+    """
+    Get the process-wide symptom matcher
+
+    Returns:
+        SymptomMatcher: Shared matcher, or None if scikit-learn is not installed
+    """
+    global _default_matcher
+    if not HAS_SKLEARN:
+        return None
+    with _default_matcher_lock:
+        if _default_matcher is None:
+            _default_matcher = SymptomMatcher()
+        return _default_matcher
@@ -0,0 +1,333 @@
+"""
+Preprocessed tensor store for PhytoSense application.
+Keeps the preprocess_image output of every image seen by batch jobs in one
+memory-mapped .npy file of shape (N, 224, 224, 3) uint8, with a JSON sidecar
+index mapping each image's content hash (and its path) to a row. Reprocessing
+and benchmark jobs read rows straight from the page cache instead of decoding
+and preprocessing the JPEGs again.
+
+The store is single-writer: one job appends at a time, while any number of
+processes may read it.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+import numpy as np
+
+from image_processing import (
+    load_image, preprocess_image, ANALYSIS_SIZE, DEFAULT_PREPROCESS_BACKEND,
+    CONTRAST_FACTOR, BRIGHTNESS_FACTOR, SHARPNESS_FACTOR, BLUR_RADIUS
+)
+
+# Store location (one subdirectory per preprocessing backend)
+STORE_DIR = os.path.join("cache", "tensors")
+TENSORS_FILE = "tensors.npy"
+INDEX_FILE = "index.json"
+
+# Rows allocated when the store is created; capacity doubles when it fills up
+INITIAL_CAPACITY = 64
+
+# Chunk size for hashing image files
+HASH_CHUNK_SIZE = 1 << 20
+
+def file_digest(path):
+    """
+    Hash the bytes of an image file
+
+    Args:
+        path: Image file path
+
+    Returns:
+        string: SHA-256 hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def preprocess_signature(backend, target_size=ANALYSIS_SIZE):
+    """
+    Describe the preprocessing that produced the stored rows
+
+    Any change to the backend, the target size or the enhancement factors
+    yields a different signature, and a store with a stale signature is reset.
+
+    Args:
+        backend: "pil" or "opencv"
+        target_size: Tuple of (width, height)
+
+    Returns:
+        string: Signature stored in the index
+    """
+    return (f"{backend}:{target_size[0]}x{target_size[1]}:{CONTRAST_FACTOR}:"
+            f"{BRIGHTNESS_FACTOR}:{SHARPNESS_FACTOR}:{BLUR_RADIUS}")
+
+class TensorStore:
+    """Append-only memory-mapped store of preprocessed images"""
+
+    def __init__(self, store_dir=STORE_DIR, backend=None, target_size=ANALYSIS_SIZE):
+        """
+        Open the store, creating it if needed
+
+        Args:
+            store_dir: Base directory of the store
+            backend: Preprocessing backend (defaults to DEFAULT_PREPROCESS_BACKEND)
+            target_size: Tuple of (width, height) of the stored images
+        """
+        self.backend = backend or DEFAULT_PREPROCESS_BACKEND
+        self.target_size = target_size
+        self.row_shape = (target_size[1], target_size[0], 3)
+        self.signature = preprocess_signature(self.backend, target_size)
+
+        self.store_dir = os.path.join(store_dir, self.backend)
+        self.tensors_path = os.path.join(self.store_dir, TENSORS_FILE)
+        self.index_path = os.path.join(self.store_dir, INDEX_FILE)
+        self._lock = threading.Lock()
+        self._writable = None
+        self._readable = None
+
+        self._load_index()
+
+    def _empty_index(self):
+        return {"signature": self.signature, "rows": 0, "entries": {}, "paths": {}}
+
+    def _load_index(self):
+        """Read the sidecar index, starting over if it is missing or stale"""
+        self.index = self._empty_index()
+        if not os.path.exists(self.index_path) or not os.path.exists(self.tensors_path):
+            return
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+        except (IOError, ValueError) as e:
+            print(f"Error reading tensor store index: {e}")
+            return
+        if index.get("signature") == self.signature:
+            self.index = index
+        self._readable = None
+
+    def _save_index(self):
+        """Atomically replace the sidecar index"""
+        os.makedirs(self.store_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.store_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def __len__(self):
+        return self.index["rows"]
+
+    def __contains__(self, key):
+        return self.row_of(key) is not None
+
+    def refresh(self):
+        """Pick up rows appended by another process since the store was opened"""
+        with self._lock:
+            self._load_index()
+
+    def _path_key(self, path):
+        return os.path.abspath(path)
+
+    def digest_of(self, path):
+        """
+        Content hash of an image file, reusing the indexed hash while the
+        file's size and modification time are unchanged
+
+        Args:
+            path: Image file path
+
+        Returns:
+            string: SHA-256 hex digest
+        """
+        stat = os.stat(path)
+        known = self.index["paths"].get(self._path_key(path))
+        if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+            return known["digest"]
+        return file_digest(path)
+
+    def row_of(self, key):
+        """
+        Find the row of an image
+
+        Args:
+            key: Image file path or content digest
+
+        Returns:
+            int: Row number, or None if the image is not stored
+        """
+        entries = self.index["entries"]
+        if key in entries:
+            return entries[key]
+        known = self.index["paths"].get(self._path_key(key))
+        if known is None:
+            return None
+        return entries.get(known["digest"])
+
+    @property
+    def array(self):
+        """Read-only memory map of the stored rows, shape (len(self), H, W, 3)"""
+        if self._readable is None or len(self._readable) < len(self):
+            if len(self) == 0:
+                return np.empty((0,) + self.row_shape, np.uint8)
+            self._readable = np.load(self.tensors_path, mmap_mode="r")
+        return self._readable[:len(self)]
+
+    def get(self, key):
+        """
+        Read one preprocessed image without copying it
+
+        Args:
+            key: Image file path or content digest
+
+        Returns:
+            numpy.ndarray: Read-only (H, W, 3) uint8 view, or None if not stored
+        """
+        row = self.row_of(key)
+        if row is None:
+            return None
+        return self.array[row]
+
+    def get_many(self, keys):
+        """
+        Read several preprocessed images
+
+        Args:
+            keys: Image file paths or content digests
+
+        Returns:
+            tuple: (array of shape (n, H, W, 3), list of the keys that were found).
+                Rows are gathered with one fancy-indexing pass, so the array is a copy.
+        """
+        found = []
+        rows = []
+        for key in keys:
+            row = self.row_of(key)
+            if row is not None:
+                found.append(key)
+                rows.append(row)
+        return self.array[np.asarray(rows, dtype=np.intp)], found
+
+    def _reserve(self, rows_needed):
+        """Make room for rows_needed rows, doubling the capacity when full"""
+        capacity = len(self._writable) if self._writable is not None else 0
+        if self._writable is None and os.path.exists(self.tensors_path) and len(self) > 0:
+            self._writable = np.load(self.tensors_path, mmap_mode="r+")
+            capacity = len(self._writable)
+        if rows_needed <= capacity:
+            return
+
+        new_capacity = max(capacity, INITIAL_CAPACITY)
+        while new_capacity < rows_needed:
+            new_capacity *= 2
+
+        os.makedirs(self.store_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.store_dir, suffix=".npy")
+        os.close(fd)
+        grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8,
+                                          shape=(new_capacity,) + self.row_shape)
+        if len(self) > 0:
+            grown[:len(self)] = self._writable[:len(self)]
+        grown.flush()
+        # Readers holding the old map keep their inode until they reopen
+        os.replace(tmp_path, self.tensors_path)
+        self._writable = grown
+        self._readable = None
+
+    def add(self, path, image=None):
+        """
+        Store the preprocessed form of an image file
+
+        Args:
+            path: Image file path
+            image: Optional already decoded PIL Image of the file
+
+        Returns:
+            int: Row number of the image
+        """
+        return self.add_many([path], [image])[path]
+
+    def add_many(self, paths, images=None):
+        """
+        Store the preprocessed form of several image files, writing the index once
+
+        Images already in the store (by content hash) are not decoded again.
+
+        Args:
+            paths: Image file paths
+            images: Optional list of already decoded PIL Images, aligned with paths
+
+        Returns:
+            dict: Path mapped to its row number (unreadable files are left out)
+        """
+        if images is None:
+            images = [None] * len(paths)
+
+        rows = {}
+        with self._lock:
+            changed = False
+            for path, image in zip(paths, images):
+                try:
+                    stat = os.stat(path)
+                    digest = self.digest_of(path)
+                    self.index["paths"][self._path_key(path)] = {
+                        "digest": digest, "size": stat.st_size, "mtime": stat.st_mtime
+                    }
+                    changed = True
+
+                    row = self.index["entries"].get(digest)
+                    if row is None:
+                        if image is None:
+                            image = load_image(path, target_size=self.target_size)
+                        processed = preprocess_image(image, target_size=self.target_size, backend=self.backend)
+
+                        row = len(self)
+                        self._reserve(row + 1)
+                        self._writable[row] = np.asarray(processed.convert("RGB"))
+                        self.index["entries"][digest] = row
+                        self.index["rows"] = row + 1
+                    rows[path] = row
+                except Exception as e:
+                    print(f"Error adding {path} to tensor store: {e}")
+
+            if changed:
+                # Rows must be on disk before the index points at them
+                if self._writable is not None:
+                    self._writable.flush()
+                self._save_index()
+        return rows
+
+    def clear(self):
+        """Delete every stored row"""
+        with self._lock:
+            self._writable = None
+            self._readable = None
+            for path in (self.tensors_path, self.index_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.index = self._empty_index()
+
+_default_stores = {}
+_default_stores_lock = threading.Lock()
+
+def get_tensor_store(backend=None):
+    """
+    Get the process-wide tensor store for a preprocessing backend
+
+    Args:
+        backend: "pil" or "opencv" (defaults to DEFAULT_PREPROCESS_BACKEND)
+
+    Returns:
+        TensorStore: Shared store
+    """
+    backend = backend or DEFAULT_PREPROCESS_BACKEND
+    with _default_stores_lock:
+        if backend not in _default_stores:
+            _default_stores[backend] = TensorStore(backend=backend)
+        return _default_stores[backend]
@@ -0,0 +1,143 @@
+
+import os
+import sys
+import json
+import subprocess
+import tempfile
+
+# Each storage backend is selected by environment variables when db_adapter is
+# imported, so every backend runs in its own process and prints its pages.
+BACKENDS = {
+    "json": {},
+    "jsonl": {"PHYTOSENSE_ANALYSES_STORAGE": "jsonl"},
+    "sqlite": {"SQLITE_DB_PATH": "history.db"},
+    "sqlalchemy": {"DATABASE_URL": "sqlite:///history-sqlalchemy.db"},
+    "mongo": {"MONGO_URI": "mongomock://localhost"}
+}
+
+FILTERS = [
+    {},
+    {"analysis_type": "plant"},
+    {"plant_name": "tom"},
+    {"plant_name": "_"},
+    {"date_from": "2026-02-01", "date_to": "2026-02-11"},
+    {"analysis_type": "soil", "date_to": "2026-01-31"}
+]
+
+PAGE_SIZE = 7
+
+def run_backend(backend):
+    """Save the same analyses, walk every filter page by page and print the result"""
+    import db_adapter
+
+    selected = {
+        "json": not (db_adapter.USE_SQLALCHEMY or db_adapter.USE_SQLITE or db_adapter.USE_MONGO),
+        "jsonl": not (db_adapter.USE_SQLALCHEMY or db_adapter.USE_SQLITE or db_adapter.USE_MONGO),
+        "sqlite": db_adapter.USE_SQLITE,
+        "sqlalchemy": db_adapter.USE_SQLALCHEMY,
+        "mongo": db_adapter.USE_MONGO and not (db_adapter.USE_SQLALCHEMY or db_adapter.USE_SQLITE)
+    }[backend]
+    if not selected:
+        print(json.dumps({"skipped": "backend not available"}))
+        return
+
+    user_id = "pager"
+    if db_adapter.USE_SQLALCHEMY:
+        db_adapter.create_user("pager", "password123")
+        user_id = db_adapter.verify_user("pager", "password123")["id"]
+
+    # 57 analyses over three months; every seventh shares one timestamp
+    plants = ["Tomato", "Rice", "Potato_x"]
+    analyses = []
+    for i in range(57):
+        timestamp = f"2026-0{1 + i % 3}-{10 + i % 5}T12:00:00" if i % 7 else "2026-02-11T12:00:00"
+        if i % 2:
+            results = {"seq": i, "plant_info": {"name": plants[i % 3]}}
+        else:
+            results = {"seq": i, "soil_type": "Clay"}
+        analyses.append({
+            "user_id": user_id,
+            "analysis_type": "plant" if i % 2 else "soil",
+            "image_path": None,
+            "results": results,
+            "timestamp": timestamp
+        })
+    success, saved = db_adapter.save_analyses(analyses)
+
+    walks = []
+    for filters in FILTERS:
+        seqs = []
+        keys = []
+        cursor = None
+        while True:
+            page, cursor = db_adapter.get_user_analyses_page(user_id, limit=PAGE_SIZE, cursor=cursor, **filters)
+            seqs.extend(a["results"]["seq"] for a in page)
+            keys.extend(a["timestamp"] for a in page)
+            if not cursor:
+                break
+        walks.append({
+            "seqs": seqs,
+            "ordered": keys == sorted(keys, reverse=True),
+            "count": db_adapter.count_user_analyses(user_id, **filters)
+        })
+    print(json.dumps({"saved": saved if success else 0, "walks": walks}))
+
+if len(sys.argv) == 3 and sys.argv[1] == "--backend":
+    run_backend(sys.argv[2])
+    sys.exit(0)
+
+repo_dir = os.path.dirname(os.path.abspath(__file__))
+outputs = {}
+for backend, backend_env in BACKENDS.items():
+    with tempfile.TemporaryDirectory() as work_dir:
+        env = {
+            key: value for key, value in os.environ.items()
+            if key not in ("DATABASE_URL", "SQLITE_DB_PATH", "MONGO_URI", "PHYTOSENSE_ANALYSES_STORAGE")
+        }
+        env.update(backend_env)
+        env["PYTHONPATH"] = repo_dir
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--backend", backend],
+            cwd=work_dir, env=env, capture_output=True, text=True
+        )
+    try:
+        outputs[backend] = json.loads(proc.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        print(f"FAILURE: {backend} backend did not run:\n{proc.stderr}")
+        outputs[backend] = None
+
+failures = 0
+reference = None
+for backend, output in outputs.items():
+    if output is None:
+        failures += 1
+        continue
+    if "skipped" in output:
+        print(f"SKIPPED: {backend} ({output['skipped']})")
+        continue
+
+    print(f"Checking {backend} backend...")
+    for filters, walk in zip(FILTERS, output["walks"]):
+        if len(set(walk["seqs"])) != len(walk["seqs"]) or not walk["ordered"]:
+            print(f"FAILURE: {backend} {filters}: pages repeat or are out of order")
+            failures += 1
+        if walk["count"] != len(walk["seqs"]):
+            print(f"FAILURE: {backend} {filters}: count {walk['count']} != {len(walk['seqs'])} paged")
+            failures += 1
+
+    if reference is None:
+        reference = (backend, output)
+    elif output["walks"] != reference[1]["walks"]:
+        print(f"FAILURE: {backend} pages differ from {reference[0]}")
+        failures += 1
+    else:
+        print(f"SUCCESS: {backend} pages match {reference[0]}")
+
+if reference is not None and reference[1]["walks"][0]["count"] != 57:
+    print(f"FAILURE: expected 57 analyses, got {reference[1]['walks'][0]['count']}")
+    failures += 1
+
+if failures:
+    print(f"FAILURE: {failures} pagination check(s) failed")
+    sys.exit(1)
+print("SUCCESS: keyset pagination agrees across backends")
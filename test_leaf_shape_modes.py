@@ -0,0 +1,82 @@
+
+import sys
+import numpy as np
+import cv2
+from image_processing import analyze_leaf_shape
+
+# Multi-leaf solidity and extent must stay this close to the traced-contour values
+MAX_SOLIDITY_DIFF = 0.01
+MAX_EXTENT_DIFF = 0.02
+
+def bitten_ellipse():
+    """Elliptic leaf with a bite taken out of its upper edge"""
+    mask = np.zeros((400, 600), np.uint8)
+    cv2.ellipse(mask, (300, 200), (200, 120), 0, 0, 360, 255, -1)
+    cv2.circle(mask, (300, 80), 50, 0, -1)
+    return mask
+
+def deep_bites():
+    """Elliptic leaf with two bites deep enough to count as abnormal"""
+    mask = np.zeros((400, 600), np.uint8)
+    cv2.ellipse(mask, (300, 200), (200, 120), 20, 0, 360, 255, -1)
+    cv2.circle(mask, (300, 80), 110, 0, -1)
+    cv2.circle(mask, (300, 330), 90, 0, -1)
+    return mask
+
+def star():
+    """Five-pointed star, irregular by every measure"""
+    mask = np.zeros((400, 400), np.uint8)
+    points = [
+        (200 + radius * np.cos(k * np.pi / 5), 200 + radius * np.sin(k * np.pi / 5))
+        for k, radius in zip(range(10), [150, 60] * 5)
+    ]
+    cv2.fillPoly(mask, [np.array(points, np.int32)], 255)
+    return mask
+
+failures = 0
+for name, mask in (("bitten ellipse", bitten_ellipse()), ("deep bites", deep_bites()), ("star", star())):
+    single = analyze_leaf_shape(None, mask=mask)
+    multi = analyze_leaf_shape(None, mask=mask, multi_leaf=True)
+    print(f"{name}: solidity {single['solidity']:.3f} / {multi['solidity']:.3f}, "
+          f"circularity {single['circularity']:.3f} / {multi['circularity']:.3f}, "
+          f"abnormal {single['shape_abnormality']} / {multi['shape_abnormality']}")
+
+    if multi["leaf_count"] != 1:
+        print(f"FAILURE: {name}: expected one leaf, got {multi['leaf_count']}")
+        failures += 1
+        continue
+    if abs(single["solidity"] - multi["solidity"]) > MAX_SOLIDITY_DIFF:
+        print(f"FAILURE: {name}: solidity differs by more than {MAX_SOLIDITY_DIFF}")
+        failures += 1
+    elif abs(single["extent"] - multi["extent"]) > MAX_EXTENT_DIFF:
+        print(f"FAILURE: {name}: extent differs by more than {MAX_EXTENT_DIFF}")
+        failures += 1
+    elif single["shape_abnormality"] != multi["shape_abnormality"]:
+        print(f"FAILURE: {name}: modes disagree ({single['abnormality_reasons']} vs {multi['abnormality_reasons']})")
+        failures += 1
+    else:
+        print(f"SUCCESS: {name}: both modes agree")
+
+# Every leaf of a multi-leaf mask is measured as if it were alone
+print("Measuring all three leaves at once...")
+combined = np.zeros((400, 1600), np.uint8)
+combined[:, :600] = bitten_ellipse()
+combined[:, 600:1200] = deep_bites()
+combined[:, 1200:] = star()
+result = analyze_leaf_shape(None, mask=combined, multi_leaf=True)
+alone = sorted(
+    (analyze_leaf_shape(None, mask=mask, multi_leaf=True)["leaves"][0] for mask in (bitten_ellipse(), deep_bites(), star())),
+    key=lambda leaf: -leaf["area"]
+)
+if result["leaf_count"] == 3 and all(
+    abs(leaf[key] - other[key]) < 1e-9
+    for leaf, other in zip(result["leaves"], alone)
+    for key in ("area", "perimeter", "solidity", "extent")
+):
+    print("SUCCESS: per-leaf metrics match single-leaf masks")
+else:
+    print(f"FAILURE: combined mask gave {result['leaf_count']} leaves with different metrics")
+    failures += 1
+
+if failures:
+    sys.exit(1)
@@ -0,0 +1,76 @@
+
+import os
+import sys
+
+# Run the Mongo backend against the in-memory mongomock stand-in
+os.environ["MONGO_URI"] = "mongomock://localhost"
+os.environ["MONGO_DB_NAME"] = "phytosense_test"
+
+try:
+    import mongomock
+    import mongo_config
+    import mongo_db
+except ImportError as e:
+    print(f"SKIPPED: Mongo backend test needs pymongo, mongomock and streamlit ({e})")
+    sys.exit(0)
+
+failures = 0
+
+def check(condition, success_message, failure_message):
+    global failures
+    if condition:
+        print(f"SUCCESS: {success_message}")
+    else:
+        print(f"FAILURE: {failure_message}")
+        failures += 1
+
+mongo_config.reset_mongo_client()
+
+# Test 1: mongomock:// gives an in-memory client, shared across calls
+print("Connecting with MONGO_URI=mongomock://...")
+client = mongo_config.get_mongo_client()
+check(isinstance(client, mongomock.MongoClient), "mongomock client created", f"unexpected client {client!r}")
+check(mongo_config.get_mongo_client() is client, "client is shared", "a second client was created")
+
+db = mongo_config.get_database()
+check(db is not None and db.name == "phytosense_test", "database selected from MONGO_DB_NAME", f"unexpected database {db!r}")
+
+# Test 2: Indexes are created on first use
+print("Checking indexes...")
+user_indexes = db.users.index_information()
+check("username_unique" in user_indexes and user_indexes["username_unique"].get("unique"),
+      "unique username index exists", f"users indexes: {sorted(user_indexes)}")
+check("user_id_unique" in db.user_profiles.index_information(),
+      "unique profile index exists", f"user_profiles indexes: {sorted(db.user_profiles.index_information())}")
+analyses_indexes = db.analyses.index_information()
+check(analyses_indexes.get("user_history_keyset", {}).get("key") == [("user_id", 1), ("timestamp", -1), ("_id", -1)],
+      "keyset history index exists", f"analyses indexes: {analyses_indexes}")
+
+# Test 3: ensure_indexes is idempotent
+mongo_config.ensure_indexes(db)
+check(sorted(db.analyses.index_information()) == sorted(analyses_indexes),
+      "ensure_indexes can run again", "ensure_indexes changed the indexes on a second run")
+
+# Test 4: The unique index backs duplicate username checks
+print("Creating users...")
+success, msg = mongo_db.create_user("mockuser", "password123", "mock@example.com", farm_location="Nashik")
+check(success, "user created", f"create_user failed: {msg}")
+success, msg = mongo_db.create_user("mockuser", "password123")
+check(not success, "duplicate username rejected", "duplicate username was accepted")
+user = mongo_db.verify_user("mockuser", "password123")
+check(user is not None and user.get("farm_location") == "Nashik", "user verified", f"verify_user returned {user}")
+
+# Test 5: Analyses round-trip
+success, analysis_id = mongo_db.save_analysis("mockuser", "plant", None, {"plant_info": {"name": "Onion"}})
+history = mongo_db.get_user_analyses("mockuser")
+check(success and len(history) == 1 and history[0]["id"] == analysis_id,
+      "analysis saved and listed", f"history: {history}")
+
+# Test 6: reset_mongo_client forgets the shared client
+mongo_config.reset_mongo_client()
+check(mongo_config.get_mongo_client() is not client, "client recreated after reset", "reset kept the old client")
+mongo_config.reset_mongo_client()
+
+if failures:
+    print(f"FAILURE: {failures} Mongo check(s) failed")
+    sys.exit(1)
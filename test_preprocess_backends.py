@@ -0,0 +1,52 @@
+
+import sys
+import numpy as np
+import cv2
+from PIL import Image
+from image_processing import preprocess_image, ANALYSIS_SIZE
+
+# The OpenCV backend must stay within this mean absolute difference (grey
+# levels, 0-255) of the PIL backend, and within MAX_PIXEL_DIFF on 99% of pixels
+MAX_MEAN_DIFF = 2.0
+MAX_PIXEL_DIFF = 16
+
+def leaf_photo(width, height, seed):
+    """Synthetic leaf photo: soil gradient, noise and a few green leaves with brown spots"""
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 1, width)[np.newaxis, :, np.newaxis]
+    y = np.linspace(0, 1, height)[:, np.newaxis, np.newaxis]
+    image = (np.array([110, 85, 60]) + 40 * x - 30 * y + rng.normal(0, 6, (height, width, 3)))
+    image = np.clip(image, 0, 255).astype(np.uint8)
+    for _ in range(3):
+        center = (int(rng.integers(width // 4, 3 * width // 4)), int(rng.integers(height // 4, 3 * height // 4)))
+        axes = (int(width * rng.uniform(0.1, 0.25)), int(height * rng.uniform(0.08, 0.2)))
+        cv2.ellipse(image, center, axes, float(rng.uniform(0, 180)), 0, 360, (55, 150, 45), -1)
+        cv2.circle(image, center, max(2, axes[1] // 5), (120, 80, 30), -1)
+    return Image.fromarray(image)
+
+# Sizes cover upscaling, plain downscaling, the reduce() path and odd aspect ratios
+SIZES = [(180, 120), (640, 480), (1024, 1024), (3000, 2000), (1200, 4000)]
+
+failures = 0
+for seed, (width, height) in enumerate(SIZES):
+    image = leaf_photo(width, height, seed)
+    pil_result = np.asarray(preprocess_image(image, backend="pil"), dtype=np.float64)
+    opencv_result = np.asarray(preprocess_image(image, backend="opencv"), dtype=np.float64)
+
+    if pil_result.shape != opencv_result.shape or pil_result.shape[:2] != ANALYSIS_SIZE[::-1]:
+        print(f"FAILURE: {width}x{height} shapes differ: pil {pil_result.shape}, opencv {opencv_result.shape}")
+        failures += 1
+        continue
+
+    diff = np.abs(pil_result - opencv_result)
+    mean_diff = diff.mean()
+    p99_diff = np.percentile(diff, 99)
+    print(f"{width}x{height}: mean diff {mean_diff:.2f}, 99th percentile {p99_diff:.0f}")
+    if mean_diff <= MAX_MEAN_DIFF and p99_diff <= MAX_PIXEL_DIFF:
+        print(f"SUCCESS: {width}x{height} backends agree")
+    else:
+        print(f"FAILURE: {width}x{height} exceeds tolerance (mean {MAX_MEAN_DIFF}, p99 {MAX_PIXEL_DIFF})")
+        failures += 1
+
+if failures:
+    sys.exit(1)
@@ -0,0 +1,57 @@
+
+import sys
+
+try:
+    from symptom_matcher import SymptomMatcher
+except ImportError as e:
+    print(f"SKIPPED: symptom matcher test needs scikit-learn and joblib ({e})")
+    sys.exit(0)
+
+# (symptoms, kind, crop) queries covering crop-specific, common and unfiltered matches
+QUERIES = [
+    ("yellow leaves with brown spots and wilting", "disease", "Tomato"),
+    ("purple blotches on onion leaves", "disease", "Onion"),
+    ("small insects sucking sap, leaves curl", "pest", "Rice"),
+    ("white powdery coating on leaves", None, None),
+    ("holes in leaves and chewed stems", "pest", None),
+    ("dark lesions with concentric rings", "disease", "tomato"),
+    ("", "disease", "Wheat"),
+    (None, None, "Potato")
+]
+
+def same(first, second):
+    """Compare two match lists by name, kind, crop and score"""
+    return [(m["name"], m["kind"], m["crop"], round(m["score"], 12)) for m in first] == \
+        [(m["name"], m["kind"], m["crop"], round(m["score"], 12)) for m in second]
+
+matcher = SymptomMatcher(cache_dir=None)
+texts = [query[0] for query in QUERIES]
+kinds = [query[1] for query in QUERIES]
+crops = [query[2] for query in QUERIES]
+
+failures = 0
+for top_k in (5, None):
+    # Per-text kinds and crops
+    batch = matcher.match_batch(texts, kinds, crops, top_k=top_k)
+    single = [matcher.match(text, kind, crop, top_k=top_k) for text, kind, crop in QUERIES]
+    if len(batch) == len(QUERIES) and all(same(b, s) for b, s in zip(batch, single)):
+        print(f"SUCCESS: match_batch matches match() per text (top_k={top_k})")
+    else:
+        print(f"FAILURE: match_batch differs from match() (top_k={top_k})")
+        failures += 1
+
+    # One kind and crop for the whole batch
+    batch = matcher.match_batch(texts, "disease", "Tomato", top_k=top_k)
+    single = [matcher.match(text, "disease", "Tomato", top_k=top_k) for text in texts]
+    if all(same(b, s) for b, s in zip(batch, single)):
+        print(f"SUCCESS: shared kind and crop give the same rankings (top_k={top_k})")
+    else:
+        print(f"FAILURE: shared kind and crop rankings differ (top_k={top_k})")
+        failures += 1
+
+if matcher.match_batch([]) != []:
+    print("FAILURE: an empty batch should return no results")
+    failures += 1
+
+if failures:
+    sys.exit(1)
@@ -9,7 +9,18 @@ import glob
 import json
 import uuid
 from datetime import datetime
-from PIL import Image
+from PIL import Image, ImageOps
+
+# Upload storage: masters are capped in size, thumbnails live in a subdirectory
+UPLOADS_DIR = "uploads"
+THUMBNAILS_SUBDIR = "thumbnails"
+MASTER_MAX_SIZE = (1600, 1600)
+MASTER_JPEG_QUALITY = 85
+THUMBNAIL_SIZES = {
+    "small": (160, 160),   # History list
+    "medium": (480, 480)   # Analysis details
+}
+THUMBNAIL_JPEG_QUALITY = 75
 
 def load_svg(file_path):
     """
@@ -255,28 +266,124 @@ def format_probability(probability):
     except (ValueError, TypeError):
         return 0.0
 
+def _open_for_ingest(source):
+    """
+    Open an upload for ingest, decoding large JPEGs at a reduced scale
+    
+    Args:
+        source: PIL Image, file path or file-like object
+        
+    Returns:
+        PIL Image: Decoded image
+    """
+    if isinstance(source, Image.Image):
+        return source
+    
+    if hasattr(source, "seek"):
+        source.seek(0)
+    image = Image.open(source)
+    if image.format == "JPEG":
+        # Let libjpeg scale down while decoding; the result still covers the master size
+        image.draft("RGB", MASTER_MAX_SIZE)
+    image.load()
+    return image
+
+def ingest_image(source, uploads_dir=UPLOADS_DIR):
+    """
+    Store an uploaded image: a size-capped master plus its thumbnails, in one pass
+    
+    The EXIF orientation is applied first, so masters and thumbnails are stored
+    upright and carry no orientation tag. Thumbnails are reduced from the master
+    (largest first), never from the original upload.
+    
+    Args:
+        source: PIL Image, file path or file-like object (e.g. a Streamlit upload)
+        uploads_dir: Directory for the masters
+        
+    Returns:
+        dict: 'image_path', 'thumbnails' (size name -> path), and the master's 'width' and 'height'
+    """
+    thumbnails_dir = os.path.join(uploads_dir, THUMBNAILS_SUBDIR)
+    os.makedirs(thumbnails_dir, exist_ok=True)
+    
+    image = ImageOps.exif_transpose(_open_for_ingest(source))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    
+    # Cap the master; thumbnail() keeps the aspect ratio and never upscales
+    master = image.copy()
+    master.thumbnail(MASTER_MAX_SIZE, Image.LANCZOS)
+    
+    # Generate a unique filename
+    name = str(uuid.uuid4())
+    image_path = os.path.join(uploads_dir, f"{name}.jpg")
+    master.save(image_path, "JPEG", quality=MASTER_JPEG_QUALITY, optimize=True, progressive=True)
+    
+    thumbnails = {}
+    thumbnail = master
+    for size_name, size in sorted(THUMBNAIL_SIZES.items(), key=lambda item: -item[1][0]):
+        thumbnail = thumbnail.copy()
+        thumbnail.thumbnail(size, Image.LANCZOS)
+        thumbnails[size_name] = os.path.join(thumbnails_dir, f"{name}_{size_name}.jpg")
+        thumbnail.save(thumbnails[size_name], "JPEG", quality=THUMBNAIL_JPEG_QUALITY, optimize=True)
+    
+    return {
+        "image_path": image_path,
+        "thumbnails": thumbnails,
+        "width": master.width,
+        "height": master.height
+    }
+
 def save_uploaded_image(image):
     """
     Save an uploaded image to the uploads directory
     
     Args:
-        image: PIL Image object
+        image: PIL Image, file path or file-like object (e.g. a Streamlit upload)
         
     Returns:
         string: Path to the saved image
     """
-    # Create uploads directory if it doesn't exist
-    uploads_dir = "uploads"
-    os.makedirs(uploads_dir, exist_ok=True)
+    return ingest_image(image)["image_path"]
+
+def get_thumbnail_path(image_path, size="small"):
+    """
+    Get the thumbnail of a stored upload
     
-    # Generate a unique filename
-    filename = f"{uuid.uuid4()}.jpg"
-    filepath = os.path.join(uploads_dir, filename)
+    Uploads saved before thumbnails existed get theirs generated on first request.
+    
+    Args:
+        image_path: Path of the master image
+        size: Thumbnail size name from THUMBNAIL_SIZES
+        
+    Returns:
+        string: Path to the thumbnail, or None if the master is missing
+    """
+    if not image_path:
+        return None
     
-    # Save the image
-    image.save(filepath, "JPEG")
+    uploads_dir, filename = os.path.split(image_path)
+    name = os.path.splitext(filename)[0]
+    thumbnail_path = os.path.join(uploads_dir, THUMBNAILS_SUBDIR, f"{name}_{size}.jpg")
+    if os.path.exists(thumbnail_path):
+        return thumbnail_path
     
-    return filepath
+    if not os.path.exists(image_path):
+        return None
+    
+    try:
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        with Image.open(image_path) as image:
+            image.draft("RGB", THUMBNAIL_SIZES[size])
+            thumbnail = ImageOps.exif_transpose(image)
+            if thumbnail.mode != "RGB":
+                thumbnail = thumbnail.convert("RGB")
+            thumbnail.thumbnail(THUMBNAIL_SIZES[size], Image.LANCZOS)
+            thumbnail.save(thumbnail_path, "JPEG", quality=THUMBNAIL_JPEG_QUALITY, optimize=True)
+        return thumbnail_path
+    except (IOError, OSError) as e:
+        print(f"Error creating thumbnail for {image_path}: {e}")
+        return None
 
 def image_to_base64(image):
     """